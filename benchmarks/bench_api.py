@@ -0,0 +1,353 @@
+"""
+Load test the account and admin endpoints.
+
+Seeds ``--users`` users, each owning ``--accounts`` accounts of every
+account type, ``--transactions`` transactions spread over the accounts
+and an admin. Then, for every scenario in ``--scenarios``, sends
+``--requests`` requests from ``--concurrency`` threads through Django's
+test client, or over HTTP to a live server on the benchmark database
+with ``--server``:
+
+* ``view-account``        GET a page of an account 1 or 2
+* ``update-account``      PUT a deposit or a withdrawal on an account 2
+* ``create-account``      POST a new account 2
+* ``view-user-accounts``  GET the admin report of a user
+
+Reports the throughput, the p50, p95 and p99 latencies and the SQL
+queries per request, as counted by the request metrics. The cache is
+cleared before every scenario. ``--output`` stores the results as JSON
+and ``--compare`` diffs them with the results of an earlier run, exiting
+with status 1 when a scenario regressed by more than ``--threshold``
+percent or runs more queries.
+
+    python -m benchmarks.bench_api --requests 2000 --concurrency 8 --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from benchmarks.common import (
+    BASE_DIR, benchmark_database, percentile, seed_accounts,
+    seed_transactions, setup_django)
+
+SCENARIOS = {
+    # name: the view and method labels of the request metrics
+    'view-account': ('AccountView', 'GET'),
+    'update-account': ('AccountView', 'PUT'),
+    'create-account': ('AccountView', 'POST'),
+    'view-user-accounts': ('AdminView', 'GET'),
+}
+# higher is better for throughput, lower for the others
+METRICS = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+def seed(users: int, accounts: int, transactions: int) -> dict:
+    """Create the users, their accounts and transactions and an admin.
+
+    Returns:
+        dict: The access tokens of the users, their accounts by type and
+            the token of the admin.
+    """
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+    from investment_app.models import InvestmentAccount
+    from investment_app.portfolio import refresh_portfolio
+
+    owners, _ = seed_accounts(users, 0)
+    by_type = {}
+    for account_type in InvestmentAccount.AccountTypes.values:
+        by_type[account_type] = InvestmentAccount.objects.bulk_create([
+            InvestmentAccount(
+                name=f'Account {account_type} {i}',
+                account_type=account_type,
+                owner=owner,
+                balance=1_000_000)
+            for owner in owners for i in range(accounts)])
+    seed_transactions(
+        [account for typed in by_type.values() for account in typed],
+        transactions)
+    for owner in owners:
+        refresh_portfolio(owner.id)
+
+    admin = User.objects.create_superuser(username='bench_admin')
+    tokens = {owner.id: str(AccessToken.for_user(owner)) for owner in owners}
+    return {
+        'tokens': tokens,
+        'accounts': by_type,
+        'owners': [owner.id for owner in owners],
+        'admin_token': str(AccessToken.for_user(admin)),
+    }
+
+
+def build_requests(scenario: str, data: dict, count: int) -> list:
+    """Return ``count`` (method, path, body, token) tuples of a scenario."""
+    from django.urls import reverse
+
+    rng = random.Random(scenario)
+    requests = []
+    for i in range(count):
+        if scenario == 'view-account':
+            account = rng.choice(
+                data['accounts']['ACC1'] + data['accounts']['ACC2'])
+            requests.append((
+                'GET', reverse('view-account', args=[account.id]), None,
+                data['tokens'][account.owner_id]))
+        elif scenario == 'update-account':
+            account = rng.choice(data['accounts']['ACC2'])
+            requests.append((
+                'PUT', reverse('update-account', args=[account.id]),
+                {'balance': '10.00' if i % 2 else '-5.00'},
+                data['tokens'][account.owner_id]))
+        elif scenario == 'create-account':
+            owner_id = rng.choice(data['owners'])
+            requests.append((
+                'POST', reverse('create-account'),
+                {'name': f'Bench {i}', 'account_type': 'ACC2',
+                 'balance': '100.00'},
+                data['tokens'][owner_id]))
+        else:
+            requests.append((
+                'GET',
+                reverse('view-user-accounts',
+                        args=[rng.choice(data['owners'])]),
+                None, data['admin_token']))
+    return requests
+
+
+def client_sender():
+    """Send requests through a test client per thread."""
+    from django.db import connection
+    from django.test import Client
+
+    local = threading.local()
+
+    def send(method, path, body, token) -> int:
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        response = local.client.generic(
+            method, path, json.dumps(body) if body else '',
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}')
+        return response.status_code
+
+    def close() -> None:
+        connection.close()
+
+    return send, close
+
+
+def http_sender(base_url: str):
+    """Send requests over HTTP to a live server."""
+
+    def send(method, path, body, token) -> int:
+        request = Request(
+            base_url + path,
+            data=json.dumps(body).encode() if body else None,
+            method=method,
+            headers={'Authorization': f'Bearer {token}',
+                     'Content-Type': 'application/json'})
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+    return send, lambda: None
+
+
+def run_scenario(
+        scenario: str,
+        requests: list,
+        concurrency: int,
+        send,
+        close) -> dict:
+    """Send the requests of a scenario and summarize them."""
+    from django.core.cache import cache
+    from investment_app import metrics
+    from investment_app.caching import local_cache
+
+    cache.clear()
+    local_cache.clear()
+    count_before, queries_before = metrics.QUERIES.totals(SCENARIOS[scenario])
+    latencies, errors = [], []
+
+    def worker(chunk):
+        try:
+            for request in chunk:
+                began = time.perf_counter()
+                status = send(*request)
+                latencies.append(time.perf_counter() - began)
+                if status >= 400:
+                    errors.append(status)
+        finally:
+            close()
+
+    chunks = [requests[i::concurrency] for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, chunks))
+    elapsed = time.perf_counter() - start
+
+    count, queries = metrics.QUERIES.totals(SCENARIOS[scenario])
+    return {
+        'requests': len(requests),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput': round(len(requests) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(
+            (queries - queries_before) / max(count - count_before, 1), 2),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Print the changes from the baseline and return the regressions."""
+    regressions = []
+    print(f'\ncompared with {baseline["meta"].get("git_commit")} '
+          f'of {baseline["meta"]["created_at"]}:')
+    if baseline['meta']['args'] != current['meta']['args']:
+        print('warning: the runs used different arguments')
+    print(f'{"scenario":<20}{"metric":<21}{"before":>10}{"after":>10}'
+          f'{"change":>9}')
+    for scenario, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(scenario)
+        if before is None:
+            continue
+        if result['errors'] > before['errors']:
+            regressions.append((scenario, 'errors'))
+            print(f'{scenario:<20}{"errors":<21}{before["errors"]:>10}'
+                  f'{result["errors"]:>10}{"":>9}  REGRESSION')
+        for metric in METRICS:
+            old, new = before[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0
+            if metric == 'throughput':
+                regressed = change < -threshold
+            elif metric == 'queries_per_request':
+                # deterministic, any additional query is a regression
+                regressed = new > old + 0.5
+            else:
+                regressed = change > threshold
+            if regressed:
+                regressions.append((scenario, metric))
+            print(f'{scenario:<20}{metric:<21}{old:>10g}{new:>10g}'
+                  f'{change:>+8.1f}%{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument(
+        '--accounts', type=int, default=2,
+        help='accounts per user of every account type')
+    parser.add_argument('--transactions', type=int, default=50_000)
+    parser.add_argument(
+        '--scenarios', nargs='+', choices=list(SCENARIOS),
+        default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument(
+        '--server', action='store_true',
+        help='send the requests over HTTP to a live server')
+    parser.add_argument('--output', help='store the results in this file')
+    parser.add_argument('--compare', help='the results of an earlier run')
+    parser.add_argument(
+        '--threshold', type=float, default=10,
+        help='percent change of a metric reported as a regression')
+    args = parser.parse_args()
+
+    setup_django()
+    # the expected 4xx of a scenario are counted, not logged
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    import django
+    from django.db import connection
+    from django.test import override_settings
+    from django.test.testcases import LiveServerThread, _StaticFilesHandler
+
+    # the threads and the server need a database they can share
+    with benchmark_database(on_disk=True):
+        data = seed(args.users, args.accounts, args.transactions)
+        server = None
+        if args.server:
+            allowed_hosts = override_settings(ALLOWED_HOSTS=['localhost'])
+            allowed_hosts.enable()
+            server = LiveServerThread('localhost', _StaticFilesHandler)
+            server.daemon = True
+            server.start()
+            server.is_ready.wait()
+            if server.error:
+                raise server.error
+            send, close = http_sender(f'http://localhost:{server.port}')
+        else:
+            send, close = client_sender()
+
+        results = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'mode': 'server' if args.server else 'client',
+                'args': {
+                    key: value for key, value in vars(args).items()
+                    if key not in ('output', 'compare')},
+            },
+            'scenarios': {},
+        }
+        try:
+            for scenario in args.scenarios:
+                requests = build_requests(scenario, data, args.requests)
+                results['scenarios'][scenario] = run_scenario(
+                    scenario, requests, args.concurrency, send, close)
+        finally:
+            if server is not None:
+                server.terminate()
+                allowed_hosts.disable()
+
+    print(f'{"scenario":<20}{"req/s":>8}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"p99 ms":>9}{"queries":>9}{"errors":>8}')
+    for scenario, result in results['scenarios'].items():
+        print(f'{scenario:<20}{result["throughput"]:>8.1f}'
+              f'{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+              f'{result["p99_ms"]:>9.2f}'
+              f'{result["queries_per_request"]:>9.2f}'
+              f'{result["errors"]:>8}')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline), results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark the synchronous views under WSGI against the async views under ASGI
+with a slow cache.
+
+Every Redis command is delayed by ``--cache-latency`` milliseconds, a
+blocking sleep for the synchronous client and an ``asyncio`` sleep for the
+async one, and the in-memory cache tier is disabled so that every request
+waits on Redis. The WSGI side serves ``--requests`` requests from a pool of
+``--threads`` threads, like a threaded WSGI worker. The ASGI side serves
+them from a single event loop with up to ``--concurrency`` requests in
+flight, like a single ASGI worker. Both run in-process, through Django's
+WSGI and ASGI handlers, and report requests per second and latencies.
+
+    python -m benchmarks.bench_asgi --requests 2000 --concurrency 500 --cache-latency 50
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from benchmarks.common import (
+    benchmark_database, percentile, seed_accounts, seed_transactions,
+    setup_django, timer)
+
+
+@contextmanager
+def slow_cache(latency: float):
+    """Delay every command of the Redis clients by ``latency`` seconds."""
+    from unittest.mock import patch
+    import redis
+    import redis.asyncio
+
+    execute = redis.Redis.execute_command
+    aexecute = redis.asyncio.Redis.execute_command
+
+    def slow_execute(self, *args, **options):
+        time.sleep(latency)
+        return execute(self, *args, **options)
+
+    async def slow_aexecute(self, *args, **options):
+        await asyncio.sleep(latency)
+        return await aexecute(self, *args, **options)
+
+    with patch.object(redis.Redis, 'execute_command', slow_execute), \
+            patch.object(redis.asyncio.Redis, 'execute_command',
+                         slow_aexecute):
+        yield
+
+
+def run_wsgi(url: str, token: str, requests: int, threads: int) -> dict:
+    """Serve the requests with the synchronous view from a thread pool."""
+    from django.db import connection
+    from django.test import Client
+
+    latencies = []
+
+    def read(_):
+        client = Client()
+        began = time.perf_counter()
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+        latencies.append(time.perf_counter() - began)
+        assert response.status_code == 200, response.content[:200]
+        connection.close()
+
+    results = {}
+    with timer(results, 'elapsed'), ThreadPoolExecutor(threads) as pool:
+        list(pool.map(read, range(requests)))
+    return {'latencies': latencies, **results}
+
+
+def run_asgi(url: str, token: str, requests: int, concurrency: int) -> dict:
+    """Serve the requests with the async view from one event loop."""
+    from django.test import AsyncClient
+    from investment_app.caching import async_redis_client
+
+    latencies = []
+
+    async def read(client, slots):
+        async with slots:
+            began = time.perf_counter()
+            response = await client.get(
+                url, headers={'Authorization': f'Bearer {token}'})
+            latencies.append(time.perf_counter() - began)
+        assert response.status_code == 200, response.content[:200]
+
+    async def main():
+        client, slots = AsyncClient(), asyncio.Semaphore(concurrency)
+        try:
+            await asyncio.gather(
+                *(read(client, slots) for _ in range(requests)))
+        finally:
+            await async_redis_client().aclose()
+
+    results = {}
+    with timer(results, 'elapsed'):
+        asyncio.run(main())
+    return {'latencies': latencies, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument(
+        '--cache-latency', type=float, default=50,
+        help='milliseconds added to every Redis command')
+    parser.add_argument(
+        '--endpoint', choices=['account', 'report'], default='account')
+    parser.add_argument('--transactions', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from unittest.mock import patch
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import AccessToken
+    from investment_app.local_cache import LocalCache
+
+    # the threads need a database they can share
+    with benchmark_database(on_disk=True), \
+            patch('investment_app.caching.local_cache', LocalCache(0, 0)):
+        owners, accounts = seed_accounts(1, 5)
+        seed_transactions(accounts, args.transactions)
+        if args.endpoint == 'account':
+            reader = owners[0]
+            urls = {'wsgi': reverse('view-account', args=[accounts[0].id]),
+                    'asgi': reverse('async-view-account',
+                                    args=[accounts[0].id])}
+        else:
+            reader = User.objects.create_superuser(username='bench_admin')
+            urls = {'wsgi': reverse('view-user-accounts', args=[owners[0].id]),
+                    'asgi': reverse('async-view-user-accounts',
+                                    args=[owners[0].id])}
+        token = str(AccessToken.for_user(reader))
+
+        # both views read the same cache entry, warm it first
+        run_wsgi(urls['wsgi'], token, 1, 1)
+        runs = {}
+        with slow_cache(args.cache_latency / 1000):
+            runs['wsgi'] = run_wsgi(
+                urls['wsgi'], token, args.requests, args.threads)
+            runs['asgi'] = run_asgi(
+                urls['asgi'], token, args.requests, args.concurrency)
+
+        print(f'endpoint:       {args.endpoint}')
+        print(f'requests:       {args.requests}')
+        print(f'cache latency:  {args.cache_latency:g}ms per command')
+        print(f'wsgi threads:   {args.threads}')
+        print(f'asgi in flight: {args.concurrency}')
+        for name, run in runs.items():
+            print(f'{name}:')
+            print(f'  requests/s: {args.requests / run["elapsed"]:.0f}')
+            print(f'  p50:        {percentile(run["latencies"], 50) * 1000:.1f}ms')
+            print(f'  p99:        {percentile(run["latencies"], 99) * 1000:.1f}ms')
+            print(f'  elapsed:    {run["elapsed"]:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
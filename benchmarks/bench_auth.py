@@ -0,0 +1,109 @@
+"""
+Benchmark the authentication of a request.
+
+Authenticates ``--requests`` requests carrying the access token of a user
+with each method and reports the median and p95 time per request and the
+SQL queries per request:
+
+* ``token only``     verifying the token, the floor of every method
+* ``jwt``            ``JWTAuthentication``, loading the user every time
+* ``cached local``   ``CachedJWTAuthentication``, the user in memory
+* ``cached redis``   ``CachedJWTAuthentication``, the user in Redis
+* ``claims``         ``CachedJWTAuthentication`` trusting the claims
+
+Every query is delayed by ``--db-latency`` milliseconds, the network
+round trip to a database server the in-process SQLite does not have.
+
+    python -m benchmarks.bench_auth --requests 5000 --db-latency 0.5
+"""
+import argparse
+import statistics
+import time
+from unittest.mock import patch
+
+from benchmarks.common import benchmark_database, percentile, setup_django
+
+
+def measure(authenticate, requests: int) -> tuple:
+    """Return the latencies of ``requests`` calls and the queries run."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(requests):
+            start = time.perf_counter()
+            authenticate()
+            latencies.append(time.perf_counter() - start)
+    return latencies, len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument(
+        '--db-latency', type=float, default=0.5,
+        help='milliseconds added to every query')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from investment_app.authentication import (
+        CachedJWTAuthentication, ClaimsRefreshToken)
+    from investment_app.caching import local_cache
+
+    def slow_query(execute, sql, params, many, context):
+        time.sleep(args.db_latency / 1000)
+        return execute(sql, params, many, context)
+
+    with benchmark_database(on_disk=False), \
+            connection.execute_wrapper(slow_query):
+        cache.clear()
+        local_cache.clear()
+        user = User.objects.create_user(username='bench_user')
+        token = str(ClaimsRefreshToken.for_user(user).access_token)
+        request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        with patch('investment_app.authentication.TRUST_TOKEN_CLAIMS', True):
+            claims_token = str(ClaimsRefreshToken.for_user(user).access_token)
+        claims_request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {claims_token}')
+
+        jwt = JWTAuthentication()
+        cached = CachedJWTAuthentication()
+
+        def redis_hit():
+            local_cache.clear()
+            cached.authenticate(request)
+
+        methods = {
+            'token only': lambda: jwt.get_validated_token(
+                jwt.get_raw_token(jwt.get_header(request))),
+            'jwt': lambda: jwt.authenticate(request),
+            'cached local': lambda: cached.authenticate(request),
+            'cached redis': redis_hit,
+        }
+        # fill the cache before measuring the cached methods
+        cached.authenticate(request)
+        results = {
+            name: measure(method, args.requests)
+            for name, method in methods.items()}
+        with patch('investment_app.authentication.TRUST_TOKEN_CLAIMS', True):
+            results['claims'] = measure(
+                lambda: cached.authenticate(claims_request), args.requests)
+
+    print(f'requests: {args.requests}, db latency: {args.db_latency:g}ms')
+    print(f'{"method":<15}{"p50 us":>10}{"p95 us":>10}{"queries":>10}')
+    for name, (latencies, queries) in results.items():
+        print(f'{name:<15}{statistics.median(latencies) * 1e6:>10.1f}'
+              f'{percentile(latencies, 95) * 1e6:>10.1f}'
+              f'{queries / args.requests:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark the bulk settlement endpoint.
+
+Posts a CSV settlement file of random deposits and withdrawals spread over
+many accounts to ``api/bulk-transactions/`` and reports movements/second.
+
+    python -m benchmarks.bench_bulk_ingest --movements 100000 --accounts 500
+"""
+import argparse
+import random
+
+from benchmarks.common import (
+    benchmark_database, seed_accounts, setup_django, timer)
+
+
+def build_settlement_file(accounts, movements: int) -> str:
+    """Build a CSV settlement file, deposits outweigh withdrawals
+    so that no account is overdrawn."""
+    rows = ['account_id,amount']
+    for _ in range(movements):
+        amount = random.choice(['125.50', '40.00', '-15.25', '9.99'])
+        rows.append(f'{random.choice(accounts).id},{amount}')
+    return '\n'.join(rows) + '\n'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movements', type=int, default=100_000)
+    parser.add_argument('--accounts', type=int, default=500)
+    parser.add_argument('--in-memory', action='store_true')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from investment_app.models import Transaction
+
+    with benchmark_database(on_disk=not args.in_memory):
+        owners, accounts = seed_accounts(1, args.accounts)
+        body = build_settlement_file(accounts, args.movements)
+
+        client = APIClient()
+        client.force_authenticate(user=owners[0])
+        results = {}
+        with timer(results, 'bulk'):
+            response = client.generic(
+                'POST', reverse('bulk-transactions'), body,
+                content_type='text/csv')
+
+        assert response.status_code == 200, response.content[:200]
+        assert Transaction.objects.count() == args.movements
+        elapsed = results['bulk']
+        print(f'movements:       {args.movements}')
+        print(f'accounts:        {args.accounts}')
+        print(f'applied:         {response.data["applied"]}')
+        print(f'elapsed:         {elapsed:.2f}s')
+        print(f'movements/sec:   {args.movements / elapsed:,.0f}')
+
+
+if __name__ == '__main__':
+    main()
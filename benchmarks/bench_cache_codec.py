@@ -0,0 +1,69 @@
+"""
+Benchmark the cache codec against pickle.
+
+Builds the cached payloads of a user owning one account with
+``--transactions`` transactions: the admin report and the admin report
+grouped by day as built by ``AdminView``, and the largest account page
+built by ``AccountView``. Reports the encoded size and the median encode
+and decode times of the Redis pickle serializer and of ``codec``.
+
+    python -m benchmarks.bench_cache_codec --transactions 10000
+"""
+import argparse
+import pickle
+import statistics
+import time
+
+from benchmarks.common import (
+    benchmark_database, seed_accounts, seed_transactions, setup_django)
+
+
+def median_ms(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from datetime import date
+    from django.core.cache.backends.redis import RedisSerializer
+    from investment_app import codec
+    from investment_app.views import AccountView, AdminView
+
+    with benchmark_database(on_disk=False):
+        owners, accounts = seed_accounts(1, 1)
+        seed_transactions(accounts, args.transactions)
+        payloads = {
+            'report': AdminView().get_user_transactions(
+                owners[0], date.today()),
+            'report by day': AdminView().get_user_transactions(
+                owners[0], date.today(), group_by='day'),
+            'account page': AccountView().get_account_page(accounts[0], 500),
+        }
+
+    serializer = RedisSerializer()
+    print(f'transactions: {args.transactions}')
+    print(f'{"payload":<15}{"codec":<8}{"bytes":>10}'
+          f'{"encode ms":>12}{"decode ms":>12}')
+    for name, payload in payloads.items():
+        for label, dumps, loads in (
+                ('pickle', serializer.dumps, serializer.loads),
+                ('codec', codec.dumps, codec.loads)):
+            data = dumps(payload)
+            assert loads(data) == pickle.loads(pickle.dumps(payload))
+            print(f'{name:<15}{label:<8}{len(data):>10,}'
+                  f'{median_ms(lambda: dumps(payload), args.repeat):>12.2f}'
+                  f'{median_ms(lambda: loads(data), args.repeat):>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
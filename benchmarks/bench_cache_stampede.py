@@ -0,0 +1,134 @@
+"""
+Benchmark a burst of concurrent readers on an expired cache entry.
+
+Invalidates the cached admin report of a user (or the first page of one of
+their accounts with ``--endpoint account``), then lets ``--readers`` threads
+request it at the same moment, with and without stampede protection, and
+reports how many times the data was built, the queries that hit the
+transactions table and the latency of the burst.
+
+    python -m benchmarks.bench_cache_stampede --readers 50 --transactions 50000
+"""
+import argparse
+import threading
+
+from benchmarks.common import (
+    benchmark_database, percentile, seed_accounts, seed_transactions,
+    setup_django, timer)
+
+
+def naive_get_or_set(key, compute, timeout):
+    """The plain read-through caching used before stampede protection."""
+    from django.core.cache import cache
+
+    if (value := cache.get(key)) is None:
+        value = compute()
+        cache.set(key, value, timeout=timeout)
+    return value
+
+
+def burst(endpoint: str, user, account, readers: int) -> dict:
+    """Expire the cached data and read it from ``readers`` threads.
+
+    Returns:
+        dict: The number of builds, of transaction queries
+            and the latencies.
+    """
+    import time
+    from unittest.mock import patch
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from investment_app.caching import bump_versions
+    from investment_app.models import Transaction
+    from investment_app.views import AccountView, AdminView
+
+    if endpoint == 'account':
+        url = reverse('view-account', args=[account.id])
+        reader, view, build = user, AccountView, 'get_account_page'
+    else:
+        url = reverse('view-user-accounts', args=[user.id])
+        reader, view, build = (
+            User.objects.get(username='bench_admin'), AdminView,
+            'get_user_transactions')
+
+    table = Transaction._meta.db_table
+    queries, latencies, builds = [], [], []
+    original = getattr(view, build)
+    start = threading.Barrier(readers)
+
+    def count_builds(*args):
+        builds.append(1)
+        return original(*args)
+
+    def count_queries(execute, sql, params, many, context):
+        if table in sql:
+            queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def read():
+        client = APIClient()
+        client.force_authenticate(user=reader)
+        try:
+            with connection.execute_wrapper(count_queries):
+                start.wait()
+                began = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - began)
+            assert response.status_code == 200, response.content[:200]
+        finally:
+            connection.close()
+
+    bump_versions([account.id], [user.id], defer=False)
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    results = {}
+    with patch.object(view, build, count_builds), \
+            timer(results, 'elapsed'):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return {'queries': len(queries), 'builds': len(builds),
+            'latencies': latencies, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--transactions', type=int, default=50_000)
+    parser.add_argument(
+        '--endpoint', choices=['report', 'account'], default='report')
+    args = parser.parse_args()
+
+    setup_django()
+    from unittest.mock import patch
+    from django.contrib.auth.models import User
+
+    # the threads need a database they can share
+    with benchmark_database(on_disk=True):
+        owners, accounts = seed_accounts(1, 5)
+        seed_transactions(accounts, args.transactions)
+        User.objects.create_superuser(username='bench_admin')
+
+        runs = {}
+        with patch('investment_app.views.get_or_set', naive_get_or_set):
+            runs['unprotected'] = burst(
+                args.endpoint, owners[0], accounts[0], args.readers)
+        runs['protected'] = burst(
+            args.endpoint, owners[0], accounts[0], args.readers)
+
+        print(f'endpoint:       {args.endpoint}')
+        print(f'readers:        {args.readers}')
+        print(f'transactions:   {args.transactions}')
+        for name, run in runs.items():
+            print(f'{name}:')
+            print(f'  builds:              {run["builds"]}')
+            print(f'  transaction queries: {run["queries"]}')
+            print(f'  p50:     {percentile(run["latencies"], 50) * 1000:.1f}ms')
+            print(f'  p95:     {percentile(run["latencies"], 95) * 1000:.1f}ms')
+            print(f'  elapsed: {run["elapsed"]:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
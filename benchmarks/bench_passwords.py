@@ -0,0 +1,134 @@
+"""
+Benchmark password hashing and logins.
+
+First verifies a password ``--repeat`` times with each hasher, on one
+thread, and reports the logins per second a core can verify. The hashers
+whose library is not installed are skipped.
+
+Then logs ``--users`` users in from ``--threads`` threads through the
+login endpoint, before with Django's default PBKDF2 hasher hashing on the
+request threads, and after with the ``PASSWORD_HASHERS`` of the settings
+and their bound on concurrent hashes. Reports the logins per second, per
+core, the p95 latency and the logins refused with a 503 by the bound.
+
+    python -m benchmarks.bench_passwords --users 200 --threads 16
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import benchmark_database, percentile, setup_django
+
+HASHERS = {
+    'pbkdf2 (Django)': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2': 'investment_app.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'investment_app.hashers.ScryptPasswordHasher',
+    'argon2': 'investment_app.hashers.Argon2PasswordHasher',
+    'bcrypt': 'investment_app.hashers.BCryptSHA256PasswordHasher',
+}
+
+
+def verify_rate(path: str, repeat: int) -> float:
+    """Return the verifications per second of a hasher on one thread."""
+    from django.utils.module_loading import import_string
+
+    hasher = import_string(path)()
+    encoded = hasher.encode('password', hasher.salt())
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assert hasher.verify('password', encoded)
+        samples.append(time.perf_counter() - start)
+    return 1 / statistics.median(samples)
+
+
+def login_storm(users: list, threads: int) -> dict:
+    """Log every user in once from ``threads`` threads."""
+    from django.db import connection
+    from django.test import Client
+    from django.urls import reverse
+
+    url = reverse('login')
+    local = threading.local()
+    latencies, statuses = [], []
+
+    def login(username):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        start = time.perf_counter()
+        response = local.client.post(
+            url, json.dumps({'username': username, 'password': 'password'}),
+            content_type='application/json')
+        latencies.append(time.perf_counter() - start)
+        statuses.append(response.status_code)
+        connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(login, users))
+    elapsed = time.perf_counter() - start
+    return {
+        'logins_per_s': (len(users) - statuses.count(503)) / elapsed,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'refused': statuses.count(503),
+        'errors': sum(code not in (200, 503) for code in statuses),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+
+    cores = os.cpu_count() or 1
+    print(f'cores: {cores}, concurrent hashes: '
+          f'{settings.PASSWORD_HASHING_WORKERS}\n')
+    print(f'{"hasher":<17}{"logins/s per core":>18}')
+    for name, path in HASHERS.items():
+        try:
+            rate = f'{verify_rate(path, args.repeat):>18.1f}'
+        except ValueError:
+            rate = f'{"not installed":>18}'
+        print(f'{name:<17}{rate}')
+
+    policies = {
+        'before': [HASHERS['pbkdf2 (Django)']],
+        'after': settings.PASSWORD_HASHERS,
+    }
+    results = {}
+    # the threads and the requests need a database they can share
+    with benchmark_database(on_disk=True):
+        for policy, hashers in policies.items():
+            with override_settings(PASSWORD_HASHERS=hashers):
+                password = make_password('password')
+                users = User.objects.bulk_create([
+                    User(username=f'{policy}_{i}', password=password)
+                    for i in range(args.users)])
+                results[policy] = login_storm(
+                    [user.username for user in users], args.threads)
+
+    print(f'\n{args.users} logins from {args.threads} threads')
+    print(f'{"policy":<8}{"logins/s":>10}{"per core":>10}{"p95 ms":>10}'
+          f'{"refused":>9}{"errors":>8}')
+    for policy, result in results.items():
+        print(f'{policy:<8}{result["logins_per_s"]:>10.1f}'
+              f'{result["logins_per_s"] / cores:>10.1f}'
+              f'{result["p95_ms"]:>10.1f}{result["refused"]:>9}'
+              f'{result["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
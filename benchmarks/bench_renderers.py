@@ -0,0 +1,68 @@
+"""
+Benchmark ``ORJSONRenderer`` against DRF's ``JSONRenderer``.
+
+For every size in ``--sizes`` a user owning one account with that many
+transactions is created, then the admin report built by ``AdminView`` and
+an account page of all the transactions built by ``AccountView`` are
+rendered by both renderers. Reports the median render time, the cost per
+transaction and checks that both outputs decode to the same values.
+
+    python -m benchmarks.bench_renderers --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.common import (
+    benchmark_database, seed_accounts, seed_transactions, setup_django)
+
+
+def median_ms(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from datetime import date
+    from rest_framework.renderers import JSONRenderer
+    from investment_app.renderers import ORJSONRenderer
+    from investment_app.views import AccountView, AdminView
+
+    payloads = []
+    with benchmark_database(on_disk=False):
+        owners, accounts = seed_accounts(len(args.sizes), 1)
+        for size, owner, account in zip(args.sizes, owners, accounts):
+            seed_transactions([account], size)
+            payloads.append((size, 'report', AdminView().get_user_transactions(
+                owner, date.today())))
+            payloads.append((size, 'account page', AccountView(
+                ).get_account_page(account, size)))
+
+    print(f'{"transactions":>12}  {"payload":<14}{"renderer":<10}'
+          f'{"bytes":>11}{"ms":>10}{"us/row":>9}')
+    for size, name, payload in payloads:
+        outputs = {}
+        for label, renderer in (
+                ('json', JSONRenderer()), ('orjson', ORJSONRenderer())):
+            outputs[label] = renderer.render(payload)
+            elapsed = median_ms(lambda: renderer.render(payload), args.repeat)
+            print(f'{size:>12}  {name:<14}{label:<10}'
+                  f'{len(outputs[label]):>11}{elapsed:>10.2f}'
+                  f'{elapsed * 1000 / size:>9.2f}')
+        assert json.loads(outputs['json']) == json.loads(outputs['orjson'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark the serialization of the transactions of an account page.
+
+Serializes ``--transactions`` transactions of one account with
+``TransactionSeializer`` from model instances, as ``get_transactions`` did,
+and with ``format_transactions`` from ``values_list`` tuples, as it does
+now. Reports the median time per row end to end, query included, and of
+the Python formatting alone, on rows already fetched.
+
+    python -m benchmarks.bench_transaction_format --transactions 10000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import (
+    benchmark_database, seed_accounts, seed_transactions, setup_django)
+
+
+def median_us(func, repeat: int, rows: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1_000_000 / rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from investment_app.serializer import TransactionSeializer
+    from investment_app.utils import (
+        TRANSACTION_COLUMNS, format_transactions, transactions_page)
+
+    with benchmark_database(on_disk=False):
+        owners, accounts = seed_accounts(1, 1)
+        seed_transactions(accounts, args.transactions)
+        page = transactions_page(accounts[0])
+        instances, rows = list(page), list(
+            page.values_list(*TRANSACTION_COLUMNS))
+        assert format_transactions(rows) == TransactionSeializer(
+            instances, many=True).data
+
+        results = {
+            'serializer': (
+                lambda: TransactionSeializer(page.all(), many=True).data,
+                lambda: TransactionSeializer(instances, many=True).data),
+            'values_list': (
+                lambda: format_transactions(
+                    page.values_list(*TRANSACTION_COLUMNS)),
+                lambda: format_transactions(rows)),
+        }
+        print(f'transactions: {args.transactions}')
+        print(f'{"path":<14}{"total us/row":>14}{"format us/row":>15}')
+        for name, (total, formatting) in results.items():
+            print(f'{name:<14}'
+                  f'{median_us(total, args.repeat, args.transactions):>14.2f}'
+                  f'{median_us(formatting, args.repeat, args.transactions):>15.2f}')
+
+
+if __name__ == '__main__':
+    main()
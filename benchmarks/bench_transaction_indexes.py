@@ -0,0 +1,146 @@
+"""
+Benchmark the Transaction indexes on the two read endpoints.
+
+Seeds transactions into a throwaway database, then measures the account
+view (first page of an account's history), the admin report (a user's
+transactions over the last 90 days) and inserts, with the indexes
+declared on Transaction and with the baseline single column index on the
+account foreign key they replace. The query plans are printed so the
+gain is measured rather than assumed.
+
+    python -m benchmarks.bench_transaction_indexes --transactions 1000000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import (
+    benchmark_database, percentile, seed_accounts, seed_transactions,
+    setup_django)
+
+
+def explain(connection, sql: str) -> str:
+    """Return the query plan of an executed statement."""
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return '\n'.join(
+            '    ' + ' '.join(str(column) for column in row)
+            for row in cursor.fetchall())
+
+
+def measure(client, connection, endpoints: dict, repeat: int) -> dict:
+    """Time the endpoints and capture the plan of their transactions query.
+
+    Args:
+        endpoints (dict): name: (user to authenticate, request callable).
+    """
+    from django.test.utils import CaptureQueriesContext
+
+    results = {}
+    for name, (user, request) in endpoints.items():
+        client.force_authenticate(user)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = request()
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.content[:200]
+
+        with CaptureQueriesContext(connection) as context:
+            request()
+        transactions_sql = [
+            query['sql'] for query in context.captured_queries
+            if 'investment_app_transaction' in query['sql']][-1]
+        results[name] = {
+            'p50': percentile(samples, 50),
+            'p95': percentile(samples, 95),
+            'plan': explain(connection, transactions_sql),
+        }
+    return results
+
+
+def measure_inserts(accounts, count: int) -> float:
+    """Return the inserts per second of ``count`` transactions."""
+    start = time.perf_counter()
+    seed_transactions(accounts, count)
+    return count / (time.perf_counter() - start)
+
+
+def use_indexes(connection, tuned: bool) -> None:
+    """Switch between the declared indexes and the baseline FK index."""
+    from django.db import models
+    from investment_app.models import Transaction
+
+    baseline = [models.Index(fields=['account'], name='bench_account_fk')]
+    add, remove = (Transaction._meta.indexes, baseline) if tuned else (
+        baseline, Transaction._meta.indexes)
+    with connection.schema_editor() as editor:
+        for index in remove:
+            editor.remove_index(Transaction, index)
+        for index in add:
+            editor.add_index(Transaction, index)
+
+
+def report(title: str, results: dict) -> None:
+    print(f'\n== {title}')
+    print(f'inserts: {results.pop("inserts"):,.0f}/s')
+    for name, result in results.items():
+        print(f'{name}: p50 {result["p50"]:.2f}ms p95 {result["p95"]:.2f}ms')
+        print(result['plan'])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--accounts-per-user', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--inserts', type=int, default=50_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    dummy_cache = {'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    with benchmark_database() as connection, override_settings(
+            CACHES=dummy_cache):
+        owners, accounts = seed_accounts(args.users, args.accounts_per_user)
+        start = time.perf_counter()
+        seed_transactions(accounts, args.transactions)
+        print(f'seeded {args.transactions} transactions '
+              f'in {time.perf_counter() - start:.1f}s')
+
+        client = APIClient()
+        admin = User.objects.create_superuser(
+            username='bench_admin', password='password')
+        owner = owners[0]
+        owned = [account for account in accounts if account.owner_id == owner.id]
+        end_date = (date.today() - timedelta(days=90)).isoformat()
+        endpoints = {
+            'view-account': (owner, lambda: client.get(reverse(
+                'view-account', args=[random.choice(owned).id]))),
+            'view-user-accounts': (admin, lambda: client.get(
+                reverse('view-user-accounts', args=[random.choice(owners).id]),
+                {'end_date': end_date})),
+        }
+
+        tuned = measure(client, connection, endpoints, args.repeat)
+        tuned['inserts'] = measure_inserts(accounts, args.inserts)
+        use_indexes(connection, tuned=False)
+        baseline = measure(client, connection, endpoints, args.repeat)
+        baseline['inserts'] = measure_inserts(accounts, args.inserts)
+        use_indexes(connection, tuned=True)
+
+        report('baseline: index on account_id only', baseline)
+        report('tuned: Transaction indexes', tuned)
+
+
+if __name__ == '__main__':
+    main()
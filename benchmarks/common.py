@@ -0,0 +1,131 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The scripts run against a throwaway test database created with Django's
+test machinery and under a cache key prefix of their own, the development
+database and cache are never touched. Run them from
+the repository root, e.g. ``python -m benchmarks.bench_bulk_ingest``.
+"""
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django() -> None:
+    """Configure Django for a standalone benchmark script."""
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE', 'investment_account_api.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(on_disk: bool = True):
+    """Create a migrated test database, and a cache key prefix, for the
+    duration of the block.
+
+    Args:
+        on_disk (bool): Use a temporary file instead of memory
+            when the database is SQLite, which is closer to production.
+    """
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import (
+        override_settings, setup_test_environment, teardown_test_environment)
+    from investment_app.caching import isolated_caches
+
+    setup_test_environment()
+    cache_settings = override_settings(CACHES=isolated_caches('bench'))
+    cache_settings.enable()
+    if connection.vendor == 'sqlite' and on_disk:
+        directory = tempfile.mkdtemp(prefix='investment_bench_')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'bench.sqlite3')
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        cache.clear()
+        cache_settings.disable()
+        teardown_test_environment()
+
+
+@contextmanager
+def timer(results: dict, name: str):
+    """Store the wall time of the block in ``results[name]`` in seconds."""
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
+
+
+def seed_accounts(users: int, accounts_per_user: int, account_type='ACC2'):
+    """Create users each owning ``accounts_per_user`` accounts.
+
+    Returns:
+        tuple: The list of users and the list of accounts.
+    """
+    from django.contrib.auth.models import User
+    from investment_app.models import InvestmentAccount
+
+    owners = User.objects.bulk_create(
+        [User(username=f'bench_user_{i}') for i in range(users)])
+    accounts = InvestmentAccount.objects.bulk_create([
+        InvestmentAccount(
+            name=f'Account {i}', account_type=account_type, owner=owner)
+        for owner in owners for i in range(accounts_per_user)
+    ])
+    return owners, accounts
+
+
+def seed_transactions(accounts, count: int, days: int = 730,
+                      batch_size: int = 10_000) -> None:
+    """Insert ``count`` transactions spread over the accounts and
+    over the last ``days`` days, without building model instances."""
+    import random
+    from datetime import timedelta
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from investment_app.models import Transaction
+
+    opts = Transaction._meta
+    columns = ['transaction_by_id', 'transaction_type', 'created_at',
+               'amount', 'account_id']
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(opts.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(['%s'] * len(columns)))
+
+    now = timezone.now()
+    seconds = days * 24 * 60 * 60
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, count, batch_size):
+            rows = []
+            for _ in range(min(batch_size, count - start)):
+                account = random.choice(accounts)
+                amount = random.choice(['125.50', '40.00', '-15.25'])
+                rows.append((
+                    account.owner_id,
+                    'Withdrawal' if amount.startswith('-') else 'Deposit',
+                    connection.ops.adapt_datetimefield_value(
+                        now - timedelta(seconds=random.randrange(seconds))),
+                    amount,
+                    account.id))
+            cursor.executemany(sql, rows)
+
+
+def percentile(samples, percent: float) -> float:
+    """Return the ``percent`` percentile of the samples."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
+from .database import databases_from_env
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that it times the other middleware
+    'investment_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,27 +82,13 @@ WSGI_APPLICATION = 'investment_account_api.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
-
-# Database
-# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
-if os.environ.get('GITHUB_WORKFLOW'):
-    DATABASES = {
-        'default': {
-           'ENGINE': 'django.db.backends.postgresql',
-           'NAME': 'github_actions',
-           'USER': 'postgres',
-           'PASSWORD': 'postgres',
-           'HOST': '127.0.0.1',
-           'PORT': '5432',
-        }
-    }
-else:
-   DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# DATABASE_URL, DATABASE_REPLICA_URL and the DB_* connection settings,
+# see investment_account_api/database.py
+DATABASES = databases_from_env(BASE_DIR)
+DATABASE_ROUTERS = ['investment_app.routers.ReplicaRouter']
+# seconds a replica may lag, reads of an account or a user changed more
+# recently go to the primary
+DATABASE_REPLICA_LAG = int(os.getenv("DATABASE_REPLICA_LAG", 5))
 
 
 
@@ -120,6 +111,51 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# new passwords are hashed with PASSWORD_HASHER, the other hashers verify
+# existing hashes, which are rehashed at the next login. argon2 needs
+# argon2-cffi and bcrypt needs bcrypt.
+HASHERS = {
+    'scrypt': 'investment_app.hashers.ScryptPasswordHasher',
+    'argon2': 'investment_app.hashers.Argon2PasswordHasher',
+    'bcrypt': 'investment_app.hashers.BCryptSHA256PasswordHasher',
+    'pbkdf2': 'investment_app.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "scrypt")
+if PASSWORD_HASHER not in HASHERS:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER must be one of {', '.join(HASHERS)}.")
+# the library each hasher needs beyond the standard library
+HASHER_LIBRARIES = {
+    'argon2': ('argon2', 'argon2-cffi'),
+    'bcrypt': ('bcrypt', 'bcrypt'),
+}
+if PASSWORD_HASHER in HASHER_LIBRARIES:
+    module, package = HASHER_LIBRARIES[PASSWORD_HASHER]
+    if find_spec(module) is None:
+        raise ImproperlyConfigured(
+            f"PASSWORD_HASHER={PASSWORD_HASHER} needs pip install {package}.")
+PASSWORD_HASHERS = [HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in HASHERS.items() if name != PASSWORD_HASHER]
+
+# the cost of each hasher, changing it rehashes the passwords at login
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv("PASSWORD_SCRYPT_WORK_FACTOR", 2 ** 14))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", 19 * 1024))
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", 1))
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", 12))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", 600_000))
+
+# the passwords hashed at once by each process and how long a login waits
+# for its turn, the cores are shared by the WEB_CONCURRENCY processes
+PASSWORD_HASHING_WORKERS = int(os.getenv(
+    "PASSWORD_HASHING_WORKERS",
+    max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", 1)))))
+PASSWORD_HASHING_WAIT = float(os.getenv("PASSWORD_HASHING_WAIT", 5))
+
+
+# the tests use a cache key prefix of their own, see IsolatedCacheRunner
+TEST_RUNNER = 'investment_app.test.runner.IsolatedCacheRunner'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -146,18 +182,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        # RedisCache recording the cache reads of the requests
+        "BACKEND": "investment_app.metrics.InstrumentedRedisCache",
         "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379"),
+        # tests and benchmarks run under a prefix of their own
+        "KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", ""),
     }
 }
 
+# per-process cache in front of Redis for hot account pages
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+LOCAL_CACHE_TIMEOUT = int(os.getenv("LOCAL_CACHE_TIMEOUT", 5))
+
+# the addresses allowed to read the request metrics at /metrics
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+
+# the most movements and bytes of a bulk settlement file
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 100_000))
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", 10 * 1024 * 1024))
+
+# how long the response to a request with an Idempotency-Key is kept
+IDEMPOTENCY_TIMEOUT = int(os.getenv("IDEMPOTENCY_TIMEOUT", 24 * 60 * 60))
+
+# how long the id, is_active and is_staff of an authenticated user are
+# cached, and whether they are read from the claims of the access token
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", 5 * 60))
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "").lower() in ("1", "true", "yes", "on")
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'investment_app.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -167,4 +225,6 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_LIFETIME': timedelta(days=30),
     'SLIDING_TOKEN_REFRESH_LIFETIME_LATE_USER': timedelta(days=1),
     'SLIDING_TOKEN_LIFETIME_LATE_USER': timedelta(days=30),
+    'TOKEN_OBTAIN_SERIALIZER': 'investment_app.serializer.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'investment_app.serializer.ClaimsTokenRefreshSerializer',
 }
\ No newline at end of file
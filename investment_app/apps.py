@@ -6,4 +6,4 @@ class InvestmentAppConfig(AppConfig):
     name = 'investment_app'
 
     def ready(self) -> None:
-        from investment_app import signals
\ No newline at end of file
+        from investment_app import metrics, signals
\ No newline at end of file
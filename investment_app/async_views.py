@@ -0,0 +1,196 @@
+"""
+Async variants of the read views, for the ASGI application.
+
+They return the same responses as ``AccountView.get`` and ``AdminView.get``
+but read the database with the async ORM and the cache with an async Redis
+client, so a worker waiting on either serves other requests meanwhile
+instead of holding a thread per request.
+"""
+from datetime import date
+from typing import Dict
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpRequest, HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.serializers import ValidationError
+from .authentication import (
+    CachedJWTAuthentication,
+    aget_user_record,
+    check_user,
+    claims_record,
+    token_user_id)
+from .caching import (
+    ACCOUNT_TIMEOUT,
+    USER_TIMEOUT,
+    account_cache_key,
+    aget_or_set,
+    aget_version,
+    user_cache_key)
+from .decorator import handle_async_exceptions
+from .metrics import timer
+from .models import InvestmentAccount, Portfolio
+from .permissions import AccountTypePermission, aget_account_access
+from .renderers import ORJSONRenderer
+from .routers import areplica_reads
+from .serializer import InvestmentAccountSerializer, PaginationSerializer
+from .utils import aget_transactions, get_next_cursor
+from .views import AdminView
+
+
+async def authenticate(request: HttpRequest) -> User:
+    """Authenticate a request with its JWT access token like
+    ``CachedJWTAuthentication``, reading the user with the async cache.
+
+    Raises:
+        NotAuthenticated: If the request has no token.
+        AuthenticationFailed: If the token or its user is not valid.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = None if header is None else authentication.get_raw_token(
+        header)
+    if raw_token is None:
+        raise exceptions.NotAuthenticated()
+
+    token = authentication.get_validated_token(raw_token)
+    record = claims_record(token)
+    if record is None:
+        try:
+            record = await aget_user_record(token_user_id(token))
+        except User.DoesNotExist:
+            pass
+    return check_user(token, record)
+
+
+def render(data, status: int = 200) -> HttpResponse:
+    """Render data as JSON the way the DRF views do."""
+    return HttpResponse(
+        ORJSONRenderer().render(data),
+        content_type='application/json',
+        status=status)
+
+
+class AsyncAccountView(View):
+
+    @handle_async_exceptions
+    async def get(self, request: HttpRequest, account_id: str) -> HttpResponse:
+        """
+        Async ``AccountView.get``, the same paginated and cached view of
+        an investment account.
+
+        Args:
+            request (HttpRequest): The HTTP request object containing
+                    the request data.
+            account_id (int): The ID of the investment account to retrieve.
+
+        Returns:
+            HttpResponse: The serialized account data.
+        """
+        request.user = await authenticate(request)
+        pagination = PaginationSerializer(data=request.GET)
+        pagination.is_valid(raise_exception=True)
+        page_size = pagination.validated_data['page_size']
+        cursor = pagination.validated_data.get('cursor')
+
+        try:
+            access = await aget_account_access(account_id)
+            if not AccountTypePermission().has_object_permission(
+                    request, self, access):
+                raise PermissionDenied(
+                    'You do not have permission to perform this action.')
+        except InvestmentAccount.DoesNotExist:
+            raise Http404('No InvestmentAccount matches the given query.')
+
+        cache_key = account_cache_key(
+            access.id, page_size, cursor,
+            version=await aget_version('account', access.id))
+        results = await aget_or_set(
+            cache_key,
+            lambda: self.get_account_page(access.id, page_size, cursor),
+            ACCOUNT_TIMEOUT,
+            local=True)
+        return render(results)
+
+    async def get_account_page(
+            self,
+            account_id: int,
+            page_size: int,
+            cursor: str = None) -> Dict:
+        """Async ``AccountView.get_account_page``, the account is loaded
+        on a cache miss only."""
+        async with areplica_reads('account', account_id):
+            try:
+                account = await InvestmentAccount.objects.aget(id=account_id)
+            except InvestmentAccount.DoesNotExist:
+                raise Http404('No InvestmentAccount matches the given query.')
+            transactions = await aget_transactions(
+                account, page_size, cursor)
+        with timer('serialize'):
+            account_data = InvestmentAccountSerializer(account).data
+        return {
+            'account': account_data,
+            'transcations': transactions or [],
+            'next_cursor': get_next_cursor(transactions, page_size)
+        }
+
+
+class AsyncAdminView(View):
+
+    @handle_async_exceptions
+    async def get(self, request: HttpRequest, user_id: str) -> HttpResponse:
+        """Async ``AdminView.get``, the same report of the transactions
+        of a user, for admins only.
+
+        Args:
+            request (HttpRequest): The HTTP request containing query parameters for date filtering.
+            user_id (str): The ID of the user whose transactions are to be retrieved.
+
+        Returns:
+            HttpResponse: The user's transaction data.
+        """
+        reader = await authenticate(request)
+        if not reader.is_staff:
+            raise exceptions.PermissionDenied()
+
+        start_date = request.GET.get('start_date') or date.today()
+        end_date = request.GET.get('end_date')
+        group_by = request.GET.get('group_by')
+        if group_by not in (None, 'day'):
+            raise ValidationError('group_by must be day.')
+
+        async def build_report():
+            async with areplica_reads('user', user_id):
+                try:
+                    user = await User.objects.only('id', 'username').aget(
+                        id=user_id)
+                except User.DoesNotExist:
+                    raise Http404('No User matches the given query.')
+                return await self.get_user_transactions(
+                    user, start_date, end_date, group_by)
+
+        if end_date or group_by:
+            results = await build_report()
+        else:
+            cache_key = user_cache_key(
+                user_id, start_date,
+                version=await aget_version('user', user_id))
+            results = await aget_or_set(
+                cache_key, build_report, USER_TIMEOUT, local=True)
+        return render(results)
+
+    async def get_user_transactions(
+            self,
+            user: User,
+            start_date: date,
+            end_date: date = None,
+            group_by: str = None) -> Dict:
+        """Async ``AdminView.get_user_transactions``."""
+        portfolio, rows, daily_totals = AdminView.report_querysets(
+            user, start_date, end_date, group_by)
+        if group_by:
+            daily_totals = [row async for row in daily_totals]
+        return AdminView.build_report(
+            user, await portfolio.afirst() or Portfolio(),
+            [row async for row in rows],
+            start_date, end_date, daily_totals)
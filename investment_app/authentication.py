@@ -0,0 +1,163 @@
+"""
+JWT authentication without a user query per request.
+
+``JWTAuthentication`` verifies the access token, then loads its user from
+the database on every request. ``CachedJWTAuthentication`` keeps the
+fields the permissions read, ``id``, ``is_active`` and ``is_staff``, in
+memory and in Redis for ``AUTH_USER_CACHE_TIMEOUT`` seconds under a
+version bumped when the user is saved or deleted, so a request costs no
+query on a hit. The user is a ``User`` with its other fields deferred,
+reading one of them loads it.
+
+With ``AUTH_TRUST_TOKEN_CLAIMS`` the access tokens issued at login and on
+refresh carry the same fields as claims and nothing is looked up at all.
+A deactivated user or a revoked admin then keeps access until their
+access token expires, and a password change does not revoke it.
+"""
+from typing import Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken, Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .caching import aget_or_set, aget_version, auth_cache_key, get_or_set
+
+AUTH_USER_CACHE_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 5 * 60)
+TRUST_TOKEN_CLAIMS = getattr(settings, 'AUTH_TRUST_TOKEN_CLAIMS', False)
+# the loaded fields of the user, in the order of the cached record
+USER_FIELDS = ('id', 'is_active', 'is_staff')
+USER_CLAIMS = ('is_active', 'is_staff')
+
+
+def user_record(user: User) -> tuple:
+    """Return the cached authentication record of a user: the
+    ``USER_FIELDS`` and the hash of the password when tokens are revoked
+    on a password change."""
+    revoke_hash = (get_md5_hash_password(user.password)
+                   if api_settings.CHECK_REVOKE_TOKEN else None)
+    return tuple(getattr(user, field) for field in USER_FIELDS) + (
+        revoke_hash,)
+
+
+def _load_record(user_id) -> tuple:
+    """Raises ``User.DoesNotExist``, which is not cached."""
+    fields = USER_FIELDS + (('password',) if api_settings.CHECK_REVOKE_TOKEN
+                            else ())
+    return user_record(User.objects.only(*fields).get(
+        **{api_settings.USER_ID_FIELD: user_id}))
+
+
+def get_user_record(user_id) -> tuple:
+    """Return the authentication record of a user, from the cache.
+
+    Raises:
+        User.DoesNotExist: If the user does not exist.
+    """
+    return tuple(get_or_set(
+        auth_cache_key(user_id), lambda: _load_record(user_id),
+        AUTH_USER_CACHE_TIMEOUT, local=True))
+
+
+async def aget_user_record(user_id) -> tuple:
+    """Async ``get_user_record``."""
+    async def load():
+        return await sync_to_async(_load_record)(user_id)
+
+    return tuple(await aget_or_set(
+        auth_cache_key(user_id, await aget_version('auth', user_id)),
+        load, AUTH_USER_CACHE_TIMEOUT, local=True))
+
+
+def token_user_id(token: Token):
+    """Return the user ID claim of a validated token.
+
+    Raises:
+        InvalidToken: If the token has no user ID.
+    """
+    try:
+        return token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(
+            'Token contained no recognizable user identification')
+
+
+def claims_record(token: Token) -> Optional[tuple]:
+    """Return the authentication record embedded in a token, None if
+    the claims are not trusted or the token has none."""
+    if not TRUST_TOKEN_CLAIMS or any(
+            claim not in token for claim in USER_CLAIMS):
+        return None
+    return (token_user_id(token),) + tuple(
+        token[claim] for claim in USER_CLAIMS) + (None,)
+
+
+def check_user(token: Token, record: Optional[tuple]) -> User:
+    """Return the user of an authentication record, like
+    ``JWTAuthentication.get_user`` does.
+
+    Args:
+        token (Token): The validated access token.
+        record (tuple): The record of the token's user, None if the user
+            does not exist.
+
+    Raises:
+        AuthenticationFailed: If the user does not exist, is inactive or
+            changed their password since the token was issued.
+    """
+    if record is None:
+        raise exceptions.AuthenticationFailed(
+            'User not found', code='user_not_found')
+    *values, revoke_hash = record
+    user = _deferred_user(dict(zip(USER_FIELDS, values)))
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed(
+            'User is inactive', code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN and revoke_hash is not None and (
+            token.get(api_settings.REVOKE_TOKEN_CLAIM) != revoke_hash):
+        raise exceptions.AuthenticationFailed(
+            "The user's password has been changed.", code='password_changed')
+    return user
+
+
+def _deferred_user(values: dict) -> User:
+    # from_db takes the values in the order of the fields of the model
+    names = [field.attname for field in User._meta.concrete_fields
+             if field.attname in values]
+    return User.from_db(None, names, [values[name] for name in names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` with the user read from the cache, or from
+    the claims of the token when they are trusted."""
+
+    def get_user(self, validated_token: Token) -> User:
+        record = claims_record(validated_token)
+        if record is None:
+            try:
+                record = get_user_record(token_user_id(validated_token))
+            except User.DoesNotExist:
+                pass
+        return check_user(validated_token, record)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """A refresh token whose access tokens carry the authentication
+    record of the user as claims when they are trusted, read again on
+    every refresh."""
+
+    @property
+    def access_token(self) -> AccessToken:
+        access = super().access_token
+        if TRUST_TOKEN_CLAIMS:
+            try:
+                record = get_user_record(token_user_id(self))
+            except User.DoesNotExist:
+                record = None
+            check_user(self, record)
+            for claim in USER_CLAIMS:
+                access[claim] = record[USER_FIELDS.index(claim)]
+        return access
@@ -0,0 +1,469 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Iterable, Optional, Tuple
+from uuid import uuid4
+import redis
+import redis.asyncio
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+from django.db import connection, transaction
+from . import codec
+from .local_cache import LocalCache
+
+
+ACCOUNT_TIMEOUT = 5 * 60 * 60
+USER_TIMEOUT = 2 * 60 * 60
+
+# a rebuild holding the lock longer than this is presumed dead
+LOCK_TIMEOUT = 10
+# how long a reader waits for another worker's rebuild before doing its own
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.02
+# > 1 refreshes earlier, < 1 later, see should_refresh_early
+EARLY_REFRESH_BETA = 1.0
+TIMEOUT_JITTER = 0.1
+
+# hot data is also kept in memory by each process for a few seconds,
+# version changes are broadcast so the copies are dropped on write
+local_cache = LocalCache(
+    getattr(settings, 'LOCAL_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+    getattr(settings, 'LOCAL_CACHE_TIMEOUT', 5))
+# under the key prefix of the cache, see invalidation_channel
+INVALIDATION_CHANNEL = 'investment_app:cache-versions'
+# seconds a read replica may lag behind the primary
+REPLICA_LAG = getattr(settings, 'DATABASE_REPLICA_LAG', 5)
+VERSION_SIZE = 64
+
+_sender = uuid4().hex
+_listener = {'pid': None}
+_listener_lock = threading.Lock()
+_shared_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_client = {}
+_async_clients = weakref.WeakKeyDictionary()
+# the serializer of the default Redis cache, for the async client
+_serializer = RedisSerializer()
+
+
+def version_key(scope: str, object_id: int) -> str:
+    """Return the key of the version counter of an account, a user or
+    the authentication record of a user."""
+    return f'{scope}:{object_id}:version'
+
+
+def get_version(scope: str, object_id: int) -> int:
+    """Return the current cache version of an account or a user.
+
+    A missing counter starts from the current time in milliseconds, so a
+    counter that was evicted never comes back to a version that may still
+    have data cached under it.
+
+    Args:
+        scope (str): ``account``, ``user`` or ``auth``.
+        object_id (int): The ID of the account or the user.
+
+    Returns:
+        int: The version to build the data keys with.
+    """
+    key = version_key(scope, object_id)
+    start_listener()
+    if (version := local_cache.get(key)) is not None:
+        return version
+
+    generation = local_cache.generation
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    local_cache.set(key, version, size=VERSION_SIZE, generation=generation)
+    return version
+
+
+def _bump(keys: list) -> None:
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+    if keys and 'replica' in settings.DATABASES:
+        cache.set_many(
+            {f'{key}:changed': 1 for key in keys}, timeout=REPLICA_LAG)
+    local_cache.delete_many(keys)
+    if keys and _uses_redis():
+        redis_client().publish(
+            invalidation_channel(), f'{_sender}|{",".join(keys)}')
+
+
+def _uses_redis() -> bool:
+    return isinstance(caches['default'], RedisCache)
+
+
+def redis_location() -> str:
+    """Return the URL of the Redis server behind the default cache."""
+    location = settings.CACHES['default']['LOCATION']
+    if not isinstance(location, str):
+        location = location[0]
+    return location.split(',')[0]
+
+
+def invalidation_channel() -> str:
+    """Return the channel the version changes are broadcast on, under the
+    key prefix of the default cache so runs sharing a Redis server with
+    other prefixes do not drop each other's local copies."""
+    prefix = caches['default'].key_prefix
+    return f'{prefix}:{INVALIDATION_CHANNEL}' if prefix else INVALIDATION_CHANNEL
+
+
+def isolated_caches(label: str) -> dict:
+    """Return ``CACHES`` with a key prefix unique to this process, for a
+    test or benchmark run sharing the Redis server of the developer.
+
+    ``cache.clear()`` then deletes the keys of the run only.
+    """
+    caches_setting = {
+        alias: dict(config) for alias, config in settings.CACHES.items()}
+    caches_setting['default']['KEY_PREFIX'] = f'{label}-{uuid4().hex[:12]}'
+    return caches_setting
+
+
+def redis_client() -> redis.Redis:
+    """Return a client of the Redis server behind the default cache."""
+    if 'client' not in _client:
+        _client['client'] = redis.Redis.from_url(redis_location())
+    return _client['client']
+
+
+def async_redis_client() -> redis.asyncio.Redis:
+    """Return an async client of the Redis server behind the default
+    cache, one per event loop as connections are bound to their loop."""
+    loop = asyncio.get_running_loop()
+    if (client := _async_clients.get(loop)) is None:
+        client = _async_clients[loop] = redis.asyncio.Redis.from_url(
+            redis_location())
+    return client
+
+
+def _listen() -> None:
+    while True:
+        try:
+            pubsub = redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(invalidation_channel())
+            # messages published while disconnected are lost
+            local_cache.clear()
+            for message in pubsub.listen():
+                sender, _, keys = message['data'].decode().partition('|')
+                if sender != _sender:
+                    local_cache.delete_many(keys.split(','))
+        except redis.RedisError:
+            time.sleep(1)
+
+
+def start_listener() -> None:
+    """Subscribe this process to the version changes of other processes.
+
+    The subscription runs on a daemon thread started once per process,
+    again in a forked worker. Without Redis the local copies only expire.
+    """
+    if _listener['pid'] == os.getpid():
+        return
+    with _listener_lock:
+        if _listener['pid'] == os.getpid():
+            return
+        if _listener['pid'] is not None:
+            local_cache.clear()
+        if _uses_redis():
+            threading.Thread(
+                target=_listen, name='cache-invalidation', daemon=True).start()
+        _listener['pid'] = os.getpid()
+
+
+def bump_versions(
+        account_ids: Iterable[int] = (),
+        user_ids: Iterable[int] = (),
+        defer: bool = True) -> None:
+    """Invalidate everything cached for the accounts and users.
+
+    Counters are incremented atomically in the cache, data cached under
+    the previous versions is never read again and expires on its own.
+    Inside a transaction the bump is deferred until the commit: a reader
+    cannot cache the old data under the new version, and the cache round
+    trip does not extend the time the changed rows stay locked.
+
+    Args:
+        account_ids (iterable): The IDs of the changed accounts.
+        user_ids (iterable): The IDs of the owners of the changed accounts.
+        defer (bool): Wait for the commit of the current transaction.
+    """
+    keys = [version_key('account', account_id) for account_id in account_ids]
+    keys += [version_key('user', user_id) for user_id in set(user_ids)]
+    _bump_after_commit(keys, defer)
+
+
+def bump_auth_versions(user_ids: Iterable[int], defer: bool = True) -> None:
+    """Invalidate the cached authentication records of users, e.g. when
+    they are saved. Separate from the ``user`` version which every
+    balance change bumps."""
+    _bump_after_commit(
+        [version_key('auth', user_id) for user_id in set(user_ids)], defer)
+
+
+def _bump_after_commit(keys: list, defer: bool) -> None:
+    if defer and connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(keys))
+    else:
+        _bump(keys)
+
+
+def recently_changed(scope: str, object_id: int) -> bool:
+    """Return whether an account or a user changed within the lag of the
+    read replica, its data on the replica may be stale."""
+    return cache.get(f'{version_key(scope, object_id)}:changed') is not None
+
+
+def account_cache_key(
+        account_id: int,
+        page_size: int,
+        cursor: Optional[str] = None,
+        version: Optional[int] = None) -> str:
+    """Return the key of a page of the account view, e.g.
+    ``account:5:v1697610000123:50:``, at the current version by default."""
+    if version is None:
+        version = get_version('account', account_id)
+    return f'account:{account_id}:v{version}:{page_size}:{cursor or ""}'
+
+
+def access_cache_key(account_id: int, version: Optional[int] = None) -> str:
+    """Return the key of the permission record of an account, e.g.
+    ``account:5:v1697610000123:access``, at the current version by default."""
+    if version is None:
+        version = get_version('account', account_id)
+    return f'account:{account_id}:v{version}:access'
+
+
+def user_cache_key(
+        user_id: int,
+        start_date,
+        version: Optional[int] = None) -> str:
+    """Return the key of the admin report of a user from a start date,
+    at the current version by default."""
+    if version is None:
+        version = get_version('user', user_id)
+    return f'user:{user_id}:v{version}:{start_date}'
+
+
+def auth_cache_key(user_id: int, version: Optional[int] = None) -> str:
+    """Return the key of the authentication record of a user, e.g.
+    ``auth:5:v1697610000123``, at the current version by default."""
+    if version is None:
+        version = get_version('auth', user_id)
+    return f'auth:{user_id}:v{version}'
+
+
+def _entry(value: Any, timeout: int, delta: float) -> Tuple[tuple, int]:
+    expires_at = time.time() + timeout
+    jitter = 1 + random.uniform(0, TIMEOUT_JITTER)
+    return (expires_at, delta, codec.dumps(value)), int(timeout * jitter)
+
+
+def cache_set(
+        key: str,
+        value: Any,
+        timeout: int,
+        delta: float = 0,
+        local: bool = False) -> None:
+    """Cache a value with a jittered timeout for ``get_or_set``.
+
+    The value is stored encoded with ``codec`` together with its logical
+    expiry and the time it took to compute. The entry itself lives up to
+    10% longer, spreading the expiry of entries cached at the same time.
+
+    Args:
+        key (str): The cache key.
+        value: The value to cache.
+        timeout (int): The number of seconds the value is fresh.
+        delta (float): The number of seconds it took to compute the value.
+        local (bool): Also keep the value in the memory of this process.
+    """
+    entry, entry_timeout = _entry(value, timeout, delta)
+    cache.set(key, entry, timeout=entry_timeout)
+    if local:
+        local_cache.set(key, value)
+
+
+def should_refresh_early(expires_at: float, delta: float) -> bool:
+    """Probabilistic early expiration (XFetch).
+
+    The closer the expiry and the longer the value takes to compute, the
+    likelier a reader is to refresh it before it expires, so that in a
+    burst of readers usually a single one refreshes, ahead of time.
+    """
+    return time.time() - delta * EARLY_REFRESH_BETA * math.log(
+        random.random() or 1e-12) >= expires_at
+
+
+def get_or_set(
+        key: str,
+        compute: Callable[[], Any],
+        timeout: int,
+        local: bool = False) -> Any:
+    """Return a cached value, computing it in a single worker on a miss.
+
+    On a miss the first reader takes a short lock and computes the value,
+    concurrent readers wait for it instead of hitting the database. A
+    value about to expire is refreshed early by one reader holding the
+    lock while the others keep serving it.
+
+    Args:
+        key (str): The cache key.
+        compute (callable): Builds the value on a miss, a payload
+            ``codec`` can encode.
+        timeout (int): The number of seconds the value is fresh.
+        local (bool): Look up and keep the value in the memory of this
+            process before going to the shared cache.
+
+    Returns:
+        The cached or computed value.
+    """
+    if not local:
+        return _get_or_set(key, compute, timeout)
+
+    if (value := local_cache.get(key)) is not None:
+        return value
+    generation = local_cache.generation
+    value = _get_or_set(key, compute, timeout)
+    local_cache.set(key, value, generation=generation)
+    return value
+
+
+def _get_or_set(key: str, compute: Callable[[], Any], timeout: int) -> Any:
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    with _stats_lock:
+        _shared_stats['misses' if entry is None else 'hits'] += 1
+
+    if entry is not None:
+        expires_at, delta, data = entry
+        if not should_refresh_early(expires_at, delta):
+            return codec.loads(data)
+        if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            return codec.loads(data)
+    elif not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            if (entry := cache.get(key)) is not None:
+                return codec.loads(entry[2])
+        # the rebuild is too slow or its worker died
+        return compute()
+
+    try:
+        start = time.monotonic()
+        value = compute()
+        cache_set(key, value, timeout, time.monotonic() - start)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def cache_stats() -> dict:
+    """Return the hit, miss and eviction counters of both cache tiers.
+
+    The hits and misses of the shared cache are the lookups made by this
+    process, its evictions are those of the whole Redis server.
+    """
+    shared = dict(_shared_stats)
+    if _uses_redis():
+        shared['evictions'] = redis_client().info('stats')['evicted_keys']
+    return {'local': local_cache.stats(), 'shared': shared}
+
+
+# async twins of the read path for the ASGI views, they read and write
+# the same entries as the synchronous functions through redis.asyncio
+
+
+async def aget_version(scope: str, object_id: int) -> int:
+    """Async ``get_version``."""
+    key = version_key(scope, object_id)
+    start_listener()
+    if (version := local_cache.get(key)) is not None:
+        return version
+
+    generation = local_cache.generation
+    data = await async_redis_client().get(cache.make_key(key))
+    if data is None:
+        # first use of the counter
+        return await sync_to_async(get_version)(scope, object_id)
+    version = _serializer.loads(data)
+    local_cache.set(key, version, size=VERSION_SIZE, generation=generation)
+    return version
+
+
+async def arecently_changed(scope: str, object_id: int) -> bool:
+    """Async ``recently_changed``."""
+    if not _uses_redis():
+        return await sync_to_async(recently_changed)(scope, object_id)
+    key = cache.make_key(f'{version_key(scope, object_id)}:changed')
+    return await async_redis_client().exists(key) > 0
+
+
+async def aget_or_set(
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        timeout: int,
+        local: bool = False) -> Any:
+    """Async ``get_or_set``, ``compute`` is a coroutine function."""
+    if not _uses_redis():
+        return await sync_to_async(get_or_set)(
+            key, async_to_sync(compute), timeout, local)
+
+    if local and (value := local_cache.get(key)) is not None:
+        return value
+    generation = local_cache.generation
+    value = await _aget_or_set(key, compute, timeout)
+    if local:
+        local_cache.set(key, value, generation=generation)
+    return value
+
+
+async def _aget_or_set(
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        timeout: int) -> Any:
+    client = async_redis_client()
+    redis_key = cache.make_key(key)
+    lock_key = cache.make_key(f'{key}:lock')
+    data = await client.get(redis_key)
+    with _stats_lock:
+        _shared_stats['misses' if data is None else 'hits'] += 1
+
+    if data is not None:
+        expires_at, delta, payload = _serializer.loads(data)
+        if not should_refresh_early(expires_at, delta):
+            return codec.loads(payload)
+        if not await client.set(lock_key, 1, nx=True, ex=LOCK_TIMEOUT):
+            return codec.loads(payload)
+    elif not await client.set(lock_key, 1, nx=True, ex=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            if (data := await client.get(redis_key)) is not None:
+                return codec.loads(_serializer.loads(data)[2])
+        return await compute()
+
+    try:
+        start = time.monotonic()
+        value = await compute()
+        entry, entry_timeout = _entry(
+            value, timeout, time.monotonic() - start)
+        await client.set(
+            redis_key, _serializer.dumps(entry), ex=entry_timeout)
+        return value
+    finally:
+        await client.delete(lock_key)
@@ -0,0 +1,181 @@
+"""
+A compact codec for the payloads cached by the account and admin views.
+
+Payloads are encoded as JSON. Lists of dicts sharing the same keys, the
+transactions, are stored column by column so that every key is written
+once and a whole column is converted at a time. ``Decimal``, ``datetime``
+and ``date`` values are kept as strings tagged with their type, so they
+round-trip with it, columns of UTC datetimes as epoch microseconds.
+Payloads are compressed with zlib above a size threshold. The first byte
+of the encoded value tells how to decode it:
+
+- ``J`` JSON
+- ``Z`` zlib compressed JSON
+- ``P`` pickle, for values JSON cannot represent
+
+Encoding and decoding count as the ``serialize`` phase of the request
+metrics.
+"""
+import json
+import pickle
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import repeat
+from typing import Any
+from .metrics import timer
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 1
+
+# tagged strings start with a NUL character, real strings
+# starting with one are escaped with the ``s`` tag
+TAG = '\x00'
+TABLE = f'{TAG}table'
+_TYPE_TAGS = {Decimal: 'd', datetime: 't', date: 'D'}
+_ENCODERS = {'d': str, 't': datetime.isoformat, 'D': date.isoformat}
+_DECODERS = {
+    'd': Decimal,
+    't': datetime.fromisoformat,
+    'D': date.fromisoformat,
+    's': str,
+}
+# column tags, besides the type tags
+PLAIN = ''
+MIXED = '*'
+EPOCH = 'e'
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+# microseconds / 1e6 rounds back to the same microsecond up to 2^33 seconds
+# (year 2242), so the fast float path of fromtimestamp is exact
+_EPOCH_RANGE = 2 ** 33 * 10 ** 6
+
+
+def _pack(obj):
+    if isinstance(obj, str):
+        return f'{TAG}s{obj}' if obj.startswith(TAG) else obj
+    if isinstance(obj, dict):
+        return {key: _pack(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if (table := _pack_table(obj)) is not None:
+            return table
+        return [_pack(value) for value in obj]
+    if (tag := _TYPE_TAGS.get(type(obj))) is not None:
+        return f'{TAG}{tag}{_ENCODERS[tag](obj)}'
+    return obj
+
+
+def _pack_table(rows) -> list:
+    """Pack a list of dicts sharing the same keys as
+    ``[TABLE, keys, column tags, *columns]``, or return None."""
+    if len(rows) < 2 or not all(map(isinstance, rows, repeat(dict))):
+        return None
+    keys = list(rows[0])
+    # rows of the same length holding every key of the first have its keys
+    if set(map(len, rows)) != {len(keys)}:
+        return None
+
+    tags, columns = [], []
+    for key in keys:
+        try:
+            column = [row[key] for row in rows]
+        except KeyError:
+            return None
+        types = set(map(type, column))
+        if types == {datetime} and (micros := _epoch_micros(column)):
+            tags.append(EPOCH)
+            columns.append(micros)
+        elif len(types) == 1 and (tag := _TYPE_TAGS.get(next(iter(types)))):
+            tags.append(tag)
+            columns.append(list(map(_ENCODERS[tag], column)))
+        elif types <= {int, float, bool, type(None)} or (
+                types == {str} and not any(
+                    value.startswith(TAG) for value in column)):
+            tags.append(PLAIN)
+            columns.append(column)
+        else:
+            tags.append(MIXED)
+            columns.append(_pack(column))
+    return [TABLE, keys, tags, *columns]
+
+
+def _epoch_micros(column: list) -> list:
+    """Return UTC datetimes as epoch microseconds, or None."""
+    if not all(value.tzinfo is timezone.utc for value in column):
+        return None
+    micros = [(value - _EPOCH) // _MICROSECOND for value in column]
+    if max(map(abs, micros)) >= _EPOCH_RANGE:
+        return None
+    return micros
+
+
+def _unpack(obj):
+    if isinstance(obj, str):
+        if obj.startswith(TAG):
+            return _DECODERS[obj[1]](obj[2:])
+        return obj
+    if isinstance(obj, dict):
+        return {key: _unpack(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        if obj and obj[0] == TABLE:
+            return _unpack_table(obj)
+        return [_unpack(value) for value in obj]
+    return obj
+
+
+def _unpack_table(table: list) -> list:
+    _, keys, tags, *columns = table
+    for index, tag in enumerate(tags):
+        if tag == MIXED:
+            columns[index] = _unpack(columns[index])
+        elif tag == EPOCH:
+            columns[index] = [
+                datetime.fromtimestamp(value / 1e6, timezone.utc)
+                for value in columns[index]]
+        elif tag != PLAIN:
+            columns[index] = list(map(_DECODERS[tag], columns[index]))
+    return list(map(dict, map(zip, repeat(keys), zip(*columns))))
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a cached payload.
+
+    Dict keys must be strings, tuples are decoded as lists. Values JSON
+    cannot represent fall back to pickle.
+
+    Args:
+        value: The payload to encode.
+
+    Returns:
+        bytes: The encoded payload.
+    """
+    with timer('serialize'):
+        try:
+            data = json.dumps(
+                _pack(value), separators=(',', ':'), ensure_ascii=False,
+                allow_nan=False).encode()
+        except (TypeError, ValueError):
+            return b'P' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return b'Z' + zlib.compress(data, COMPRESS_LEVEL)
+        return b'J' + data
+
+
+def loads(data: bytes) -> Any:
+    """Decode a payload encoded by ``dumps``.
+
+    Values cached before the codec was used are returned as they are.
+    """
+    if not isinstance(data, bytes):
+        return data
+    header = data[:1]
+    with timer('serialize'):
+        if header == b'Z':
+            return _unpack(json.loads(zlib.decompress(memoryview(data)[1:])))
+        if header == b'J':
+            return _unpack(json.loads(data[1:]))
+        if header == b'P':
+            return pickle.loads(data[1:])
+    raise ValueError(f'Unknown cache payload header {header!r}.')
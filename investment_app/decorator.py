@@ -1,10 +1,38 @@
 from functools import wraps
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import exceptions, status
 from django.core.exceptions import PermissionDenied
-from django.http import (Http404)
+from django.db import transaction
+from django.http import (Http404, JsonResponse)
 from django.contrib.auth.models import User
 from rest_framework.serializers import ValidationError
+from . import idempotency
+from .hashers import HashingBusy
+from .parsers import SettlementTooLarge
+
+
+EXCEPTION_MAPPING = {
+    User.DoesNotExist: status.HTTP_404_NOT_FOUND,
+    Http404: status.HTTP_404_NOT_FOUND,
+    ValidationError: status.HTTP_400_BAD_REQUEST,
+    PermissionDenied: status.HTTP_403_FORBIDDEN,
+    PermissionError: status.HTTP_403_FORBIDDEN,
+    HashingBusy: status.HTTP_503_SERVICE_UNAVAILABLE,
+    SettlementTooLarge: status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+}
+# raised by the authentication and permission checks that DRF runs
+# before the handler of a synchronous view
+CHECK_EXCEPTIONS = (
+    exceptions.NotAuthenticated,
+    exceptions.AuthenticationFailed,
+    exceptions.PermissionDenied,
+)
+
+
+def error_status(error: Exception) -> int:
+    """Return the status code of an error raised by a view, the same for
+    the synchronous and the async views."""
+    return EXCEPTION_MAPPING.get(type(error), status.HTTP_400_BAD_REQUEST)
 
 
 def handle_exceptions(view_func: callable) -> callable:
@@ -22,13 +50,6 @@ def handle_exceptions(view_func: callable) -> callable:
     Raises:
         None
     """
-    exception_mapping = {
-            User.DoesNotExist: status.HTTP_404_NOT_FOUND,
-            Http404: status.HTTP_404_NOT_FOUND,
-            ValidationError: status.HTTP_400_BAD_REQUEST,
-            PermissionDenied: status.HTTP_403_FORBIDDEN,
-            PermissionError: status.HTTP_403_FORBIDDEN,
-        }
 
     @wraps(view_func)
     def _wrapped_view(*args, **kwargs):
@@ -38,9 +59,118 @@ def handle_exceptions(view_func: callable) -> callable:
         try:
             return view_func(*args, **kwargs)
         except Exception as error:
-            status_code = exception_mapping.get(
-                type(error),status.HTTP_400_BAD_REQUEST)
             return Response(
-                {'error': str(error)}, status=status_code)
+                {'error': str(error)}, status=error_status(error))
+
+    return _wrapped_view
+
+
+def handle_async_exceptions(view_func: callable) -> callable:
+    """
+    Handles exceptions of the decorated async view function like
+    ``handle_exceptions``, failed authentication and permission
+    checks get the response DRF gives for them.
+
+    Args:
+        view_func: The async view function to be wrapped.
+
+    Returns:
+        JsonResponse: Returns a response with an error message
+          and appropriate status code in case of exceptions.
+    """
+
+    @wraps(view_func)
+    async def _wrapped_view(*args, **kwargs):
+        try:
+            return await view_func(*args, **kwargs)
+        except CHECK_EXCEPTIONS as error:
+            if isinstance(error.detail, (list, dict)):
+                data = error.detail
+            else:
+                data = {'detail': error.detail}
+            response = JsonResponse(
+                data, status=error.status_code, safe=False)
+            if error.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+        except Exception as error:
+            return JsonResponse(
+                {'error': str(error)}, status=error_status(error))
+
+    return _wrapped_view
+
+
+def idempotent(view_func: callable) -> callable:
+    """
+    Makes the decorated view method safe to retry with an
+    ``Idempotency-Key`` header.
+
+    The first request with a key runs the view in a transaction that
+    also stores its response, a retry gets the stored response with an
+    ``Idempotent-Replayed`` header without running the view. A request
+    that raised or got a 5xx is rolled back and can be retried, a key
+    reused for another request is a 422 and a retry while the first
+    request is in progress a 409. Requests without the header run as
+    before.
+
+    Args:
+        view_func: The view method to be wrapped.
+
+    Returns:
+        Response: The response of the view or the stored response.
+    """
+
+    @wraps(view_func)
+    def _wrapped_view(view, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view_func(view, request, *args, **kwargs)
+        if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+            raise ValidationError(
+                'Idempotency-Key must be 1 to '
+                f'{idempotency.MAX_KEY_LENGTH} characters.')
+
+        fingerprint = idempotency.request_fingerprint(request)
+        claim = idempotency.claim(request.user, key, fingerprint)
+        if isinstance(claim, idempotency.StoredResponse):
+            return _stored_response(claim, fingerprint)
+
+        try:
+            # the response is committed with the changes of the view,
+            # a failed request commits neither and can be retried
+            with transaction.atomic():
+                response = view_func(view, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                else:
+                    idempotency.complete(
+                        request.user, key, claim, fingerprint,
+                        response.status_code, response.data)
+        except idempotency.KeyTakenOver:
+            return _stored_response(
+                idempotency.StoredResponse(fingerprint, None, None),
+                fingerprint)
+        except BaseException:
+            idempotency.release(request.user, key, claim)
+            raise
+        if response.status_code >= 500:
+            idempotency.release(request.user, key, claim)
+        return response
+
+    return _wrapped_view
+
 
-    return _wrapped_view
\ No newline at end of file
+def _stored_response(
+        stored: idempotency.StoredResponse, fingerprint: str) -> Response:
+    if stored.status_code is None:
+        return Response(
+            {'error': 'A request with this Idempotency-Key is in progress.'},
+            status=status.HTTP_409_CONFLICT)
+    if stored.fingerprint != fingerprint:
+        return Response(
+            {'error': 'Idempotency-Key was already used for '
+                      'another request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(
+        stored.data, status=stored.status_code,
+        headers={'Idempotent-Replayed': 'true'})
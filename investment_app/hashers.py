@@ -0,0 +1,90 @@
+"""
+Password hashers with tunable parameters and a bound on concurrent hashes.
+
+``PASSWORD_HASHER`` picks the hasher new passwords are hashed with, the
+others only verify existing hashes. A login with a password hashed by
+another hasher, or with other parameters, rehashes it with the preferred
+one, so changing either migrates the users as they log in.
+
+Hashing is deliberately slow, a burst of registrations or logins would
+keep every worker thread busy hashing and starve the other requests. At
+most ``PASSWORD_HASHING_WORKERS`` hashes run at once, on the request
+threads; a request waits up to ``PASSWORD_HASHING_WAIT`` seconds for its
+turn and gets a 503 otherwise. The requests past the limit only wait,
+hashlib, argon2-cffi and bcrypt release the GIL while hashing.
+
+The limit is per process, the default shares the cores between the
+``WEB_CONCURRENCY`` processes of the server. Hashing is not moved off the
+request thread: a WSGI request would wait for it all the same.
+"""
+import os
+import threading
+from typing import Any, Callable
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+WORKERS = getattr(settings, 'PASSWORD_HASHING_WORKERS', os.cpu_count() or 1)
+WAIT = getattr(settings, 'PASSWORD_HASHING_WAIT', 5)
+
+# a slot per running hash, the other requests wait for one
+_slots = threading.BoundedSemaphore(WORKERS)
+_local = threading.local()
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again shortly.'
+    default_code = 'hashing_busy'
+
+
+def run_hashing(func: Callable, *args, **kwargs) -> Any:
+    """Run a hashing function once a slot is free and return its result.
+
+    Raises:
+        HashingBusy: If no slot is free within ``WAIT`` seconds.
+    """
+    if getattr(_local, 'hashing', False):
+        # e.g. verify calling encode, the slot is already held
+        return func(*args, **kwargs)
+    if not _slots.acquire(timeout=WAIT):
+        raise HashingBusy()
+    _local.hashing = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.hashing = False
+        _slots.release()
+
+
+class BoundedHasherMixin:
+    """Encodes and verifies within the bound on concurrent hashes."""
+
+    def encode(self, *args, **kwargs):
+        return run_hashing(super().encode, *args, **kwargs)
+
+    def verify(self, *args, **kwargs):
+        return run_hashing(super().verify, *args, **kwargs)
+
+
+class Argon2PasswordHasher(BoundedHasherMixin, hashers.Argon2PasswordHasher):
+    # the OWASP recommendation, Django's default uses 100 MiB and 8 lanes
+    time_cost = getattr(settings, 'PASSWORD_ARGON2_TIME_COST', 2)
+    memory_cost = getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', 19 * 1024)
+    parallelism = getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', 1)
+
+
+class BCryptSHA256PasswordHasher(
+        BoundedHasherMixin, hashers.BCryptSHA256PasswordHasher):
+    rounds = getattr(settings, 'PASSWORD_BCRYPT_ROUNDS', 12)
+
+
+class ScryptPasswordHasher(BoundedHasherMixin, hashers.ScryptPasswordHasher):
+    work_factor = getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)
+
+
+class PBKDF2PasswordHasher(BoundedHasherMixin, hashers.PBKDF2PasswordHasher):
+    iterations = getattr(
+        settings, 'PASSWORD_PBKDF2_ITERATIONS',
+        hashers.PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,205 @@
+"""
+Idempotency keys of the account updates.
+
+A client sends an ``Idempotency-Key`` header with a deposit, withdrawal
+or account creation and may retry the request with the same key, e.g.
+after a timeout. The first request claims the key with an
+``IdempotencyRecord`` and its response is stored with the record and in
+Redis, the retries get the stored response from Redis without touching
+the database, or from the record when Redis lost it or is unavailable.
+
+The response is stored in the transaction of the changes of the request,
+so changes are never committed without their response. A claim left
+without a response for ``IN_PROGRESS_TIMEOUT`` seconds can be taken over
+by a retry; if the first request is still running, its changes are
+rolled back when it finds the key taken.
+"""
+import json
+from datetime import timedelta
+from hashlib import sha256
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Union
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest
+from django.utils import timezone
+from redis.exceptions import RedisError
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_TIMEOUT = getattr(settings, 'IDEMPOTENCY_TIMEOUT', 24 * 60 * 60)
+# a request in progress longer than this is presumed dead, its key can be
+# claimed again
+IN_PROGRESS_TIMEOUT = 60
+# a key released while it is claimed is claimed again up to this often
+CLAIM_ATTEMPTS = 3
+MAX_KEY_LENGTH = IdempotencyRecord._meta.get_field('key').max_length
+
+
+class StoredResponse(NamedTuple):
+    """The response to a request, None while it is in progress."""
+    fingerprint: str
+    status_code: Optional[int]
+    data: Any
+
+
+class Claim(NamedTuple):
+    """A key claimed by a request, ``claimed_at`` tells it from a later
+    takeover."""
+    claimed_at: datetime
+
+
+class KeyTakenOver(Exception):
+    """The key was taken over by a retry while the request was running."""
+
+
+def idempotency_cache_key(user_id: int, key: str) -> str:
+    """Return the cache key of the response to a user's key."""
+    return f'idempotency:{user_id}:{sha256(key.encode()).hexdigest()}'
+
+
+def request_fingerprint(request: HttpRequest) -> str:
+    """Return a hash of the method, path and data of a request."""
+    payload = json.dumps(
+        [request.method, request.path, request.data],
+        sort_keys=True,
+        cls=DjangoJSONEncoder)
+    return sha256(payload.encode()).hexdigest()
+
+
+def claim(
+        user: User,
+        key: str,
+        fingerprint: str) -> Union[Claim, StoredResponse]:
+    """Claim a key for a request, or return the response it got.
+
+    Args:
+        user (User): The user making the request.
+        key (str): The idempotency key of the request.
+        fingerprint (str): The ``request_fingerprint`` of the request.
+
+    Returns:
+        Claim | StoredResponse: The claim if the request should run, else
+            the response stored for the key. Its ``status_code`` is None
+            while the first request is still in progress.
+    """
+    if (stored := _cached(user.id, key)) is not None:
+        return stored
+
+    for _ in range(CLAIM_ATTEMPTS):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    user=user,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_TIMEOUT))
+            return Claim(record.created_at)
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+        if record is not None:
+            break
+        # released in the meantime
+    else:
+        return StoredResponse(fingerprint, None, None)
+
+    abandoned = record.status_code is None and (
+        record.created_at < now - timedelta(seconds=IN_PROGRESS_TIMEOUT))
+    if record.expires_at <= now or abandoned:
+        # take the key over, only one of the concurrent requests can
+        claimed = IdempotencyRecord.objects.filter(
+            id=record.id, created_at=record.created_at).update(
+                fingerprint=fingerprint,
+                status_code=None,
+                response=None,
+                created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_TIMEOUT))
+        if claimed:
+            return Claim(now)
+        record.refresh_from_db()
+
+    stored = StoredResponse(
+        record.fingerprint, record.status_code, record.response)
+    if stored.status_code is not None:
+        _cache(user.id, key, stored, record.expires_at)
+    return stored
+
+
+def complete(
+        user: User,
+        key: str,
+        claim: Claim,
+        fingerprint: str,
+        status_code: int,
+        data: Any) -> None:
+    """Store the response to a request that claimed a key.
+
+    Call it in the transaction of the changes of the request, the
+    response is committed with them and cached after the commit.
+
+    Args:
+        user (User): The user making the request.
+        key (str): The idempotency key of the request.
+        claim (Claim): The claim of the request.
+        fingerprint (str): The ``request_fingerprint`` of the request.
+        status_code (int): The status of the response.
+        data: The data of the response.
+
+    Raises:
+        KeyTakenOver: If a retry took the key over, the transaction must
+            be rolled back.
+    """
+    # stored as the JSON the retries will load it from
+    data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    expires_at = timezone.now() + timedelta(seconds=IDEMPOTENCY_TIMEOUT)
+    stored = IdempotencyRecord.objects.filter(
+        user=user, key=key, created_at=claim.claimed_at,
+        status_code__isnull=True,
+    ).update(status_code=status_code, response=data, expires_at=expires_at)
+    if not stored:
+        raise KeyTakenOver()
+    transaction.on_commit(lambda: _cache(
+        user.id, key, StoredResponse(fingerprint, status_code, data),
+        expires_at))
+
+
+def release(user: User, key: str, claim: Claim) -> None:
+    """Give up a claimed key, so the request can be retried."""
+    IdempotencyRecord.objects.filter(
+        user=user, key=key, created_at=claim.claimed_at,
+        status_code__isnull=True).delete()
+
+
+def purge_expired() -> int:
+    """Delete the expired records and return how many were deleted."""
+    deleted, _ = IdempotencyRecord.objects.filter(
+        expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def _cached(user_id: int, key: str) -> Optional[StoredResponse]:
+    try:
+        stored = cache.get(idempotency_cache_key(user_id, key))
+    except RedisError:
+        return None
+    return None if stored is None else StoredResponse(*stored)
+
+
+def _cache(
+        user_id: int,
+        key: str,
+        stored: StoredResponse,
+        expires_at) -> None:
+    timeout = int((expires_at - timezone.now()).total_seconds())
+    if timeout <= 0:
+        return
+    try:
+        cache.set(
+            idempotency_cache_key(user_id, key), tuple(stored), timeout)
+    except RedisError:
+        pass
@@ -0,0 +1,197 @@
+"""
+The write-ahead journal of the journaled account updates.
+
+A journaled update appends its movement to ``JournalEntry`` and returns,
+``apply_journal`` applies the pending entries to the balances later, in
+batches of one short database transaction per account. Deposits do not
+touch the account row when they are accepted, so a burst of deposits on
+one account no longer queues on its row lock. Withdrawals reserve their
+amount against the available balance, ``balance - reserved_balance``,
+when they are accepted, so an accepted withdrawal can always be applied.
+"""
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, List, Tuple
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+from .caching import bump_versions
+from .ledger import insert_transactions
+from .models import InvestmentAccount, JournalEntry
+from .portfolio import apply_portfolio_delta
+from .snapshots import record_movements
+
+PENDING = JournalEntry.Statuses.PENDING
+
+
+def append_entry(
+        account: InvestmentAccount,
+        amount: Decimal,
+        user: User,
+        request_id: str) -> Tuple[JournalEntry, bool]:
+    """Accept a movement into the journal.
+
+    A retry with the same request ID, the ``Idempotency-Key`` of the
+    update, returns the entry of the first attempt, the movement is
+    journaled once.
+
+    Args:
+        account (InvestmentAccount): The account, or its ``AccountAccess``
+            record.
+        amount (Decimal): Deposit is + and withdraw -.
+        user (User): The user making the change.
+        request_id (str): The ID the client gave the request.
+
+    Returns:
+        tuple: The entry and True, or the entry of the first attempt and
+            False for a retry.
+
+    Raises:
+        ValidationError: If the withdrawal exceeds the available balance
+            or the request ID was used for another movement.
+    """
+    entry = JournalEntry.objects.filter(
+        transaction_by=user, request_id=request_id).first()
+    if entry is not None:
+        return _replayed(entry, account, amount), False
+
+    try:
+        with transaction.atomic():
+            if amount < 0:
+                reserved = InvestmentAccount.objects.filter(
+                    id=account.id,
+                    balance__gte=F('reserved_balance') - amount,
+                ).update(reserved_balance=F('reserved_balance') - amount)
+                if not reserved:
+                    raise ValidationError(
+                        'Withdrawal amount exceeds the available balance.')
+                bump_versions([account.id], [account.owner_id])
+            entry = JournalEntry.objects.create(
+                account_id=account.id,
+                transaction_by=user,
+                amount=amount,
+                request_id=request_id)
+    except IntegrityError:
+        # a concurrent attempt of the same request was journaled first
+        entry = JournalEntry.objects.get(
+            transaction_by=user, request_id=request_id)
+        return _replayed(entry, account, amount), False
+    return entry, True
+
+
+def _replayed(
+        entry: JournalEntry,
+        account: InvestmentAccount,
+        amount: Decimal) -> JournalEntry:
+    if entry.account_id != account.id or entry.amount != amount:
+        raise ValidationError(
+            'Idempotency-Key was already used for another movement.')
+    return entry
+
+
+def apply_journal(batch_size: int = 1000) -> Dict[str, int]:
+    """Apply the oldest pending entries to the balances.
+
+    The entries of an account are applied together: one conditional
+    UPDATE of the balance and of the reservation, the transactions, the
+    day's snapshot and the owner's portfolio, and the status of the
+    entries, all in one database transaction. A crash leaves the entries
+    pending and they are applied by the next run, never twice. Entries
+    locked by another worker are skipped where the database supports it.
+
+    Args:
+        batch_size (int): The maximum number of entries to apply.
+
+    Returns:
+        dict: The number of ``applied`` and ``rejected`` entries.
+    """
+    pending = JournalEntry.objects.filter(status=PENDING).order_by(
+        'id').values_list('account_id', 'id')[:batch_size]
+    entry_ids = {}
+    for account_id, entry_id in pending:
+        entry_ids.setdefault(account_id, []).append(entry_id)
+
+    results = {'applied': 0, 'rejected': 0}
+    for account_id, ids in entry_ids.items():
+        status, count = _apply_entries(account_id, ids)
+        results[status] += count
+    return results
+
+
+def _apply_entries(account_id: int, entry_ids: List[int]) -> Tuple[str, int]:
+    with transaction.atomic():
+        entries = list(JournalEntry.objects.select_for_update(
+            skip_locked=True,
+        ).filter(id__in=entry_ids, status=PENDING).order_by('id').values_list(
+            'id', 'transaction_by_id', 'amount'))
+        if not entries:
+            return 'applied', 0
+        amounts = [amount for _, _, amount in entries]
+        net = sum(amounts, Decimal('0'))
+        reserved = -sum((amount for amount in amounts if amount < 0),
+                        Decimal('0'))
+        now = timezone.now()
+        # only the entries locked here, another worker may hold the others
+        journaled = JournalEntry.objects.filter(
+            id__in=[entry_id for entry_id, _, _ in entries])
+
+        # the reservations cover the withdrawals, this only fails if the
+        # balance was changed outside of the ledger
+        updated = InvestmentAccount.objects.filter(
+            id=account_id,
+            balance__gte=-net,
+        ).update(
+            balance=F('balance') + net,
+            reserved_balance=F('reserved_balance') - reserved)
+        if not updated:
+            InvestmentAccount.objects.filter(id=account_id).update(
+                reserved_balance=F('reserved_balance') - reserved)
+            journaled.update(
+                status=JournalEntry.Statuses.REJECTED,
+                error='Withdrawal amount exceeds the available balance.',
+                applied_at=now)
+            return 'rejected', len(entries)
+
+        balance, owner_id, account_type = (
+            InvestmentAccount.objects.values_list(
+                'balance', 'owner_id', 'account_type').get(id=account_id))
+        apply_portfolio_delta(owner_id, account_type, net)
+        record_movements(account_id, balance, amounts, timezone.localdate(now))
+        # consecutive entries of the same user are inserted together,
+        # the history keeps the order of the journal
+        account = InvestmentAccount(id=account_id)
+        for user_id, user_entries in groupby(entries, key=lambda e: e[1]):
+            insert_transactions(
+                account, [amount for _, _, amount in user_entries],
+                User(id=user_id), created_at=now)
+        journaled.update(
+            status=JournalEntry.Statuses.APPLIED, applied_at=now)
+        bump_versions([account_id], [owner_id])
+    return 'applied', len(entries)
+
+
+def journal_lag() -> Dict:
+    """Return how far the balances are behind the journal.
+
+    Returns:
+        dict: The number and the net amount of the ``pending`` entries,
+            the time the oldest was accepted, the ``lag_seconds`` since
+            then, 0 without pending entries, and the number of
+            ``rejected`` entries.
+    """
+    pending = JournalEntry.objects.filter(status=PENDING).aggregate(
+        pending=Count('id'),
+        pending_amount=Sum('amount'),
+        oldest_pending_at=Min('created_at'))
+    oldest = pending['oldest_pending_at']
+    return {
+        'pending': pending['pending'],
+        'pending_amount': pending['pending_amount'] or Decimal('0.00'),
+        'oldest_pending_at': oldest,
+        'lag_seconds': (
+            (timezone.now() - oldest).total_seconds() if oldest else 0),
+        'rejected': JournalEntry.objects.filter(
+            status=JournalEntry.Statuses.REJECTED).count(),
+    }
@@ -0,0 +1,96 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class LocalCache:
+    """A per-process LRU cache bounded by the size of its values in bytes.
+
+    Entries expire after a short timeout, so a missed invalidation is
+    only served for a few seconds. Values are returned as stored, they
+    must not be mutated by the caller.
+
+    Attributes:
+        generation (int): Incremented on every invalidation, lets a reader
+            that went to the shared cache detect an invalidation that
+            happened meanwhile.
+    """
+
+    def __init__(self, max_bytes: int, timeout: float):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.generation = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a key, or ``default`` when missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key: str, value: Any, size: Optional[int] = None,
+            generation: Optional[int] = None) -> None:
+        """Store a value, evicting the least recently used entries.
+
+        Args:
+            key (str): The cache key.
+            value: The value to store.
+            size (int): The size of the value, its pickled size by default.
+            generation (int): Skip the write if anything was invalidated
+                since this generation was read.
+        """
+        if size is None:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.timeout, size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_many(self, keys) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """Return the hit, miss and eviction counters and the usage."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remove(self, key: str) -> None:
+        self._size -= self._entries.pop(key)[1]
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from investment_app.journal import apply_journal, journal_lag
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply the pending journal entries to the account balances, '
+        'one database transaction per account and batch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='The maximum number of entries applied per batch.')
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep applying the journal until interrupted.')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='The seconds to wait when the journal is empty.')
+
+    def handle(self, *args, batch_size=1000, loop=False, interval=1.0,
+               **options):
+        while True:
+            results = apply_journal(batch_size)
+            if results['applied'] or results['rejected']:
+                lag = journal_lag()
+                self.stdout.write(
+                    f"Applied {results['applied']} and rejected "
+                    f"{results['rejected']} entries, {lag['pending']} "
+                    f"pending, {lag['lag_seconds']:.1f}s behind.")
+            if not loop:
+                break
+            if results['applied'] + results['rejected'] < batch_size:
+                time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS('The journal is applied.'))
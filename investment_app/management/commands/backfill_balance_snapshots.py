@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from investment_app.models import InvestmentAccount
+from investment_app.snapshots import rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the daily balance snapshots of accounts from their '
+        'transactions, one account per database transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--account', type=int, action='append', dest='accounts',
+            help='The ID of an account to rebuild, all accounts by default.')
+
+    def handle(self, *args, accounts=None, **options):
+        account_ids = InvestmentAccount.objects.order_by('id').values_list(
+            'id', flat=True)
+        if accounts:
+            account_ids = account_ids.filter(id__in=accounts)
+
+        rebuilt = snapshots = 0
+        for account_id in account_ids.iterator():
+            count, unexplained = rebuild_snapshots(account_id)
+            rebuilt += 1
+            snapshots += count
+            if unexplained:
+                self.stderr.write(self.style.WARNING(
+                    f'Account {account_id}: {unexplained} of the balance '
+                    'is not explained by its transactions.'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {snapshots} snapshots of {rebuilt} accounts.'))
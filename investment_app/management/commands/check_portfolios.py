@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from investment_app.models import Portfolio
+from investment_app.portfolio import (
+    COMPUTED_FIELDS, compute_portfolios, refresh_portfolio)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the portfolios of the users from their accounts and '
+        'report the ones that drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Rebuild the portfolios that drifted.')
+
+    def handle(self, *args, fix=False, **options):
+        expected = compute_portfolios()
+        stored = {
+            row.pop('owner_id'): row
+            for row in Portfolio.objects.values('owner_id', *COMPUTED_FIELDS)
+        }
+        empty = {field: 0 for field in COMPUTED_FIELDS}
+
+        drifted = 0
+        for owner_id in sorted(expected.keys() | stored.keys()):
+            computed = expected.get(owner_id, empty)
+            actual = stored.get(owner_id)
+            if actual is None:
+                differences = ['missing']
+            else:
+                differences = [
+                    f'{field} {actual[field]} != {computed[field]}'
+                    for field in COMPUTED_FIELDS
+                    if actual[field] != computed[field]]
+            if not differences:
+                continue
+
+            drifted += 1
+            self.stderr.write(self.style.WARNING(
+                f'User {owner_id}: {", ".join(differences)}'))
+            if fix:
+                refresh_portfolio(owner_id)
+
+        summary = f'{drifted} of {len(expected.keys() | stored.keys())} ' \
+            'portfolios drifted'
+        if fix and drifted:
+            summary += ', rebuilt'
+        self.stdout.write(
+            (self.style.WARNING if drifted else self.style.SUCCESS)(
+                summary + '.'))
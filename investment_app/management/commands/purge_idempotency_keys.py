@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from investment_app.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete the expired responses stored for idempotency keys.'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired idempotency records.'))
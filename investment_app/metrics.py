@@ -0,0 +1,319 @@
+"""
+Request metrics, exported in the Prometheus text format.
+
+``MetricsMiddleware`` starts a ``RequestMetrics`` for every request and
+records it per view and method when the response is ready. The hooks add
+to the metrics of the current request in whatever thread it runs:
+
+* every database connection gets ``query_wrapper`` as execute wrapper,
+* ``InstrumentedRedisCache`` is the cache backend,
+* ``timer`` measures a block, e.g. serializing or rendering.
+
+The totals are kept in the memory of the process, each worker exports
+its own and Prometheus sums them.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from django.core.cache.backends.redis import RedisCache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LABELS = ('view', 'method')
+PHASES = ('db', 'cache', 'serialize', 'render')
+DURATION_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """The queries, cache reads and phase durations of one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.cache_hits = self.cache_misses = 0
+        self.durations = dict.fromkeys(PHASES, 0.0)
+
+    def server_timing(self, total: float) -> str:
+        """Return the ``Server-Timing`` header of the request."""
+        descriptions = {
+            'db': f'{self.queries} queries',
+            'cache': f'{self.cache_hits} hits, {self.cache_misses} misses',
+        }
+        timings = [
+            f'{phase};dur={duration * 1000:.1f}'
+            + (f';desc="{descriptions[phase]}"'
+               if phase in descriptions else '')
+            for phase, duration in self.durations.items()]
+        return ', '.join(timings + [f'total;dur={total * 1000:.1f}'])
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    'request_metrics', default=None)
+
+
+def start_request() -> Tuple[RequestMetrics, object]:
+    """Start recording a request, returns its metrics and the token to
+    pass to ``end_request``."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token: object) -> None:
+    """Stop recording the request of ``start_request``."""
+    _current.reset(token)
+
+
+@contextmanager
+def timer(phase: str):
+    """Add the duration of the block to a phase of the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.durations[phase] += time.perf_counter() - start
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """Count the queries of the current request and their duration."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.durations['db'] += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def _record_cache(start: float, hits: int = 0, misses: int = 0) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.durations['cache'] += time.perf_counter() - start
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class InstrumentedRedisCache(RedisCache):
+    """``RedisCache`` recording its calls in the metrics of the current
+    request, a read returning the default is a miss."""
+
+    def get(self, key, default=None, version=None):
+        start = time.perf_counter()
+        value = super().get(key, default, version)
+        hit = value is not default
+        _record_cache(start, hits=hit, misses=not hit)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        start = time.perf_counter()
+        values = super().get_many(keys, version)
+        _record_cache(
+            start, hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def set(self, *args, **kwargs):
+        start = time.perf_counter()
+        super().set(*args, **kwargs)
+        _record_cache(start)
+
+    def add(self, *args, **kwargs):
+        start = time.perf_counter()
+        added = super().add(*args, **kwargs)
+        _record_cache(start)
+        return added
+
+    def set_many(self, *args, **kwargs):
+        start = time.perf_counter()
+        failed = super().set_many(*args, **kwargs)
+        _record_cache(start)
+        return failed
+
+    def delete(self, *args, **kwargs):
+        start = time.perf_counter()
+        deleted = super().delete(*args, **kwargs)
+        _record_cache(start)
+        return deleted
+
+    def delete_many(self, *args, **kwargs):
+        start = time.perf_counter()
+        super().delete_many(*args, **kwargs)
+        _record_cache(start)
+
+    def incr(self, *args, **kwargs):
+        start = time.perf_counter()
+        value = super().incr(*args, **kwargs)
+        _record_cache(start)
+        return value
+
+    def clear(self):
+        """Delete the keys under ``KEY_PREFIX``, flush the whole database
+        like ``RedisCache`` only without a prefix."""
+        if not self.key_prefix:
+            return super().clear()
+        client = self._cache.get_client(write=True)
+        pattern = re.sub(r'([*?\[\]\\])', r'\\\1', self.key_prefix) + ':*'
+        keys = list(client.scan_iter(match=pattern, count=1000))
+        for start in range(0, len(keys), 1000):
+            client.delete(*keys[start:start + 1000])
+        return bool(keys)
+
+
+class Counter:
+    """A Prometheus counter with labels."""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, labels: Tuple, amount: float = 1) -> None:
+        """Add to the counter of a tuple of label values."""
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, Dict, float]]:
+        """Yield the name, labels and value of every sample."""
+        for labels, value in sorted(self._values.items()):
+            yield self.name, dict(zip(self.labels, labels)), value
+
+
+class Histogram:
+    """A Prometheus histogram with labels."""
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Sequence[str],
+            buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        """Add an observation to the histogram of a tuple of label values."""
+        with _lock:
+            counts, total = self._values.get(
+                labels, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[labels] = counts, total + value
+
+    def totals(self, labels: Tuple) -> Tuple[int, float]:
+        """Return the number and the sum of the observations of a tuple
+        of label values."""
+        with _lock:
+            counts, total = self._values.get(labels, ((), 0))
+            return sum(counts), total
+
+    def samples(self) -> Iterable[Tuple[str, Dict, float]]:
+        """Yield the name, labels and value of every sample."""
+        for labels, (counts, total) in sorted(self._values.items()):
+            labels = dict(zip(self.labels, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       {**labels, 'le': str(bound)}, cumulative)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+REQUESTS = Counter(
+    'investment_http_requests_total',
+    'Requests by view, method and status.',
+    LABELS + ('status',))
+REQUEST_DURATION = Histogram(
+    'investment_http_request_duration_seconds',
+    'Time to respond to a request.',
+    LABELS)
+PHASE_DURATION = Histogram(
+    'investment_http_request_phase_seconds',
+    'Time a request spent in the database, the cache, serializing and '
+    'rendering.',
+    LABELS + ('phase',))
+QUERIES = Histogram(
+    'investment_http_request_queries',
+    'SQL queries run by a request.',
+    LABELS,
+    QUERY_BUCKETS)
+CACHE_READS = Counter(
+    'investment_cache_reads_total',
+    'Cache reads of the requests by result.',
+    LABELS + ('result',))
+REGISTRY = (REQUESTS, REQUEST_DURATION, PHASE_DURATION, QUERIES, CACHE_READS)
+
+
+def record_request(
+        view: str,
+        method: str,
+        status: int,
+        duration: float,
+        metrics: RequestMetrics) -> None:
+    """Add a finished request to the totals.
+
+    Args:
+        view (str): The name of the view.
+        method (str): The HTTP method.
+        status (int): The status of the response.
+        duration (float): The seconds it took to respond.
+        metrics (RequestMetrics): The metrics of the request.
+    """
+    labels = (view, method)
+    REQUESTS.inc(labels + (str(status),))
+    REQUEST_DURATION.observe(labels, duration)
+    QUERIES.observe(labels, metrics.queries)
+    for phase, phase_duration in metrics.durations.items():
+        PHASE_DURATION.observe(labels + (phase,), phase_duration)
+    if metrics.cache_hits:
+        CACHE_READS.inc(labels + ('hit',), metrics.cache_hits)
+    if metrics.cache_misses:
+        CACHE_READS.inc(labels + ('miss',), metrics.cache_misses)
+
+
+def render_metrics() -> str:
+    """Return the totals in the Prometheus text format."""
+    lines = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                label_text = ','.join(
+                    f'{label}="{_escape(label_value)}"'
+                    for label, label_value in labels.items())
+                lines.append(f'{name}{{{label_text}}} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace(
+        '"', r'\"').replace('\n', r'\n')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
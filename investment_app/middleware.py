@@ -0,0 +1,70 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Records the queries, cache reads and durations of every request in
+    ``metrics`` per view and method. In DEBUG the response gets a
+    ``Server-Timing`` header with the durations of the request, shown by
+    the network panel of the browsers.
+
+    Works for sync and async views, it must be the first middleware to
+    time the others.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.record(request, response, request_metrics, start)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        request_metrics, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.record(request, response, request_metrics, start)
+
+    def record(
+            self,
+            request: HttpRequest,
+            response: HttpResponse,
+            request_metrics: metrics.RequestMetrics,
+            start: float) -> HttpResponse:
+        """Add the request to the totals and set its Server-Timing."""
+        duration = time.perf_counter() - start
+        metrics.record_request(
+            view_name(request), request.method, response.status_code,
+            duration, request_metrics)
+        if settings.DEBUG:
+            response['Server-Timing'] = request_metrics.server_timing(
+                duration)
+        return response
+
+
+def view_name(request: HttpRequest) -> str:
+    """Return the name of the class or function of the view of a request,
+    ``unmatched`` if no URL matched."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view = getattr(match.func, 'view_class', match.func)
+    return getattr(view, '__name__', match.view_name)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0004_alter_investmentaccount_owner'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-created_at', '-id'], name='transaction_account_keyset'),
+        ),
+    ]
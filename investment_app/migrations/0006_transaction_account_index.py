@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0005_transaction_account_keyset'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='investment_app.investmentaccount'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0006_transaction_account_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('closing_balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('deposits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Withdrawals are -')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='investment_app.investmentaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('account', 'date'), name='balance_snapshot_account_date'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('investment_app', '0007_balance_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Portfolio',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='portfolio', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('acc1_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('acc2_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('acc3_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('account_count', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count, Max, Q, Sum
+
+BALANCE_FIELDS = {
+    'ACC1': 'acc1_balance',
+    'ACC2': 'acc2_balance',
+    'ACC3': 'acc3_balance',
+}
+
+
+def backfill_portfolios(apps, schema_editor):
+    """Create the portfolio of every user owning accounts."""
+    InvestmentAccount = apps.get_model('investment_app', 'InvestmentAccount')
+    Transaction = apps.get_model('investment_app', 'Transaction')
+    Portfolio = apps.get_model('investment_app', 'Portfolio')
+
+    last_activity = dict(Transaction.objects.values(
+        'account__owner_id').annotate(
+            last=Max('created_at')).values_list('account__owner_id', 'last'))
+    rows = InvestmentAccount.objects.values('owner_id').annotate(
+        total_balance=Sum('balance'),
+        account_count=Count('id'),
+        **{field: Sum('balance', filter=Q(account_type=account_type))
+           for account_type, field in BALANCE_FIELDS.items()},
+    ).order_by('owner_id')
+
+    Portfolio.objects.bulk_create([
+        Portfolio(
+            last_activity=last_activity.get(row['owner_id']),
+            **{field: value or 0 for field, value in row.items()})
+        for row in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0008_portfolio'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_portfolios, migrations.RunPython.noop),
+    ]
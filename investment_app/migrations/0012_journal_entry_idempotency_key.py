@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_app', '0011_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journalentry',
+            name='request_id',
+            field=models.CharField(max_length=255),
+        ),
+    ]
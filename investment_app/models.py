@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 
@@ -32,6 +33,10 @@ AccountTypes:
         choices=AccountTypes.choices,
         default=AccountTypes.ACCOUNT_1)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='accounts')
+    # withdrawals accepted into the journal and not applied yet,
+    # the available balance is balance - reserved_balance
+    reserved_balance = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0)
 
     def __str__(self):
         return self.name
@@ -57,4 +62,137 @@ class Transaction(models.Model):
     account = models.ForeignKey(
         InvestmentAccount,
         on_delete=models.CASCADE,
-        related_name='transactions')
+        related_name='transactions',
+        # covered by transaction_account_keyset which starts with account
+        db_index=False)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of an account's history newest first,
+            # also serves date ranges per account in the admin report
+            models.Index(
+                fields=['account', '-created_at', '-id'],
+                name='transaction_account_keyset'),
+        ]
+
+
+class BalanceSnapshot(models.Model):
+    """
+    The closing balance of an account at the end of a day and the totals
+    of the transactions of that day. Days without transactions have no
+    snapshot, the balance carries over from the previous one.
+    """
+    account = models.ForeignKey(
+        InvestmentAccount,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        # covered by balance_snapshot_account_date
+        db_index=False)
+    date = models.DateField()
+    closing_balance = models.DecimalField(max_digits=10, decimal_places=2)
+    deposits = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    withdrawals = models.DecimalField(
+        'Withdrawals are -', max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'date'],
+                name='balance_snapshot_account_date'),
+        ]
+
+
+class Portfolio(models.Model):
+    """
+    The totals of the accounts of a user, kept in sync with every change
+    of the accounts so that they are read as a single row.
+    """
+    owner = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='portfolio')
+    total_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    acc1_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    acc2_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    acc3_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    account_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True)
+
+
+class JournalEntry(models.Model):
+    """
+    A deposit or withdrawal accepted by a journaled account update and
+    applied to the balance later, in batches, by the ``apply_journal``
+    command. Applied and rejected entries are kept, applying one only
+    changes its status.
+    """
+
+    class Statuses(models.TextChoices):
+        PENDING = 'pending'
+        APPLIED = 'applied'
+        REJECTED = 'rejected'
+
+    account = models.ForeignKey(
+        InvestmentAccount,
+        on_delete=models.CASCADE,
+        related_name='journal_entries')
+    transaction_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    amount = models.DecimalField(
+        'Deposit is + and withdraw -',
+        max_digits=10,
+        decimal_places=2)
+    # the Idempotency-Key of the update, a retry returns the same entry
+    request_id = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=10, choices=Statuses.choices, default=Statuses.PENDING)
+    error = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['transaction_by', 'request_id'],
+                name='journal_entry_request_id'),
+        ]
+        indexes = [
+            # the worker and the lag metrics read the pending entries
+            # oldest first
+            models.Index(
+                fields=['status', 'id'], name='journal_entry_status'),
+        ]
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The response to a request sent with an ``Idempotency-Key`` header,
+    returned again for every retry of the request until it expires. Redis
+    keeps a copy of completed responses so that a retry is a single
+    lookup, this is the record of truth.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # a hash of the method, path and data of the request
+    fingerprint = models.CharField(max_length=64)
+    # null while the request is in progress
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'], name='idempotency_record_key'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['expires_at'], name='idempotency_record_expiry'),
+        ]
@@ -0,0 +1,121 @@
+import codecs
+import csv
+import json
+from decimal import Decimal
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+
+# the most movements and bytes a settlement file may hold
+BULK_MAX_ITEMS = getattr(settings, 'BULK_MAX_ITEMS', 100_000)
+BULK_MAX_BYTES = getattr(settings, 'BULK_MAX_BYTES', 10 * 1024 * 1024)
+
+
+class SettlementTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = (
+        f'A settlement file holds at most {BULK_MAX_ITEMS} movements '
+        f'and {BULK_MAX_BYTES} bytes.')
+    default_code = 'settlement_too_large'
+
+
+class _LimitedStream:
+    """Reads a stream, raising ``SettlementTooLarge`` past
+    ``BULK_MAX_BYTES``."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.size += len(data)
+        if self.size > BULK_MAX_BYTES:
+            raise SettlementTooLarge()
+        return data
+
+
+def _lines(stream, parser_context) -> codecs.StreamReader:
+    parser_context = parser_context or {}
+    encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+    return codecs.getreader(encoding)(_LimitedStream(stream))
+
+
+def _check_count(count: int) -> None:
+    if count > BULK_MAX_ITEMS:
+        raise SettlementTooLarge()
+
+
+class MovementCSVParser(BaseParser):
+    """
+    Parses a CSV settlement file with an ``account_id,amount`` header
+    into a list of movements.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Parses the incoming bytestream one row at a time.
+
+        Raises:
+            SettlementTooLarge: Past ``BULK_MAX_ITEMS`` rows or
+                ``BULK_MAX_BYTES`` bytes.
+
+        Returns:
+            list: dicts with the ``line`` number and the raw
+                ``account_id`` and ``amount`` values.
+        """
+        reader = csv.DictReader(_lines(stream, parser_context))
+
+        if not reader.fieldnames or not {
+                'account_id', 'amount'} <= set(reader.fieldnames):
+            raise ParseError(
+                'CSV parse error - header must contain account_id,amount')
+
+        movements = []
+        for count, row in enumerate(reader, start=1):
+            _check_count(count)
+            movements.append({
+                'line': count + 1,
+                'account_id': row['account_id'],
+                'amount': row['amount']})
+        return movements
+
+
+class MovementJSONLinesParser(BaseParser):
+    """
+    Parses a JSON-lines settlement file, one
+    ``{"account_id": .., "amount": ..}`` object per line.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Parses the incoming bytestream one line at a time, a line
+        that is not valid JSON is returned with an ``error``.
+
+        Raises:
+            SettlementTooLarge: Past ``BULK_MAX_ITEMS`` movements or
+                ``BULK_MAX_BYTES`` bytes.
+
+        Returns:
+            list: dicts with the ``line`` number and the raw
+                ``account_id`` and ``amount`` values.
+        """
+        movements = []
+
+        for line, row in enumerate(_lines(stream, parser_context), start=1):
+            if not row.strip():
+                continue
+            _check_count(len(movements) + 1)
+            try:
+                item = json.loads(row, parse_float=Decimal)
+                movements.append({
+                    'line': line,
+                    'account_id': item.get('account_id'),
+                    'amount': item.get('amount')})
+            except (ValueError, AttributeError) as error:
+                movements.append({'line': line, 'error': str(error)})
+
+        return movements
@@ -1,4 +1,68 @@
+from typing import NamedTuple
 from rest_framework import permissions
+from .caching import (
+    ACCOUNT_TIMEOUT,
+    access_cache_key,
+    aget_or_set,
+    aget_version,
+    get_or_set)
+from .models import InvestmentAccount
+
+
+class AccountAccess(NamedTuple):
+    """The fields of an account its permissions depend on."""
+    id: int
+    account_type: str
+    owner_id: int
+
+
+def get_account_access(account_id: int) -> AccountAccess:
+    """
+    Returns the permission record of an account.
+
+    The record is cached under the account's cache version, in memory and
+    in Redis, so a check costs no query on a hit and one indexed lookup
+    of three columns on a miss.
+
+    Args:
+        account_id (int): The ID of the account.
+
+    Returns:
+        AccountAccess: The ID, type and owner of the account.
+
+    Raises:
+        InvestmentAccount.DoesNotExist: If the account does not exist.
+    """
+    account_id = int(account_id)
+    access = get_or_set(
+        access_cache_key(account_id),
+        lambda: _load_access(account_id),
+        ACCOUNT_TIMEOUT,
+        local=True)
+    return AccountAccess(*access)
+
+
+async def aget_account_access(account_id: int) -> AccountAccess:
+    """Async ``get_account_access``."""
+    account_id = int(account_id)
+
+    async def load():
+        return tuple(await InvestmentAccount.objects.values_list(
+            'id', 'account_type', 'owner_id').aget(id=account_id))
+
+    access = await aget_or_set(
+        access_cache_key(
+            account_id, version=await aget_version('account', account_id)),
+        load,
+        ACCOUNT_TIMEOUT,
+        local=True)
+    return AccountAccess(*access)
+
+
+def _load_access(account_id: int) -> tuple:
+    return tuple(InvestmentAccount.objects.values_list(
+        'id', 'account_type', 'owner_id').get(id=account_id))
+
 
 class AccountTypePermission(permissions.BasePermission):
     account_permissions = {
@@ -6,6 +70,11 @@ class AccountTypePermission(permissions.BasePermission):
         'ACC2': ['GET', 'POST', 'PUT', 'DELETE'],
         'ACC3': ['POST']
     }
+    # the allowed (account type, method) pairs, checked on every request
+    allowed = frozenset(
+        (account_type, method)
+        for account_type, methods in account_permissions.items()
+        for method in methods)
 
 
     def has_permission(self, request, view):
@@ -23,8 +92,7 @@ class AccountTypePermission(permissions.BasePermission):
 
         if request.method == 'POST':
             account_type = request.data.get('account_type')
-            allowed_methods = self.account_permissions.get(account_type, [])
-            return request.method in allowed_methods
+            return (account_type, request.method) in self.allowed
         return True
 
     def has_object_permission(self, request, view, obj):
@@ -33,13 +101,29 @@ class AccountTypePermission(permissions.BasePermission):
         Args:
             request: The HTTP request object containing the request method.
             view: The view that is being accessed.
-            obj: The object for which permission is being checked.
+            obj: The account, or its ``AccountAccess`` record, for which
+                permission is being checked.
 
         Returns:
-            bool: True if the request method is allowed 
-            for the object's account type, False otherwise.
+            bool: True if the user owns the account and the request method
+            is allowed for the account's type, False otherwise.
         """
 
-        account_type = obj.account_type
-        allowed_methods = self.account_permissions.get(account_type, [])
-        return request.method in allowed_methods
+        return self.is_method_allowed(request.user, obj, request.method)
+
+    def is_method_allowed(self, user, account, method):
+        """
+        Checks if a user may use a method on an account, the one check
+        of every path that reads or changes an existing account.
+
+        Args:
+            user: The user making the request.
+            account: The account, or its ``AccountAccess`` record.
+            method: The HTTP method, e.g. PUT.
+
+        Returns:
+            bool: True if the user owns the account and the method is
+            allowed for the account's type.
+        """
+        return (account.owner_id == user.id
+                and (account.account_type, method) in self.allowed)
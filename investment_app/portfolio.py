@@ -0,0 +1,88 @@
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .models import InvestmentAccount, Portfolio
+
+BALANCE_FIELDS = {
+    InvestmentAccount.AccountTypes.ACCOUNT_1: 'acc1_balance',
+    InvestmentAccount.AccountTypes.ACCOUNT_2: 'acc2_balance',
+    InvestmentAccount.AccountTypes.ACCOUNT_3: 'acc3_balance',
+}
+# the fields recomputed from the accounts, last_activity is not
+COMPUTED_FIELDS = ('total_balance', *BALANCE_FIELDS.values(), 'account_count')
+
+
+def apply_portfolio_delta(
+        owner_id: int,
+        account_type: str,
+        amount: Decimal = Decimal('0'),
+        accounts: int = 0,
+        create: bool = True) -> None:
+    """Apply the change of an account to the portfolio of its owner.
+
+    A single UPDATE with F expressions, run in the database transaction
+    changing the account so that both commit together. A missing
+    portfolio is rebuilt from the accounts, which already include the
+    change.
+
+    Args:
+        owner_id (int): The ID of the owner of the account.
+        account_type (str): The type of the account.
+        amount (Decimal): The change of the balance of the account.
+        accounts (int): 1 for a new account, -1 for a deleted one.
+        create (bool): Rebuild a missing portfolio, False when deleting
+            as the owner may be deleted too.
+    """
+    changes = {'last_activity': timezone.now()}
+    if amount:
+        changes['total_balance'] = F('total_balance') + amount
+        if field := BALANCE_FIELDS.get(account_type):
+            changes[field] = F(field) + amount
+    if accounts:
+        changes['account_count'] = F('account_count') + accounts
+
+    updated = Portfolio.objects.filter(owner_id=owner_id).update(**changes)
+    if not updated and create:
+        refresh_portfolio(owner_id)
+
+
+def compute_portfolios(
+        owner_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+    """Compute the portfolios of users from their accounts in one query.
+
+    Args:
+        owner_ids (iterable): The IDs of the users, all users owning
+            accounts by default.
+
+    Returns:
+        dict: The values of ``COMPUTED_FIELDS`` by user ID, users
+            without accounts are missing.
+    """
+    accounts = InvestmentAccount.objects.all()
+    if owner_ids is not None:
+        accounts = accounts.filter(owner_id__in=owner_ids)
+
+    rows = accounts.values('owner_id').annotate(
+        total_balance=Sum('balance'),
+        account_count=Count('id'),
+        **{field: Sum('balance', filter=Q(account_type=account_type))
+           for account_type, field in BALANCE_FIELDS.items()},
+    ).order_by('owner_id')
+
+    return {
+        row.pop('owner_id'): {
+            field: Decimal('0') if value is None else value
+            for field, value in row.items()}
+        for row in rows
+    }
+
+
+def refresh_portfolio(owner_id: int) -> Portfolio:
+    """Rebuild the portfolio of a user from the accounts."""
+    values = compute_portfolios([owner_id]).get(owner_id) or {
+        field: 0 for field in COMPUTED_FIELDS}
+    portfolio, _ = Portfolio.objects.update_or_create(
+        owner_id=owner_id,
+        defaults={**values, 'last_activity': timezone.now()})
+    return portfolio
@@ -0,0 +1,57 @@
+"""
+Renderers for the views returning long lists of transactions.
+"""
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from .metrics import timer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Renders JSON with orjson, several times faster than the standard
+    library on large payloads.
+
+    The output has the same values as ``JSONRenderer``'s: datetimes in ISO
+    8601 with ``Z`` for UTC, dates in ISO 8601, non-string keys as strings,
+    ``\\u2028`` and ``\\u2029`` escaped. Decimals and the other types orjson
+    does not know go through DRF's encoder, so decimals are numbers. Only
+    the spelling of some floats differs, e.g. ``1e16`` for ``1e+16``, and
+    NaN and infinities are rendered as null instead of raising.
+
+    Falls back to ``JSONRenderer`` when orjson is not installed, for
+    indented output, for the settings orjson cannot honour and for values
+    orjson rejects, such as integers above 64 bits.
+    """
+    options = orjson and (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON, returning a bytestring.
+        """
+        with timer('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(
+                    accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # the escapes of JSONRenderer, the output is a strict javascript subset
+        return ret.replace(
+            b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+# the renderers of the transaction-heavy views, DRF's defaults
+# with ORJSONRenderer in place of JSONRenderer
+TRANSACTION_RENDERERS = [ORJSONRenderer, BrowsableAPIRenderer]
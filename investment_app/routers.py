@@ -0,0 +1,77 @@
+"""
+Sends the reads of the account view and of the admin report to the read
+replica, the ``replica`` database, when one is configured.
+"""
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connection
+from .caching import arecently_changed, recently_changed
+
+REPLICA = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def replica_reads(scope: str, object_id: int):
+    """
+    Reads from the replica within the block.
+
+    An account or a user changed within ``DATABASE_REPLICA_LAG`` seconds
+    is read from the primary, so a change is never cached from a replica
+    that has not applied it yet, and so are the reads inside a
+    transaction, which must see its writes.
+
+    Args:
+        scope (str): ``account`` or ``user``.
+        object_id (int): The ID of the account or the user read.
+
+    Yields:
+        bool: Whether the reads go to the replica.
+    """
+    use_replica = (
+        _replica_allowed() and not recently_changed(scope, object_id))
+    token = _use_replica.set(use_replica)
+    try:
+        yield use_replica
+    finally:
+        _use_replica.reset(token)
+
+
+@asynccontextmanager
+async def areplica_reads(scope: str, object_id: int):
+    """Async ``replica_reads``, for the async views. The async ORM runs
+    the queries of the block in a thread that gets a copy of its context,
+    so they are routed the same way."""
+    use_replica = (
+        _replica_allowed()
+        and not await arecently_changed(scope, object_id))
+    token = _use_replica.set(use_replica)
+    try:
+        yield use_replica
+    finally:
+        _use_replica.reset(token)
+
+
+def _replica_allowed() -> bool:
+    return REPLICA in settings.DATABASES and not connection.in_atomic_block
+
+
+class ReplicaRouter:
+    """Routes the reads inside ``replica_reads`` to the replica, everything
+    else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if _use_replica.get() else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica is migrated by replication
+        return db != REPLICA
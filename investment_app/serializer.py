@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from .models import InvestmentAccount, Transaction
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer, TokenRefreshSerializer)
+from .models import InvestmentAccount, JournalEntry, Transaction
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from .authentication import ClaimsRefreshToken
+from .ledger import apply_balance_change
 
 
 
@@ -11,6 +16,7 @@ class InvestmentAccountSerializer(serializers.ModelSerializer):
     class Meta:
         model = InvestmentAccount
         fields = '__all__'
+        read_only_fields = ['reserved_balance']
 
     def create(self, validated_data):
         """Create a new investment account with validated data.
@@ -36,24 +42,30 @@ class InvestmentAccountSerializer(serializers.ModelSerializer):
     
     def update(self, instance, validated_data):
         """Update an investment account instance with validated data.
+
+        A ``balance`` value is a deposit (+) or withdrawal (-) and is applied
+        atomically through ``apply_balance_change``, which also records the
+        transaction for the user in the serializer context's request.
+
         Args:
             instance (InvestmentAccount): The investment account instance to be updated.
 
         Returns:
             InvestmentAccount: The updated investment account instance.
 
+        Raises:
+            serializers.ValidationError: If the withdrawal exceeds the balance.
         """
+        amount = validated_data.pop('balance', None)
         for key, value in validated_data.items():
-            if key == 'balance':
-                new_balance = instance.balance + value
-                if new_balance < 0:
-                    raise serializers.ValidationError(
-                'Withdrawal amount exceeds the available balance.')
-                instance.balance = new_balance
-            else:
-                setattr(instance, key, value)
-        
-        instance.save()
+            setattr(instance, key, value)
+
+        with transaction.atomic():
+            if validated_data:
+                instance.save(update_fields=list(validated_data))
+            if amount:
+                apply_balance_change(
+                    instance, amount, self.context['request'].user)
         return instance
 
 
@@ -81,12 +93,26 @@ class UserSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
     
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+
 class TransactionSeializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
 
 
+class JournalEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JournalEntry
+        exclude = ['error', 'applied_at']
+
+
 class DateSerialializer(serializers.Serializer):
     start_date = serializers.DateField()
     end_date = serializers.DateField()
@@ -101,4 +127,29 @@ class DateSerialializer(serializers.Serializer):
         if end_date and end_date > start_date:
             raise serializers.ValidationError("End date cannot be after the start date.")
         
-        return data
\ No newline at end of file
+        return data
+
+
+class PaginationSerializer(serializers.Serializer):
+    page_size = serializers.IntegerField(
+        min_value=1, max_value=500, default=50)
+    cursor = serializers.CharField(required=False)
+
+
+class BalanceQuerySerializer(serializers.Serializer):
+    date = serializers.DateField(required=False)
+    at = serializers.DateTimeField(required=False)
+    since = serializers.DateField(required=False)
+
+    def validate(self, data):
+        """
+        Ensure that the history does not start after the date.
+        """
+        since = data.get('since')
+        day = data.get('date')
+
+        if since and day and since > day:
+            raise serializers.ValidationError(
+                "since cannot be after the date.")
+
+        return data
@@ -1,6 +1,13 @@
+from django.contrib.auth.models import User
 from django.dispatch import receiver, Signal
 from .models import Transaction, InvestmentAccount
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
+from .ledger import get_transaction_type
+from .caching import bump_auth_versions, bump_versions
+from .snapshots import record_movements
+from .portfolio import apply_portfolio_delta, refresh_portfolio
+from django.utils import timezone
+from decimal import Decimal
 
 
 account_changed = Signal(["amount", "user", "instance"])
@@ -11,14 +18,102 @@ def create_transaction(sender, amount, user, instance, **kwargs):
     """
     Creates a new transaction whenever the account balance changes.
     The amount indicates the change, and the user is the one making the change.
+
+    This only records the row and the first balance snapshot, it is used
+    for the opening balance of a new account. Changes to an existing
+    balance go through ``ledger.apply_balance_change`` which updates and
+    records atomically.
     """
-    transaction_type = 'Withdrawal' if amount < 0 else 'Deposit'
-    
-    
-    Transaction.objects.create(
-        transaction_type=transaction_type,
+    created = Transaction.objects.create(
+        transaction_type=get_transaction_type(amount),
         amount=amount,
         transaction_by=user,
         account=instance
     )
+    record_movements(
+        instance.id, instance.balance, [Decimal(str(amount))],
+        timezone.localdate(created.created_at))
+
+
+# saves that may change the totals of the portfolio of the owner
+PORTFOLIO_FIELDS = {'balance', 'account_type', 'owner'}
+
+
+@receiver(pre_save, sender=InvestmentAccount)
+def remember_previous_owner(sender, instance, update_fields=None, **kwargs):
+    """
+    Remembers the owner of an account moved to another user, so that
+    the portfolios of both users are rebuilt.
+    """
+    if instance.pk and (update_fields is None or 'owner' in update_fields):
+        instance._previous_owner_id = InvestmentAccount.objects.filter(
+            pk=instance.pk).values_list('owner_id', flat=True).first()
+
 
+@receiver(post_save, sender=InvestmentAccount)
+def update_portfolio(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keeps the portfolio of the owner in sync with a saved account.
+
+    A new account is added to it, a save changing the balance, the type
+    or the owner rebuilds the portfolios involved, any other save only
+    records the activity. Balance movements go through the ledger which
+    updates the portfolio itself.
+    """
+    if created:
+        apply_portfolio_delta(
+            instance.owner_id, instance.account_type,
+            instance.balance, accounts=1)
+    elif update_fields is None or PORTFOLIO_FIELDS & set(update_fields):
+        refresh_portfolio(instance.owner_id)
+        previous = getattr(instance, '_previous_owner_id', None)
+        if previous and previous != instance.owner_id:
+            refresh_portfolio(previous)
+    else:
+        apply_portfolio_delta(instance.owner_id, instance.account_type)
+
+
+@receiver(post_delete, sender=InvestmentAccount)
+def remove_from_portfolio(sender, instance, **kwargs):
+    """
+    Removes a deleted account from the portfolio of its owner, unless
+    the owner is being deleted too.
+    """
+    apply_portfolio_delta(
+        instance.owner_id, instance.account_type,
+        -instance.balance, accounts=-1, create=False)
+
+
+@receiver(post_save, sender=InvestmentAccount)
+@receiver(post_delete, sender=InvestmentAccount)
+def invalidate_account_caches(sender, instance, created=False, **kwargs):
+    """
+    Invalidates the cached views of an account and of its owner
+    whenever the account is created, saved or deleted.
+
+    A new account is invalidated right away, nothing can be cached for
+    it but what was cached for a rolled back account with the same ID.
+    """
+    bump_versions([instance.id], [instance.owner_id], defer=not created)
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_transaction_caches(sender, instance, **kwargs):
+    """
+    Invalidates the cached views of the account of a new transaction.
+
+    There is no post_delete receiver: transactions are only deleted with
+    their account, which is covered above, and a receiver would stop
+    Django from deleting an account's history in a single query.
+    """
+    bump_versions([instance.account_id], [instance.account.owner_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_caches(sender, instance, **kwargs):
+    """
+    Invalidates the cached authentication record of a user whenever the
+    user is saved or deleted, e.g. deactivated or made staff.
+    """
+    bump_auth_versions([instance.id])
@@ -0,0 +1,154 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, List, Tuple, Union
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import BalanceSnapshot, InvestmentAccount, Transaction
+
+
+def record_movements(
+        account_id: int,
+        closing_balance: Decimal,
+        amounts: List[Decimal],
+        day: date) -> None:
+    """Add movements to the snapshot of an account for a day.
+
+    Runs in the database transaction that changed the balance, after the
+    change: the account row is locked until commit, so the snapshots of
+    an account are never written concurrently.
+
+    Args:
+        account_id (int): The ID of the account.
+        closing_balance (Decimal): The balance after the movements.
+        amounts (list): Deposits are + and withdrawals -.
+        day (date): The day of the movements.
+    """
+    deposits = sum((amount for amount in amounts if amount > 0), Decimal('0'))
+    withdrawals = sum(
+        (amount for amount in amounts if amount < 0), Decimal('0'))
+
+    updated = BalanceSnapshot.objects.filter(
+        account_id=account_id, date=day,
+    ).update(
+        closing_balance=closing_balance,
+        deposits=F('deposits') + deposits,
+        withdrawals=F('withdrawals') + withdrawals,
+        count=F('count') + len(amounts))
+    if not updated:
+        BalanceSnapshot.objects.create(
+            account_id=account_id,
+            date=day,
+            closing_balance=closing_balance,
+            deposits=deposits,
+            withdrawals=withdrawals,
+            count=len(amounts))
+
+
+def closing_balance(account_id: int, day: date) -> Decimal:
+    """Return the balance of an account at the end of a day.
+
+    A single lookup of the last snapshot up to the day, an account
+    without transactions by then had a balance of 0.
+    """
+    balance = BalanceSnapshot.objects.filter(
+        account_id=account_id, date__lte=day,
+    ).order_by('-date').values_list('closing_balance', flat=True).first()
+    return Decimal('0.00') if balance is None else balance
+
+
+def balance_at(account_id: int, moment: Union[date, datetime]) -> Decimal:
+    """Return the balance of an account at the end of a day or at a moment.
+
+    For a moment within a day the transactions of that day up to the
+    moment are replayed on top of the closing balance of the day before.
+
+    Args:
+        account_id (int): The ID of the account.
+        moment (date | datetime): A day, or a moment, naive moments are
+            in the current time zone.
+
+    Returns:
+        Decimal: The balance.
+    """
+    if not isinstance(moment, datetime):
+        return closing_balance(account_id, moment)
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    day = timezone.localdate(moment)
+    start_of_day = timezone.make_aware(datetime.combine(day, time.min))
+    tail = Transaction.objects.filter(
+        account_id=account_id,
+        created_at__gte=start_of_day,
+        created_at__lte=moment,
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    return closing_balance(account_id, day - timedelta(days=1)) + tail
+
+
+def balance_history(account_id: int, start: date, end: date) -> Dict:
+    """Return the daily balances of an account between two days.
+
+    Args:
+        account_id (int): The ID of the account.
+        start (date): The first day.
+        end (date): The last day.
+
+    Returns:
+        dict: The ``opening_balance`` before the first day and the
+            snapshots of the ``days`` with transactions, oldest first.
+    """
+    days = BalanceSnapshot.objects.filter(
+        account_id=account_id, date__gte=start, date__lte=end,
+    ).order_by('date').values(
+        'date', 'closing_balance', 'deposits', 'withdrawals', 'count')
+    return {
+        'opening_balance': closing_balance(
+            account_id, start - timedelta(days=1)),
+        'days': list(days),
+    }
+
+
+def rebuild_snapshots(account_id: int) -> Tuple[int, Decimal]:
+    """Recompute the snapshots of an account from its transactions.
+
+    The closing balances are replayed backwards from the current balance,
+    so the latest snapshot always matches the account. The account row
+    is locked meanwhile so that no transaction is missed.
+
+    Args:
+        account_id (int): The ID of the account.
+
+    Returns:
+        tuple: The number of snapshots and the part of the opening balance
+            that the transactions do not explain, 0 for a consistent
+            account.
+    """
+    with transaction.atomic():
+        balance = InvestmentAccount.objects.select_for_update().values_list(
+            'balance', flat=True).get(id=account_id)
+        days = Transaction.objects.filter(account_id=account_id).annotate(
+            day=TruncDate('created_at'),
+        ).values('day').annotate(
+            deposits=Sum('amount', filter=Q(amount__gt=0)),
+            withdrawals=Sum('amount', filter=Q(amount__lt=0)),
+            count=Count('id'),
+        ).order_by('-day')
+
+        snapshots = []
+        for row in days:
+            deposits = row['deposits'] or Decimal('0')
+            withdrawals = row['withdrawals'] or Decimal('0')
+            snapshots.append(BalanceSnapshot(
+                account_id=account_id,
+                date=row['day'],
+                closing_balance=balance,
+                deposits=deposits,
+                withdrawals=withdrawals,
+                count=row['count']))
+            balance -= deposits + withdrawals
+
+        BalanceSnapshot.objects.filter(account_id=account_id).delete()
+        BalanceSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots), balance
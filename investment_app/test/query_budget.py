@@ -0,0 +1,136 @@
+"""
+Query budgets: the maximum number of SQL queries a request may run,
+whatever the volume of data behind it.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Awaitable, Callable, List, NamedTuple
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from ..caching import local_cache
+from ..models import InvestmentAccount, Transaction
+from ..portfolio import refresh_portfolio
+
+# (accounts, transactions) of the user a request is measured on
+VOLUMES = [
+    (1, 10), (1, 1000), (10, 10), (10, 1000), (100, 10), (100, 1000)]
+
+
+class Volume(NamedTuple):
+    """A user owning a volume of data, and its access token."""
+    user: User
+    accounts: List[InvestmentAccount]
+    token: str
+
+
+def seed_volume(accounts: int, transactions: int) -> Volume:
+    """Create a user with ``accounts`` accounts of type 2 and
+    ``transactions`` transactions spread over them, one a minute until
+    now."""
+    user = User.objects.create_user(
+        username=f'volume_{User.objects.count()}', password='password')
+    created = InvestmentAccount.objects.bulk_create([
+        InvestmentAccount(
+            name=f'Account {i}', account_type='ACC2', owner=user,
+            balance=1_000_000)
+        for i in range(accounts)])
+    now = timezone.now()
+    Transaction.objects.bulk_create([
+        Transaction(
+            account=created[i % accounts],
+            transaction_by=user,
+            transaction_type='Deposit',
+            amount=10,
+            created_at=now - timedelta(minutes=i))
+        for i in range(transactions)])
+    refresh_portfolio(user.id)
+    return Volume(user, created, str(AccessToken.for_user(user)))
+
+
+class QueryBudgetMixin:
+    """Assertions on the number of queries of a ``TestCase``."""
+    volumes = VOLUMES
+
+    @contextmanager
+    def assertMaxQueries(self, budget: int, using: str = DEFAULT_DB_ALIAS):
+        """Fail if the block runs more than ``budget`` queries, listing
+        them."""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        self.assertLessEqual(
+            len(context), budget,
+            '\n'.join(query['sql'] for query in context.captured_queries))
+
+    def assertQueryBudget(
+            self,
+            request: Callable[[Volume], object],
+            budget: int,
+            status_code: int = 200) -> None:
+        """Fail if a request runs more than ``budget`` queries on any of
+        the ``volumes``, or a different number on different volumes.
+
+        The request runs on a cold cache and a streamed response is
+        consumed within the budget.
+
+        Args:
+            request (callable): Sends the request for a ``Volume`` and
+                returns the response.
+            budget (int): The maximum number of queries.
+            status_code (int): The expected status of the response.
+        """
+        counts = {}
+        for accounts, transactions in self.volumes:
+            volume = self._cold_volume(accounts, transactions)
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+                response = request(volume)
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+            counts[accounts, transactions] = self._check_budget(
+                context, response, budget, status_code)
+        self._check_scaling(counts)
+
+    async def aassertQueryBudget(
+            self,
+            request: Callable[[Volume], Awaitable],
+            budget: int,
+            status_code: int = 200) -> None:
+        """``assertQueryBudget`` of a coroutine sending a request to an
+        async view."""
+        counts = {}
+        for accounts, transactions in self.volumes:
+            volume = await sync_to_async(self._cold_volume)(
+                accounts, transactions)
+            # entering the context connects to the database
+            context = CaptureQueriesContext(connections[DEFAULT_DB_ALIAS])
+            await sync_to_async(context.__enter__)()
+            try:
+                response = await request(volume)
+            finally:
+                await sync_to_async(context.__exit__)(None, None, None)
+            counts[accounts, transactions] = self._check_budget(
+                context, response, budget, status_code)
+        self._check_scaling(counts)
+
+    def _cold_volume(self, accounts: int, transactions: int) -> Volume:
+        volume = seed_volume(accounts, transactions)
+        cache.clear()
+        local_cache.clear()
+        return volume
+
+    def _check_budget(self, context, response, budget, status_code) -> int:
+        self.assertEqual(
+            response.status_code, status_code, getattr(response, 'data', None))
+        self.assertLessEqual(
+            len(context), budget,
+            '\n'.join(query['sql'] for query in context.captured_queries))
+        return len(context)
+
+    def _check_scaling(self, counts: dict) -> None:
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'the number of queries grows with the data: {counts}')
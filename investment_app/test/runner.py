@@ -0,0 +1,24 @@
+from django.core.cache import cache
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from ..caching import isolated_caches
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    """Runs the tests under a cache key prefix of their own.
+
+    The tests clear the cache, which would flush the Redis server of the
+    developer and race the keys of concurrent runs. Under the prefix they
+    only read and clear their own keys, which are deleted after the run.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_settings = override_settings(
+            CACHES=isolated_caches('test'))
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        cache.clear()
+        self._cache_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,4 @@
+import json
 from django.urls import reverse
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
@@ -85,3 +86,157 @@ class AdminViewTest(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AdminReportQueriesTest(APITestCase):
+
+    def setUp(self):
+        """Set up a user with several accounts and transactions."""
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username='admin', password='password')
+        self.regular_user = User.objects.create_user(
+            username='user', password='password')
+        self.client.force_authenticate(user=self.admin_user)
+        self.url = reverse('view-user-accounts', args=[self.regular_user.id])
+
+    def add_accounts(self, count):
+        """Create accounts of alternating types with two transactions each."""
+        for i in range(count):
+            account = InvestmentAccount.objects.create(
+                name=f'Account {i}',
+                account_type='ACC1' if i % 2 else 'ACC2',
+                owner=self.regular_user,
+                balance=100)
+            for amount in (100, -40):
+                Transaction.objects.create(
+                    account=account,
+                    transaction_type='Deposit' if amount > 0 else 'Withdrawal',
+                    amount=amount,
+                    transaction_by=self.regular_user)
+
+    def test_query_count_does_not_grow_with_accounts(self):
+        """Test that the report costs the same queries for 1 or 10 accounts."""
+        self.add_accounts(1)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'end_date': '2024-07-31'})
+        self.assertEqual(len(response.data['transactions']), 2)
+
+        self.add_accounts(9)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'end_date': '2024-07-31'})
+        self.assertEqual(len(response.data['transactions']), 20)
+        self.assertEqual(response.data['total_balance'], 1000)
+        self.assertEqual(
+            {transaction['account_type']
+             for transaction in response.data['transactions']},
+            {'ACC1', 'ACC2'})
+
+    def test_date_filter_is_applied(self):
+        """Test that transactions outside the date range are excluded."""
+        self.add_accounts(2)
+        Transaction.objects.filter(amount__lt=0).update(
+            created_at='2024-01-01T10:00:00Z')
+
+        response = self.client.get(self.url, {'end_date': '2024-07-31'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['transactions']), 2)
+        self.assertTrue(all(
+            transaction['amount'] > 0
+            for transaction in response.data['transactions']))
+
+    def test_daily_totals(self):
+        """Test the per day and account type aggregates."""
+        self.add_accounts(3)
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                self.url, {'end_date': '2024-07-31', 'group_by': 'day'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = {
+            row['account_type']: (row['total'], row['count'])
+            for row in response.data['daily_totals']}
+        self.assertEqual(totals, {'ACC1': (60, 2), 'ACC2': (120, 4)})
+
+    def test_invalid_group_by(self):
+        """Test that an unknown group_by is rejected."""
+        response = self.client.get(self.url, {'group_by': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AdminExportViewTest(APITestCase):
+
+    def setUp(self):
+        """Set up a user with transactions on two accounts."""
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username='admin', password='password')
+        self.regular_user = User.objects.create_user(
+            username='user', password='password')
+        self.client.force_authenticate(user=self.admin_user)
+        self.url = reverse(
+            'export-user-transactions', args=[self.regular_user.id])
+
+        self.accounts = []
+        for account_type, amount in (('ACC1', 500), ('ACC2', -20)):
+            account = InvestmentAccount.objects.create(
+                name=account_type, account_type=account_type,
+                owner=self.regular_user, balance=1000)
+            Transaction.objects.create(
+                account=account,
+                transaction_type='Deposit' if amount > 0 else 'Withdrawal',
+                amount=amount,
+                transaction_by=self.regular_user)
+            self.accounts.append(account)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        """Test that the ledger is streamed as CSV with a header."""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.read(response).splitlines()
+        self.assertEqual(
+            lines[0],
+            'id,transaction_by_id,transaction_type,created_at,'
+            'amount,account_id,account_type')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(
+            lines[1].endswith(f',500.00,{self.accounts[0].id},ACC1'))
+
+    def test_ndjson_export(self):
+        """Test that the ledger is streamed as one JSON object per line."""
+        response = self.client.get(self.url, {'output': 'ndjson'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(
+            [(row['amount'], row['account_type']) for row in rows],
+            [('500.00', 'ACC1'), ('-20.00', 'ACC2')])
+
+    def test_date_filter(self):
+        """Test that the export honours the date range."""
+        Transaction.objects.filter(amount__lt=0).update(
+            created_at='2024-01-01T10:00:00Z')
+        response = self.client.get(
+            self.url, {'output': 'ndjson', 'end_date': '2024-07-31'})
+
+        self.assertEqual(len(self.read(response).splitlines()), 1)
+
+    def test_invalid_requests(self):
+        """Test invalid output, unknown users and non admin users."""
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(
+            reverse('export-user-transactions', args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.regular_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
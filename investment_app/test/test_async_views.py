@@ -0,0 +1,197 @@
+import json
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from ..caching import async_redis_client, local_cache
+from ..models import InvestmentAccount, Transaction
+from ..routers import REPLICA, ReplicaRouter
+from .test_routers import REPLICA_DATABASES
+
+
+class AsyncViewTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.admin = User.objects.create_superuser(
+            username='admin', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2', owner=self.user,
+            balance=1000)
+        for amount in (500, -200, 300):
+            Transaction.objects.create(
+                account=self.account, amount=amount,
+                transaction_type='Deposit' if amount > 0 else 'Withdrawal',
+                transaction_by=self.user)
+
+    async def get(self, name: str, object_id: int, user: User = None,
+                  token: str = None, **params):
+        """Request an async view with the access token of a user."""
+        if user is not None:
+            token = str(AccessToken.for_user(user))
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        try:
+            return await self.async_client.get(
+                reverse(name, args=[object_id]), params, headers=headers)
+        finally:
+            # the connections of the client are bound to the event loop
+            # of the test, which is closed after it
+            await async_redis_client().aclose()
+
+    @sync_to_async
+    def sync_response(self, name: str, object_id: int, user: User, **params):
+        """Return the response of the synchronous view."""
+        return json.loads(
+            self.sync_get(name, object_id, user, **params).content)
+
+    def sync_get(self, name: str, object_id: int, user: User = None,
+                 **params):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user=user)
+        return client.get(reverse(name, args=[object_id]), params)
+
+
+class AsyncAccountViewTest(AsyncViewTestCase):
+
+    async def test_same_response_as_sync_view(self):
+        response = await self.get(
+            'async-view-account', self.account.id, self.user, page_size=2)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await self.sync_response(
+            'view-account', self.account.id, self.user, page_size=2)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(len(expected['transcations']), 2)
+
+    async def test_next_page(self):
+        first = json.loads((await self.get(
+            'async-view-account', self.account.id, self.user,
+            page_size=2)).content)
+        second = json.loads((await self.get(
+            'async-view-account', self.account.id, self.user,
+            page_size=2, cursor=first['next_cursor'])).content)
+
+        self.assertEqual(len(second['transcations']), 1)
+        self.assertIsNone(second['next_cursor'])
+
+    async def test_requires_a_token(self):
+        response = await self.get('async-view-account', self.account.id)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('detail', json.loads(response.content))
+
+    async def test_rejects_an_invalid_token(self):
+        response = await self.get(
+            'async-view-account', self.account.id, token='invalid')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_account_type_permission(self):
+        account = await InvestmentAccount.objects.acreate(
+            name='Account 3', account_type='ACC3', owner=self.user)
+        response = await self.get('async-view-account', account.id, self.user)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(
+            json.loads(response.content),
+            {'error': 'You do not have permission to perform this action.'})
+
+    async def test_other_users_accounts_are_denied(self):
+        response = await self.get(
+            'async-view-account', self.account.id, self.admin)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_missing_account(self):
+        response = await self.get('async-view-account', 0, self.user)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_invalid_page_size(self):
+        response = await self.get(
+            'async-view-account', self.account.id, self.user, page_size=0)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncAdminViewTest(AsyncViewTestCase):
+
+    async def test_same_response_as_sync_view(self):
+        response = await self.get(
+            'async-view-user-accounts', self.user.id, self.admin)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await self.sync_response(
+            'view-user-accounts', self.user.id, self.admin)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(len(expected['transactions']), 3)
+
+    async def test_daily_totals(self):
+        response = await self.get(
+            'async-view-user-accounts', self.user.id, self.admin,
+            group_by='day')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = json.loads(response.content)['daily_totals']
+        self.assertEqual([row['count'] for row in totals], [3])
+
+    async def test_admins_only(self):
+        response = await self.get(
+            'async-view-user-accounts', self.user.id, self.user)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIn('detail', json.loads(response.content))
+
+    async def test_missing_user(self):
+        response = await self.get('async-view-user-accounts', 0, self.admin)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_same_errors_as_sync_view(self):
+        failures = [
+            (self.user.id, None, {}),
+            (self.user.id, self.user, {}),
+            (0, self.admin, {}),
+            ('abc', self.admin, {}),
+            (self.user.id, self.admin, {'group_by': 'week'}),
+            (self.user.id, self.admin, {'end_date': 'never'}),
+        ]
+        for user_id, user, params in failures:
+            with self.subTest(user_id=user_id, params=params):
+                response = await self.get(
+                    'async-view-user-accounts', user_id, user, **params)
+                expected = await sync_to_async(self.sync_get)(
+                    'view-user-accounts', user_id, user, **params)
+
+                self.assertGreaterEqual(response.status_code, 400)
+                self.assertEqual(
+                    response.status_code, expected.status_code)
+                self.assertEqual(
+                    json.loads(response.content),
+                    json.loads(expected.content))
+
+    @override_settings(DATABASES=REPLICA_DATABASES)
+    async def test_reads_use_the_replica_routing(self):
+        routed = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            routed.append(db_for_read(router, model, **hints))
+            return None
+
+        with patch.object(ReplicaRouter, 'db_for_read', record):
+            response = await self.get(
+                'async-view-user-accounts', self.user.id, self.admin,
+                group_by='day')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(REPLICA, routed)
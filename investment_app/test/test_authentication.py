@@ -0,0 +1,152 @@
+from decimal import Decimal
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from ..caching import async_redis_client, local_cache
+from ..models import InvestmentAccount
+
+
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2', owner=self.user,
+            balance=Decimal('100.00'))
+        self.url = reverse('view-account', args=[self.account.id])
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def save(self, user: User, **fields):
+        """Save a user, running the invalidation after the commit."""
+        for field, value in fields.items():
+            setattr(user, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    def test_cached_read_runs_no_query(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_fields_are_loaded_on_access(self):
+        self.client.get(self.url)
+        response = self.client.post(
+            reverse('create-account'),
+            {'name': 'Account 2.1', 'account_type': 'ACC2', 'balance': 10},
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        account = InvestmentAccount.objects.get(id=response.data['id'])
+        self.assertEqual(account.owner.username, 'user')
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.url)
+        self.save(self.user, is_active=False)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_change_is_seen(self):
+        url = reverse('view-user-accounts', args=[self.user.id])
+        self.assertEqual(
+            self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.save(self.user, is_staff=True)
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    async def test_async_view_reads_the_cached_user(self):
+        url = reverse('async-view-account', args=[self.account.id])
+        token = AccessToken.for_user(self.user)
+        headers = {'Authorization': f'Bearer {token}'}
+        try:
+            response = await self.async_client.get(url, headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            await sync_to_async(self.save)(self.user, is_active=False)
+            response = await self.async_client.get(url, headers=headers)
+        finally:
+            # the connections of the client are bound to the event loop
+            # of the test, which is closed after it
+            await async_redis_client().aclose()
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@patch('investment_app.authentication.TRUST_TOKEN_CLAIMS', True)
+class TokenClaimsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password', is_staff=True)
+
+    def login(self) -> dict:
+        return self.client.post(reverse('login'), {
+            'username': 'user', 'password': 'password'}, format='json').data
+
+    def test_login_embeds_the_claims(self):
+        access = AccessToken(self.login()['access'])
+
+        self.assertIs(access['is_active'], True)
+        self.assertIs(access['is_staff'], True)
+
+    def test_trusted_claims_need_no_lookup(self):
+        access = self.login()['access']
+        cache.clear()
+        local_cache.clear()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('cache-stats'), HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_refresh_reads_the_claims_again(self):
+        refresh = self.login()['refresh']
+        self.user.is_staff = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        response = self.client.post(
+            reverse('token_refresh'), {'refresh': refresh}, format='json')
+
+        self.assertIs(AccessToken(response.data['access'])['is_staff'], False)
+
+    def test_refresh_of_an_inactive_user_fails(self):
+        refresh = self.login()['refresh']
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        response = self.client.post(
+            reverse('token_refresh'), {'refresh': refresh}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_without_claims_falls_back_to_the_cache(self):
+        response = self.client.get(
+            reverse('cache-stats'),
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
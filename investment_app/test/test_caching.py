@@ -0,0 +1,245 @@
+import threading
+import time
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.test import APIClient
+from ..caching import (
+    bump_versions,
+    cache_set,
+    get_or_set,
+    get_version,
+    invalidation_channel,
+    local_cache,
+    redis_client,
+    start_listener,
+    version_key)
+from ..local_cache import LocalCache
+from .. import codec
+from ..models import InvestmentAccount
+from ..views import AccountView
+
+
+class VersionTest(TestCase):
+    """Writes bump versions on commit, TestCase never commits so the
+    tests run the on commit callbacks explicitly."""
+
+    def test_bump_increments_version(self):
+        version = get_version('account', 'test-bump')
+        bump_versions(account_ids=['test-bump'], defer=False)
+        self.assertGreater(get_version('account', 'test-bump'), version)
+
+    def test_saving_an_account_bumps_account_and_owner(self):
+        user = User.objects.create_user(username='user', password='password')
+        account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=user)
+        versions = (get_version('account', account.id),
+                    get_version('user', user.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            account.name = 'Renamed'
+            account.save()
+
+        self.assertGreater(get_version('account', account.id), versions[0])
+        self.assertGreater(get_version('user', user.id), versions[1])
+
+
+class ClearTest(TestCase):
+    def test_clear_deletes_only_the_keys_of_the_prefix(self):
+        self.assertTrue(cache.key_prefix)
+        redis_client().set('outside-the-prefix', 1)
+        cache.set('inside-the-prefix', 1)
+        try:
+            cache.clear()
+
+            self.assertIsNone(cache.get('inside-the-prefix'))
+            self.assertEqual(redis_client().get('outside-the-prefix'), b'1')
+        finally:
+            redis_client().delete('outside-the-prefix')
+
+
+class LocalCacheTest(TestCase):
+
+    def test_evicts_least_recently_used_by_size(self):
+        local = LocalCache(max_bytes=100, timeout=60)
+        local.set('a', 'a', size=40)
+        local.set('b', 'b', size=40)
+        local.get('a')
+        local.set('c', 'c', size=40)
+
+        self.assertEqual(local.get('a'), 'a')
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('c'), 'c')
+        self.assertEqual(local.stats()['bytes'], 80)
+        self.assertEqual(local.stats()['evictions'], 1)
+
+    def test_values_larger_than_the_cache_are_skipped(self):
+        local = LocalCache(max_bytes=100, timeout=60)
+        local.set('a', 'x' * 200)
+        self.assertIsNone(local.get('a'))
+
+    def test_entries_expire(self):
+        local = LocalCache(max_bytes=100, timeout=0)
+        local.set('a', 'a', size=1)
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(local.stats()['misses'], 1)
+
+    def test_write_after_invalidation_is_skipped(self):
+        local = LocalCache(max_bytes=100, timeout=60)
+        generation = local.generation
+        local.delete_many(['a'])
+        local.set('a', 'stale', size=1, generation=generation)
+        self.assertIsNone(local.get('a'))
+
+    def test_version_is_dropped_on_message_from_another_process(self):
+        start_listener()
+        key = version_key('account', 'test-pubsub')
+        # the listener clears the cache once subscribed
+        deadline = time.monotonic() + 2
+        while redis_client().pubsub_numsub(invalidation_channel())[0][1] < 1:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        while local_cache.get(key) is None:
+            self.assertLess(time.monotonic(), deadline)
+            get_version('account', 'test-pubsub')
+
+        redis_client().publish(invalidation_channel(), f'other|{key}')
+        while local_cache.get(key) is not None:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+
+class GetOrSetTest(TestCase):
+    key = 'test:get-or-set'
+
+    def setUp(self):
+        cache.delete_many([self.key, f'{self.key}:lock'])
+
+    def test_concurrent_misses_compute_once(self):
+        """A burst of readers on a missing key runs the computation in a
+        single worker, the others wait for its value."""
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        readers = [
+            threading.Thread(
+                target=lambda: results.append(
+                    get_or_set(self.key, compute, 60)))
+            for _ in range(10)
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 10)
+
+    def test_fresh_value_is_not_recomputed(self):
+        cache_set(self.key, 'cached', 60)
+        self.assertEqual(get_or_set(self.key, lambda: 'computed', 60), 'cached')
+
+    def test_expired_value_is_refreshed(self):
+        cache.set(self.key, (time.time() - 1, 0, codec.dumps('cached')), timeout=60)
+        self.assertEqual(
+            get_or_set(self.key, lambda: 'computed', 60), 'computed')
+        self.assertEqual(get_or_set(self.key, lambda: 'again', 60), 'computed')
+
+    def test_refresh_in_progress_serves_cached_value(self):
+        cache.set(self.key, (time.time() - 1, 0, codec.dumps('cached')), timeout=60)
+        cache.add(f'{self.key}:lock', 1)
+        self.assertEqual(get_or_set(self.key, lambda: 'computed', 60), 'cached')
+
+
+class AccountCacheTest(TransactionTestCase):
+    """Runs with real commits, the versions are bumped on commit."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.admin = User.objects.create_superuser(
+            username='admin', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def get_account(self):
+        return self.client.get(reverse('view-account', args=[self.account.id]))
+
+    def get_report(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(
+            reverse('view-user-accounts', args=[self.user.id]))
+        self.client.force_authenticate(user=self.user)
+        return response
+
+    def test_read_after_write_is_a_fresh_cache_hit(self):
+        """The put writes the new page through, the next read does not
+        rebuild it and sees the deposit."""
+        self.assertEqual(self.get_account().data['account']['balance'], '0.00')
+
+        response = self.client.put(
+            reverse('update-account', args=[self.account.id]),
+            {'balance': 250}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with patch.object(
+                AccountView, 'get_account_page',
+                wraps=AccountView().get_account_page) as page:
+            response = self.get_account()
+        page.assert_not_called()
+        self.assertEqual(response.data['account']['balance'], '250.00')
+        self.assertEqual(len(response.data['transcations']), 1)
+
+    def test_repeated_reads_are_served_from_memory(self):
+        self.get_account()
+        with patch('investment_app.caching.cache.get') as shared_get:
+            response = self.get_account()
+        shared_get.assert_not_called()
+        self.assertEqual(response.data['account']['name'], 'Account 2.0')
+
+    def test_repeated_reports_are_served_from_memory(self):
+        self.get_report()
+        with patch('investment_app.caching.cache.get') as shared_get:
+            response = self.get_report()
+        shared_get.assert_not_called()
+        self.assertEqual(response.data['total_balance'], 0)
+
+    def test_cache_stats(self):
+        self.get_account()
+        self.get_account()
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('cache-stats'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(response.data['local']['hits'], 1)
+        self.assertGreaterEqual(response.data['shared']['misses'], 1)
+        self.assertIn('evictions', response.data['shared'])
+
+    def test_user_report_follows_account_changes(self):
+        """The admin report is invalidated by put, post and delete."""
+        self.assertEqual(self.get_report().data['total_balance'], 0)
+
+        self.client.put(
+            reverse('update-account', args=[self.account.id]),
+            {'balance': 100}, format='json')
+        self.assertEqual(self.get_report().data['total_balance'], 100)
+
+        response = self.client.post(
+            reverse('create-account'),
+            {'name': 'Account 2.1', 'account_type': 'ACC2', 'balance': 50},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.get_report().data['total_balance'], 150)
+
+        self.client.delete(reverse('delete-account', args=[self.account.id]))
+        self.assertEqual(self.get_report().data['total_balance'], 50)
+        self.assertEqual(self.get_account().status_code, 404)
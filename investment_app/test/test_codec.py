@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from django.test import SimpleTestCase
+from .. import codec
+
+
+class CodecTest(SimpleTestCase):
+    def setUp(self):
+        now = datetime(2024, 9, 12, 10, 11, 12, 123456, tzinfo=timezone.utc)
+        self.report = {
+            'user': 'user',
+            'total_balance': Decimal('1234.50'),
+            'transactions': [
+                {'id': i,
+                 'transaction_type': 'Deposit',
+                 'created_at': now - timedelta(microseconds=i * 7919),
+                 'amount': Decimal('125.50') * i,
+                 'account_id': i % 3}
+                for i in range(100)
+            ],
+            'daily_totals': [
+                {'day': date(2024, 9, day), 'total': Decimal('1.10'),
+                 'count': 2}
+                for day in (11, 12)
+            ],
+            'From': '2024-09-12',
+        }
+
+    def test_round_trip_keeps_types(self):
+        data = codec.dumps(self.report)
+
+        self.assertEqual(data[:1], b'Z')
+        self.assertEqual(codec.loads(data), self.report)
+        self.assertLess(
+            len(data), len(repr(self.report).encode()) // 5)
+
+    def test_small_payloads_are_not_compressed(self):
+        page = {'account': OrderedDict(id=1, balance='10.00'),
+                'transcations': [], 'next_cursor': None}
+        data = codec.dumps(page)
+
+        self.assertEqual(data[:1], b'J')
+        self.assertEqual(codec.loads(data), page)
+
+    def test_irregular_values(self):
+        """Rows with different keys, mixed columns, other time zones and
+        strings looking like tags all round-trip."""
+        other = timezone(timedelta(hours=3))
+        value = {
+            'rows': [
+                {'a': Decimal('1'), 'b': '\x00d1'},
+                {'a': None, 'b': datetime(2024, 1, 1, tzinfo=other)},
+                {'a': 1, 'c': 2},
+            ],
+            'mixed': [
+                {'x': datetime(2024, 1, 1)},
+                {'x': datetime(2024, 1, 1, tzinfo=timezone.utc)},
+            ],
+            'tag': '\x00table',
+            'list': ['\x00table', Decimal('2.5')],
+        }
+        self.assertEqual(codec.loads(codec.dumps(value)), value)
+
+    def test_columns_of_one_untagged_type_are_packed(self):
+        """Columns of lists or of strings looking like tags are packed
+        value by value instead of falling back to pickle."""
+        value = [
+            {'amounts': [Decimal('1.5')], 'note': '\x00d1'},
+            {'amounts': [Decimal('2.5')], 'note': '\x00t2'},
+        ]
+        data = codec.dumps(value)
+
+        self.assertEqual(data[:1], b'J')
+        self.assertEqual(codec.loads(data), value)
+
+    def test_falls_back_to_pickle(self):
+        value = {'ids': {1, 2}}
+        data = codec.dumps(value)
+
+        self.assertEqual(data[:1], b'P')
+        self.assertEqual(codec.loads(data), value)
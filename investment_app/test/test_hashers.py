@@ -0,0 +1,103 @@
+import threading
+from unittest.mock import patch
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from ..hashers import run_hashing
+
+
+class PasswordHashingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user')
+
+    def login(self, password: str = 'password'):
+        return self.client.post(reverse('login'), {
+            'username': 'user', 'password': password}, format='json')
+
+    def set_password(self, encoded: str) -> None:
+        User.objects.filter(id=self.user.id).update(password=encoded)
+
+    def test_new_passwords_use_the_preferred_hasher(self):
+        response = self.client.post(reverse('register-user'), {
+            'username': 'new', 'password': 'password',
+            'email': 'new@example.com'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        password = User.objects.get(username='new').password
+        self.assertTrue(password.startswith('scrypt$'))
+
+    def test_login_rehashes_another_hasher(self):
+        self.set_password(make_password('password', hasher='pbkdf2_sha256'))
+
+        response = self.login()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_login_rehashes_other_parameters(self):
+        hasher = get_hasher('scrypt')
+        self.set_password(hasher.encode('password', hasher.salt(), n=2 ** 12))
+
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.assertEqual(
+            hasher.decode(self.user.password)['work_factor'], 2 ** 14)
+
+    def test_wrong_password_is_not_rehashed(self):
+        encoded = make_password('password', hasher='pbkdf2_sha256')
+        self.set_password(encoded)
+
+        response = self.login('wrong')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, encoded)
+
+    @patch('investment_app.hashers.WAIT', 0.01)
+    def test_busy_hashing_returns_503(self):
+        self.user.set_password('password')
+        self.user.save()
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+
+        with patch('investment_app.hashers._slots', slots):
+            login = self.login()
+            register = self.client.post(reverse('register-user'), {
+                'username': 'new', 'password': 'password',
+                'email': 'new@example.com'}, format='json')
+
+        self.assertEqual(
+            login.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(
+            register.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+
+class RunHashingTest(SimpleTestCase):
+    def test_hashes_run_on_the_request_thread(self):
+        thread = run_hashing(threading.current_thread)
+
+        self.assertIs(thread, threading.current_thread())
+
+    def test_slot_is_released(self):
+        slots = threading.BoundedSemaphore(1)
+        with patch('investment_app.hashers._slots', slots):
+            run_hashing(lambda: None)
+            with self.assertRaises(ValueError):
+                run_hashing(int, 'x')
+
+            self.assertTrue(slots.acquire(blocking=False))
+
+    def test_nested_hashing_runs_inline(self):
+        with patch('investment_app.hashers._slots',
+                   threading.BoundedSemaphore(1)):
+            result = run_hashing(run_hashing, lambda: 'hashed')
+
+        self.assertEqual(result, 'hashed')
@@ -0,0 +1,175 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError
+from rest_framework import status
+from rest_framework.test import APIClient
+from .. import idempotency
+from ..idempotency import idempotency_cache_key, purge_expired
+from ..models import IdempotencyRecord, InvestmentAccount, Transaction
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        response = self.client.post(
+            reverse('login'), {
+                'username': 'user', 'password': 'password'}, format='json')
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2',
+            owner=self.user, balance=Decimal('100.00'))
+        self.url = reverse('update-account', args=[self.account.id])
+
+    def put(self, data, key='key-1'):
+        return self.client.put(
+            self.url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_returns_the_stored_response(self):
+        response = self.put({'balance': -30})
+        retry = self.put({'balance': -30})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('70.00'))
+
+    def test_retry_does_not_touch_the_database(self):
+        # the response is cached once the request commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.put({'balance': 10})
+
+        with CaptureQueriesContext(connection) as context:
+            self.put({'balance': 10})
+        # the user of the token is cached too
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_retry_falls_back_to_the_database(self):
+        self.put({'balance': 10})
+        cache.delete(idempotency_cache_key(self.user.id, 'key-1'))
+
+        with patch('django.core.cache.cache.get', side_effect=ConnectionError):
+            retry = self.put({'balance': 10})
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_of_another_request_is_rejected(self):
+        self.put({'balance': 10})
+        response = self.put({'balance': 20})
+
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        self.put({'balance': 10})
+        other = User.objects.create_user(username='other', password='pass')
+        IdempotencyRecord.objects.filter(user=self.user).update(user=other)
+        cache.clear()
+
+        self.put({'balance': 10})
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_request_in_progress_is_a_conflict(self):
+        IdempotencyRecord.objects.create(
+            user=self.user, key='key-1', fingerprint='',
+            expires_at=timezone.now() + timedelta(hours=1))
+
+        response = self.put({'balance': 10})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_request_whose_key_was_taken_over_is_rolled_back(self):
+        complete = idempotency.complete
+
+        def taken_over(user, key, *args):
+            # a retry takes the key over while the request is running
+            IdempotencyRecord.objects.filter(user=user, key=key).update(
+                created_at=timezone.now() + timedelta(seconds=1))
+            return complete(user, key, *args)
+
+        with patch('investment_app.idempotency.complete', taken_over):
+            response = self.put({'balance': -30})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertTrue(IdempotencyRecord.objects.filter(
+            key='key-1', status_code__isnull=True).exists())
+
+    def test_response_is_committed_with_the_changes(self):
+        with patch('investment_app.idempotency.complete',
+                   side_effect=RuntimeError('stored')):
+            response = self.put({'balance': -30})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_key_released_on_every_attempt_is_a_conflict(self):
+        records = patch.object(
+            IdempotencyRecord.objects, 'create', side_effect=IntegrityError)
+        with records, patch.object(
+                IdempotencyRecord.objects, 'filter',
+                return_value=IdempotencyRecord.objects.none()):
+            stored = idempotency.claim(self.user, 'key-1', 'fingerprint')
+
+        self.assertIsNone(stored.status_code)
+
+    def test_failed_request_can_be_retried(self):
+        response = self.put({'balance': -500})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        self.put({'balance': 500}, key='key-2')
+        response = self.put({'balance': -500})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_expired_key_runs_again(self):
+        self.put({'balance': 10})
+        IdempotencyRecord.objects.update(expires_at=timezone.now())
+        cache.clear()
+
+        self.put({'balance': 10})
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(purge_expired(), 0)
+        IdempotencyRecord.objects.update(expires_at=timezone.now())
+        self.assertEqual(purge_expired(), 1)
+
+    def test_create_account_once(self):
+        data = {'name': 'Account 2.1', 'account_type': 'ACC2', 'balance': 50}
+        for _ in range(2):
+            response = self.client.post(
+                reverse('create-account'), data, format='json',
+                HTTP_IDEMPOTENCY_KEY='create-1')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(
+            InvestmentAccount.objects.filter(name='Account 2.1').count(), 1)
+
+    def test_without_key(self):
+        self.client.put(self.url, {'balance': 10}, format='json')
+        self.client.put(self.url, {'balance': 10}, format='json')
+
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertFalse(IdempotencyRecord.objects.exists())
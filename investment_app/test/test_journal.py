@@ -0,0 +1,240 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.serializers import ValidationError
+from rest_framework.test import APIClient
+from ..caching import local_cache
+from ..journal import append_entry, apply_journal, journal_lag
+from ..ledger import apply_balance_change
+from ..models import (
+    BalanceSnapshot, InvestmentAccount, JournalEntry, Portfolio, Transaction)
+
+
+class JournalTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2',
+            owner=self.user, balance=Decimal('100.00'))
+
+    def test_deposit_is_journaled_without_touching_the_account(self):
+        entry, created = append_entry(
+            self.account, Decimal('50.00'), self.user, 'deposit-1')
+
+        self.assertTrue(created)
+        self.assertEqual(entry.status, JournalEntry.Statuses.PENDING)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertEqual(self.account.reserved_balance, Decimal('0.00'))
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_retry_returns_the_first_entry(self):
+        entry, _ = append_entry(
+            self.account, Decimal('-40.00'), self.user, 'withdraw-1')
+        retry, created = append_entry(
+            self.account, Decimal('-40.00'), self.user, 'withdraw-1')
+
+        self.assertFalse(created)
+        self.assertEqual(retry.id, entry.id)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.reserved_balance, Decimal('40.00'))
+
+    def test_request_id_of_another_movement_is_rejected(self):
+        append_entry(self.account, Decimal('10.00'), self.user, 'request-1')
+
+        with self.assertRaises(ValidationError):
+            append_entry(
+                self.account, Decimal('20.00'), self.user, 'request-1')
+        self.assertEqual(JournalEntry.objects.count(), 1)
+
+    def test_withdrawals_reserve_the_available_balance(self):
+        append_entry(self.account, Decimal('-60.00'), self.user, 'withdraw-1')
+
+        with self.assertRaises(ValidationError):
+            append_entry(
+                self.account, Decimal('-60.00'), self.user, 'withdraw-2')
+        # direct updates see the reservation too
+        with self.assertRaises(ValidationError):
+            apply_balance_change(self.account, Decimal('-60.00'), self.user)
+        # a pending deposit is not available until it is applied
+        append_entry(self.account, Decimal('100.00'), self.user, 'deposit-1')
+        with self.assertRaises(ValidationError):
+            append_entry(
+                self.account, Decimal('-60.00'), self.user, 'withdraw-3')
+
+        self.assertEqual(JournalEntry.objects.count(), 2)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertEqual(self.account.reserved_balance, Decimal('60.00'))
+
+    def test_apply_journal(self):
+        other = User.objects.create_user(username='other', password='pass')
+        amounts = [Decimal('50.00'), Decimal('-90.00'), Decimal('25.00')]
+        users = [self.user, self.user, other]
+        for i, (amount, user) in enumerate(zip(amounts, users)):
+            append_entry(self.account, amount, user, f'request-{i}')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            results = apply_journal()
+
+        self.assertEqual(results, {'applied': 3, 'rejected': 0})
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('85.00'))
+        self.assertEqual(self.account.reserved_balance, Decimal('0.00'))
+        self.assertFalse(JournalEntry.objects.exclude(
+            status=JournalEntry.Statuses.APPLIED).exists())
+        self.assertEqual(
+            list(Transaction.objects.order_by('id').values_list(
+                'amount', 'transaction_by')),
+            [(amount, user.id) for amount, user in zip(amounts, users)])
+        self.assertEqual(
+            BalanceSnapshot.objects.get(account=self.account).closing_balance,
+            Decimal('85.00'))
+        self.assertEqual(
+            Portfolio.objects.get(owner=self.user).total_balance,
+            Decimal('85.00'))
+        # applied entries are never applied again
+        self.assertEqual(apply_journal(), {'applied': 0, 'rejected': 0})
+
+    def test_apply_journal_in_batches(self):
+        for i in range(5):
+            append_entry(self.account, Decimal('1.00'), self.user, str(i))
+
+        self.assertEqual(apply_journal(batch_size=2)['applied'], 2)
+        self.assertEqual(journal_lag()['pending'], 3)
+        self.assertEqual(apply_journal(batch_size=10)['applied'], 3)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('105.00'))
+
+    def test_entries_locked_by_another_worker_are_left_pending(self):
+        append_entry(self.account, Decimal('10.00'), self.user, 'deposit-1')
+        held, _ = append_entry(
+            self.account, Decimal('-20.00'), self.user, 'withdraw-1')
+
+        # skip_locked leaves out the entry another worker holds
+        with patch.object(
+                JournalEntry.objects, 'select_for_update',
+                lambda **kwargs: JournalEntry.objects.exclude(id=held.id)):
+            self.assertEqual(apply_journal(), {'applied': 1, 'rejected': 0})
+
+        held.refresh_from_db()
+        self.assertEqual(held.status, JournalEntry.Statuses.PENDING)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('110.00'))
+        self.assertEqual(self.account.reserved_balance, Decimal('20.00'))
+
+    def test_entries_are_rejected_if_the_balance_changed_outside(self):
+        append_entry(self.account, Decimal('-80.00'), self.user, 'withdraw-1')
+        InvestmentAccount.objects.filter(id=self.account.id).update(
+            balance=Decimal('10.00'))
+
+        self.assertEqual(apply_journal(), {'applied': 0, 'rejected': 1})
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('10.00'))
+        self.assertEqual(self.account.reserved_balance, Decimal('0.00'))
+        self.assertEqual(journal_lag()['rejected'], 1)
+
+    def test_journal_lag(self):
+        self.assertEqual(journal_lag()['pending'], 0)
+        self.assertEqual(journal_lag()['lag_seconds'], 0)
+
+        append_entry(self.account, Decimal('30.00'), self.user, 'deposit-1')
+        append_entry(self.account, Decimal('-10.00'), self.user, 'withdraw-1')
+        JournalEntry.objects.update(
+            created_at=timezone.now() - timedelta(minutes=1))
+
+        lag = journal_lag()
+        self.assertEqual(lag['pending'], 2)
+        self.assertEqual(lag['pending_amount'], Decimal('20.00'))
+        self.assertGreaterEqual(lag['lag_seconds'], 60)
+
+    def test_apply_journal_command(self):
+        append_entry(self.account, Decimal('30.00'), self.user, 'deposit-1')
+        out = StringIO()
+
+        call_command('apply_journal', stdout=out)
+
+        self.assertIn('Applied 1 and rejected 0 entries', out.getvalue())
+        self.assertEqual(journal_lag()['pending'], 0)
+
+
+class JournaledUpdateViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        response = self.client.post(
+            reverse('login'), {
+                'username': 'user', 'password': 'password'}, format='json')
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2',
+            owner=self.user, balance=Decimal('100.00'))
+        self.url = reverse('update-account', args=[self.account.id])
+
+    def put(self, data, request_id='request-1'):
+        headers = {'HTTP_PREFER': 'respond-async'}
+        if request_id:
+            headers['HTTP_IDEMPOTENCY_KEY'] = request_id
+        return self.client.put(self.url, data, format='json', **headers)
+
+    def test_update_is_journaled(self):
+        response = self.put({'balance': -30})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['amount'], '-30.00')
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(response.data['request_id'], 'request-1')
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        retry = self.put({'balance': -30})
+        self.assertEqual(retry.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(retry.data['id'], response.data['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        apply_journal()
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('70.00'))
+
+    def test_overdraft_is_rejected(self):
+        response = self.put({'balance': -100.01})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_request_id_is_required(self):
+        response = self.put({'balance': 10}, request_id=None)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Idempotency-Key', response.data['error'])
+
+    def test_only_balance_is_journaled(self):
+        response = self.put({'balance': 10, 'name': 'Renamed'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_journal_stats_are_admin_only(self):
+        self.put({'balance': 10})
+        url = reverse('journal-stats')
+
+        self.assertEqual(
+            self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['pending'], 1)
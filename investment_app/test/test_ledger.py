@@ -0,0 +1,120 @@
+import threading
+import time
+from decimal import Decimal
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+from django.db import connection, OperationalError
+from django.test.utils import CaptureQueriesContext
+from rest_framework.serializers import ValidationError
+from ..models import InvestmentAccount, Transaction
+from ..ledger import apply_balance_change
+
+
+class ApplyBalanceChangeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2',
+            owner=self.user, balance=Decimal('100.00'))
+
+    def test_deposit(self):
+        transaction = apply_balance_change(
+            self.account, Decimal('50.00'), self.user)
+
+        self.assertEqual(self.account.balance, Decimal('150.00'))
+        self.assertEqual(transaction.transaction_type, 'Deposit')
+        self.assertEqual(transaction.amount, Decimal('50.00'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('150.00'))
+
+    def test_withdraw_whole_balance(self):
+        transaction = apply_balance_change(
+            self.account, Decimal('-100.00'), self.user)
+
+        self.assertEqual(self.account.balance, Decimal('0'))
+        self.assertEqual(transaction.transaction_type, 'Withdrawal')
+
+    def test_overdraft_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            apply_balance_change(self.account, Decimal('-100.01'), self.user)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_uses_single_conditional_update(self):
+        with CaptureQueriesContext(connection) as context:
+            apply_balance_change(self.account, Decimal('10.00'), self.user)
+
+        statements = [
+            query['sql'].split()[0] for query in context.captured_queries
+            if 'SAVEPOINT' not in query['sql']]
+        # the balance, the portfolio, the transaction
+        # and the first snapshot of the day
+        self.assertEqual(statements, [
+            'UPDATE', 'SELECT', 'UPDATE', 'INSERT', 'UPDATE', 'INSERT'])
+
+
+class ConcurrentBalanceChangeTest(TransactionTestCase):
+    threads = 8
+    movements_per_thread = 25
+    max_retries = 50
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Hot account', account_type='ACC2',
+            owner=self.user, balance=Decimal('0.00'))
+
+    def _hammer(self, amount, results, errors):
+        """Apply movements from a thread, retrying with a short backoff
+        when the database reports a lock conflict (sqlite has a single
+        writer). A movement still conflicting after ``max_retries`` is
+        recorded in ``errors`` and ends the thread."""
+        account = InvestmentAccount(id=self.account.id)
+        try:
+            for _ in range(self.movements_per_thread):
+                for attempt in range(self.max_retries):
+                    try:
+                        apply_balance_change(account, amount, self.user)
+                        results.append(amount)
+                        break
+                    except ValidationError:
+                        break
+                    except OperationalError:
+                        time.sleep(min(0.001 * 2 ** attempt, 0.05))
+                else:
+                    errors.append(
+                        f'{amount} still locked after '
+                        f'{self.max_retries} attempts')
+                    return
+        finally:
+            connection.close()
+
+    def test_no_lost_updates(self):
+        """Deposits and withdrawals race on one account, the final balance
+        must equal the sum of every accepted movement and never go negative."""
+        results, errors = [], []
+        workers = [
+            threading.Thread(
+                target=self._hammer,
+                args=(Decimal('10.00') if i % 2 else Decimal('-5.00'),
+                      results, errors))
+            for i in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, sum(results))
+        self.assertGreaterEqual(self.account.balance, 0)
+        self.assertEqual(
+            self.account.transactions.count(), len(results))
+        self.assertEqual(
+            sum(self.account.transactions.values_list('amount', flat=True)),
+            self.account.balance)
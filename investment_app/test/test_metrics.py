@@ -0,0 +1,162 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..metrics import (
+    Counter, Histogram, RequestMetrics, end_request, render_metrics,
+    start_request, timer)
+from ..models import InvestmentAccount, Transaction
+
+
+def sample(name: str, **labels) -> float:
+    """Return the value of a sample of ``render_metrics``, 0 if missing."""
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f'{name}{{{label_text}}} '
+    for line in render_metrics().splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def test_histogram_samples(self):
+        histogram = Histogram('test_seconds', 'Test.', ('view',), (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('A',), value)
+
+        self.assertEqual(list(histogram.samples()), [
+            ('test_seconds_bucket', {'view': 'A', 'le': '0.1'}, 2),
+            ('test_seconds_bucket', {'view': 'A', 'le': '1'}, 3),
+            ('test_seconds_bucket', {'view': 'A', 'le': '+Inf'}, 4),
+            ('test_seconds_sum', {'view': 'A'}, 3.65),
+            ('test_seconds_count', {'view': 'A'}, 4),
+        ])
+
+    def test_counter_samples(self):
+        counter = Counter('test_total', 'Test.', ('view', 'status'))
+        counter.inc(('A', '200'))
+        counter.inc(('A', '200'), 2)
+
+        self.assertEqual(list(counter.samples()), [
+            ('test_total', {'view': 'A', 'status': '200'}, 3)])
+
+    def test_timer_outside_of_a_request(self):
+        with timer('render'):
+            pass
+
+        request_metrics, token = start_request()
+        try:
+            with timer('render'):
+                pass
+        finally:
+            end_request(token)
+        self.assertGreater(request_metrics.durations['render'], 0)
+
+    def test_server_timing(self):
+        request_metrics = RequestMetrics()
+        request_metrics.queries = 3
+        request_metrics.cache_hits = 2
+        request_metrics.durations['db'] = 0.0125
+
+        self.assertEqual(
+            request_metrics.server_timing(0.05),
+            'db;dur=12.5;desc="3 queries", '
+            'cache;dur=0.0;desc="2 hits, 0 misses", '
+            'serialize;dur=0.0, render;dur=0.0, total;dur=50.0')
+
+
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        response = self.client.post(
+            reverse('login'), {
+                'username': 'user', 'password': 'password'}, format='json')
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2',
+            owner=self.user, balance=Decimal('100.00'))
+        Transaction.objects.create(
+            account=self.account, transaction_by=self.user,
+            transaction_type='Deposit', amount=Decimal('100.00'))
+        self.url = reverse('view-account', args=[self.account.id])
+        self.labels = {'view': 'AccountView', 'method': 'GET'}
+
+    def test_records_requests_per_view(self):
+        requests = sample(
+            'investment_http_requests_total', **self.labels, status='200')
+        misses = sample(
+            'investment_cache_reads_total', **self.labels, result='miss')
+        hits = sample(
+            'investment_cache_reads_total', **self.labels, result='hit')
+
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        self.assertEqual(sample(
+            'investment_http_requests_total', **self.labels, status='200'),
+            requests + 2)
+        self.assertGreater(sample(
+            'investment_cache_reads_total', **self.labels, result='miss'),
+            misses)
+        self.assertGreater(sample(
+            'investment_cache_reads_total', **self.labels, result='hit'),
+            hits)
+        self.assertGreater(sample(
+            'investment_http_request_queries_sum', **self.labels), 0)
+        self.assertGreater(sample(
+            'investment_http_request_phase_seconds_sum',
+            **self.labels, phase='render'), 0)
+
+    def test_admin_report_times_serializing_and_rendering(self):
+        admin = User.objects.create_superuser(
+            username='admin', password='password')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        labels = {'view': 'AdminView', 'method': 'GET'}
+        before = {
+            phase: sample(
+                'investment_http_request_phase_seconds_sum',
+                **labels, phase=phase)
+            for phase in ('serialize', 'render')}
+
+        response = client.get(
+            reverse('view-user-accounts', args=[self.user.id]))
+
+        self.assertEqual(response.status_code, 200)
+        for phase, total in before.items():
+            self.assertGreater(sample(
+                'investment_http_request_phase_seconds_sum',
+                **labels, phase=phase), total, phase)
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_in_debug(self):
+        response = self.client.get(self.url)
+
+        timing = response['Server-Timing']
+        for phase in ('db', 'cache', 'serialize', 'render', 'total'):
+            self.assertIn(f'{phase};dur=', timing)
+        self.assertNotIn('"0 queries"', timing)
+
+    def test_no_server_timing_without_debug(self):
+        response = self.client.get(self.url)
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_metrics_endpoint(self):
+        self.client.get(self.url)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            '# TYPE investment_http_request_duration_seconds histogram',
+            response.content.decode())
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
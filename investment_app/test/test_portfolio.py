@@ -0,0 +1,138 @@
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..ledger import apply_balance_change
+from ..models import InvestmentAccount, Portfolio
+
+backfill_portfolios = import_module(
+    'investment_app.migrations.0009_backfill_portfolios').backfill_portfolios
+
+
+class PortfolioSyncTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            reverse('create-account'),
+            {'name': 'Account 2', 'account_type': 'ACC2', 'balance': 100},
+            format='json')
+        self.account = InvestmentAccount.objects.get(id=response.data['id'])
+
+    def portfolio(self):
+        return Portfolio.objects.get(owner=self.user)
+
+    def test_created_account_is_added(self):
+        InvestmentAccount.objects.create(
+            name='Account 1', account_type='ACC1', owner=self.user,
+            balance=Decimal('20.00'))
+
+        portfolio = self.portfolio()
+        self.assertEqual(portfolio.total_balance, Decimal('120.00'))
+        self.assertEqual(portfolio.acc1_balance, Decimal('20.00'))
+        self.assertEqual(portfolio.acc2_balance, Decimal('100.00'))
+        self.assertEqual(portfolio.account_count, 2)
+        self.assertIsNotNone(portfolio.last_activity)
+
+    def test_balance_changes_are_applied(self):
+        self.client.put(
+            reverse('update-account', args=[self.account.id]),
+            {'balance': -40}, format='json')
+        apply_balance_change(self.account, Decimal('15.00'), self.user)
+
+        portfolio = self.portfolio()
+        self.assertEqual(portfolio.total_balance, Decimal('75.00'))
+        self.assertEqual(portfolio.acc2_balance, Decimal('75.00'))
+
+    def test_rejected_withdrawal_is_not_applied(self):
+        response = self.client.put(
+            reverse('update-account', args=[self.account.id]),
+            {'balance': -400}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.portfolio().total_balance, Decimal('100.00'))
+
+    def test_type_change_moves_the_balance(self):
+        self.client.put(
+            reverse('update-account', args=[self.account.id]),
+            {'account_type': 'ACC1'}, format='json')
+
+        portfolio = self.portfolio()
+        self.assertEqual(portfolio.acc1_balance, Decimal('100.00'))
+        self.assertEqual(portfolio.acc2_balance, Decimal('0.00'))
+
+    def test_rename_records_activity(self):
+        last_activity = self.portfolio().last_activity
+        self.client.put(
+            reverse('update-account', args=[self.account.id]),
+            {'name': 'Renamed'}, format='json')
+
+        self.assertGreater(self.portfolio().last_activity, last_activity)
+        self.assertEqual(self.portfolio().total_balance, Decimal('100.00'))
+
+    def test_deleted_account_is_removed(self):
+        self.client.delete(reverse('delete-account', args=[self.account.id]))
+
+        portfolio = self.portfolio()
+        self.assertEqual(portfolio.total_balance, Decimal('0.00'))
+        self.assertEqual(portfolio.account_count, 0)
+
+    def test_deleting_the_owner(self):
+        self.user.delete()
+        self.assertFalse(Portfolio.objects.exists())
+
+    def test_admin_report_reads_the_portfolio(self):
+        admin = User.objects.create_superuser(
+            username='admin', password='password')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(
+            reverse('view-user-accounts', args=[self.user.id]))
+
+        self.assertEqual(response.data['total_balance'], Decimal('100.00'))
+        self.assertEqual(
+            response.data['balance_by_type'],
+            {'ACC1': 0, 'ACC2': Decimal('100.00'), 'ACC3': 0})
+        self.assertEqual(response.data['account_count'], 1)
+
+
+class PortfolioConsistencyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        for account_type, balance in (('ACC1', 10), ('ACC2', 20)):
+            InvestmentAccount.objects.create(
+                name=account_type, account_type=account_type,
+                owner=self.user, balance=Decimal(balance))
+
+    def test_consistent_portfolios(self):
+        out = StringIO()
+        call_command('check_portfolios', stdout=out, stderr=StringIO())
+        self.assertIn('0 of 1 portfolios drifted.', out.getvalue())
+
+    def test_drift_is_reported_and_fixed(self):
+        Portfolio.objects.filter(owner=self.user).update(
+            total_balance=Decimal('1.00'))
+        out, err = StringIO(), StringIO()
+        call_command('check_portfolios', '--fix', stdout=out, stderr=err)
+
+        self.assertIn('1 of 1 portfolios drifted, rebuilt.', out.getvalue())
+        self.assertIn('total_balance 1.00 != 30', err.getvalue())
+        self.assertEqual(
+            Portfolio.objects.get(owner=self.user).total_balance,
+            Decimal('30.00'))
+
+    def test_backfill_migration(self):
+        Portfolio.objects.all().delete()
+        backfill_portfolios(apps, None)
+
+        portfolio = Portfolio.objects.get(owner=self.user)
+        self.assertEqual(portfolio.total_balance, Decimal('30.00'))
+        self.assertEqual(portfolio.acc1_balance, Decimal('10.00'))
+        self.assertEqual(portfolio.account_count, 2)
@@ -0,0 +1,156 @@
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from ..caching import async_redis_client
+from .query_budget import QueryBudgetMixin
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Every route runs at most its budget of queries, on a cold cache,
+    for 1 to 100 accounts and 10 to 1000 transactions of the user."""
+
+    def setUp(self):
+        self.client = Client()
+        admin = User.objects.create_superuser(username='admin')
+        self.admin_token = str(AccessToken.for_user(admin))
+
+    def send(self, method: str, path: str, token: str, data=None, **extra):
+        """Send a JSON request with a bearer token."""
+        return self.client.generic(
+            method, path, data or '', content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}', **extra)
+
+    def get(self, path: str, token: str, **params):
+        return self.client.get(
+            path, params, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_view_account(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('view-account', args=[volume.accounts[0].id]),
+            volume.token), 4)
+
+    def test_create_account(self):
+        self.assertQueryBudget(lambda volume: self.send(
+            'POST', reverse('create-account'), volume.token,
+            '{"name": "New", "account_type": "ACC2", "balance": "100.00"}'),
+            8, status.HTTP_201_CREATED)
+
+    def test_update_account(self):
+        self.assertQueryBudget(lambda volume: self.send(
+            'PUT', reverse('update-account', args=[volume.accounts[0].id]),
+            volume.token, '{"balance": "-5.00"}'), 14)
+
+    def test_journal_account_update(self):
+        self.assertQueryBudget(lambda volume: self.send(
+            'PUT', reverse('update-account', args=[volume.accounts[0].id]),
+            volume.token, '{"balance": "-5.00"}',
+            HTTP_PREFER='respond-async', HTTP_IDEMPOTENCY_KEY='budget'),
+            13, status.HTTP_202_ACCEPTED)
+
+    def test_idempotent_account_update(self):
+        self.assertQueryBudget(lambda volume: self.send(
+            'PUT', reverse('update-account', args=[volume.accounts[0].id]),
+            volume.token, '{"balance": "5.00"}',
+            HTTP_IDEMPOTENCY_KEY='budget'), 19)
+
+    def test_delete_account(self):
+        self.assertQueryBudget(lambda volume: self.send(
+            'DELETE', reverse('delete-account', args=[volume.accounts[0].id]),
+            volume.token), 8)
+
+    def test_bulk_transactions(self):
+        def upload(volume):
+            body = 'account_id,amount\n' + ''.join(
+                f'{volume.accounts[0].id},{amount}\n'
+                for amount in (10, -5) * 5)
+            return self.client.post(
+                reverse('bulk-transactions'), body, content_type='text/csv',
+                HTTP_AUTHORIZATION=f'Bearer {volume.token}')
+
+        self.assertQueryBudget(upload, 10)
+
+    def test_account_balance(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('account-balance', args=[volume.accounts[0].id]),
+            volume.token), 3)
+
+    def test_account_balance_history(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('account-balance', args=[volume.accounts[0].id]),
+            volume.token, since='2024-01-01'), 5)
+
+    def test_view_user_accounts(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('view-user-accounts', args=[volume.user.id]),
+            self.admin_token), 4)
+
+    def test_view_user_accounts_in_range(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('view-user-accounts', args=[volume.user.id]),
+            self.admin_token, end_date='2024-01-01'), 4)
+
+    def test_view_user_accounts_by_day(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('view-user-accounts', args=[volume.user.id]),
+            self.admin_token, group_by='day'), 5)
+
+    def test_export_user_transactions(self):
+        for output in ('csv', 'ndjson'):
+            with self.subTest(output=output):
+                self.assertQueryBudget(lambda volume: self.get(
+                    reverse('export-user-transactions',
+                            args=[volume.user.id]),
+                    self.admin_token, end_date='2024-01-01',
+                    output=output), 3)
+
+    def test_cache_stats(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('cache-stats'), self.admin_token), 1)
+
+    def test_journal_stats(self):
+        self.assertQueryBudget(lambda volume: self.get(
+            reverse('journal-stats'), self.admin_token), 3)
+
+    async def async_get(self, path: str, token: str):
+        try:
+            return await self.async_client.get(
+                path, headers={'Authorization': f'Bearer {token}'})
+        finally:
+            # the connections of the client are bound to the event loop
+            # of the test, which is closed after it
+            await async_redis_client().aclose()
+
+    async def test_async_view_account(self):
+        await self.aassertQueryBudget(lambda volume: self.async_get(
+            reverse('async-view-account', args=[volume.accounts[0].id]),
+            volume.token), 4)
+
+    async def test_async_view_user_accounts(self):
+        await self.aassertQueryBudget(lambda volume: self.async_get(
+            reverse('async-view-user-accounts', args=[volume.user.id]),
+            self.admin_token), 4)
+
+    def test_register_user(self):
+        self.assertQueryBudget(lambda volume: self.client.post(
+            reverse('register-user'),
+            {'username': f'new_{volume.user.id}', 'password': 'password',
+             'email': 'new@example.com'},
+            content_type='application/json'), 2, status.HTTP_201_CREATED)
+
+    def test_login(self):
+        self.assertQueryBudget(lambda volume: self.client.post(
+            reverse('login'),
+            {'username': volume.user.username, 'password': 'password'},
+            content_type='application/json'), 1)
+
+    def test_token_refresh(self):
+        self.assertQueryBudget(lambda volume: self.client.post(
+            reverse('token_refresh'),
+            {'refresh': str(RefreshToken.for_user(volume.user))},
+            content_type='application/json'), 0)
+
+    def test_metrics(self):
+        self.assertQueryBudget(
+            lambda volume: self.client.get(reverse('metrics')), 0)
@@ -0,0 +1,68 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import patch
+from uuid import UUID
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from .. import renderers
+from ..renderers import ORJSONRenderer
+
+
+class ORJSONRendererTest(SimpleTestCase):
+    def setUp(self):
+        now = datetime(2024, 9, 12, 10, 11, 12, 123456, tzinfo=timezone.utc)
+        self.report = {
+            'Username': 'user',
+            'total_balance': Decimal('1234.50'),
+            'balance_by_type': {'ACC1': Decimal('0.00'), 'ACC2': None},
+            'transactions': [
+                {'id': i,
+                 'transaction_type': 'Deposit',
+                 'created_at': now - timedelta(seconds=i * 7919),
+                 'amount': Decimal('125.50') * i,
+                 'account_id': i % 3}
+                for i in range(100)
+            ],
+            'daily_totals': [{'day': date(2024, 9, 12), 'count': 2}],
+            'From': date(2024, 9, 12),
+            'To': 'All Transactions',
+        }
+
+    def assertSameOutput(self, data):
+        self.assertEqual(
+            ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_same_output_as_json_renderer(self):
+        self.assertSameOutput(self.report)
+
+    def test_same_output_for_other_types(self):
+        self.assertSameOutput({
+            'offset': datetime(
+                2024, 9, 12, 10, tzinfo=timezone(timedelta(hours=3))),
+            'naive': datetime(2024, 9, 12, 10, 11, 12),
+            'uuid': UUID(int=1),
+            'lazy': gettext_lazy('Deposit'),
+            'separators': 'a\u2028b\u2029c',
+            'unicode': 'Zürich',
+            1: 'non-string key',
+            'tuple': (1, 2),
+            'empty': [],
+        })
+
+    def test_falls_back_for_values_orjson_rejects(self):
+        self.assertSameOutput({'big': 2 ** 70})
+
+    def test_indented_output_falls_back(self):
+        renderer = ORJSONRenderer()
+        media_type = 'application/json; indent=2'
+        self.assertEqual(
+            renderer.render(self.report, media_type),
+            JSONRenderer().render(self.report, media_type))
+
+    def test_without_orjson(self):
+        with patch.object(renderers, 'orjson', None):
+            self.assertSameOutput(self.report)
+
+    def test_none(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
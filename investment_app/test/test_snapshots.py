@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from ..ledger import apply_balance_change, apply_balance_changes
+from ..models import BalanceSnapshot, InvestmentAccount, Transaction
+from ..snapshots import balance_at, balance_history, rebuild_snapshots
+
+
+class SnapshotMaintenanceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2', owner=self.user)
+
+    def test_ledger_updates_the_snapshot_of_the_day(self):
+        apply_balance_change(self.account, Decimal('100.00'), self.user)
+        apply_balance_change(self.account, Decimal('-30.00'), self.user)
+        apply_balance_changes(
+            self.account, [Decimal('5.00'), Decimal('-1.00')], self.user)
+
+        snapshot = BalanceSnapshot.objects.get(account=self.account)
+        self.assertEqual(snapshot.date, timezone.localdate())
+        self.assertEqual(snapshot.closing_balance, Decimal('74.00'))
+        self.assertEqual(snapshot.deposits, Decimal('105.00'))
+        self.assertEqual(snapshot.withdrawals, Decimal('-31.00'))
+        self.assertEqual(snapshot.count, 4)
+
+    def test_opening_balance_is_snapshotted(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(
+            reverse('create-account'),
+            {'name': 'Account 2.1', 'account_type': 'ACC2', 'balance': 50},
+            format='json')
+
+        snapshot = BalanceSnapshot.objects.get(account_id=response.data['id'])
+        self.assertEqual(snapshot.closing_balance, Decimal('50.00'))
+        self.assertEqual(snapshot.count, 1)
+
+
+class SnapshotQueriesTest(TestCase):
+    def setUp(self):
+        """
+        Three days of history: +100 and -20 ten days ago,
+        +50 five days ago and -10 today.
+        """
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2', account_type='ACC2', owner=self.user,
+            balance=Decimal('120.00'))
+        self.today = timezone.localdate()
+        self.now = timezone.now()
+        for days_ago, hour, amount in (
+                (10, 9, '100.00'), (10, 15, '-20.00'),
+                (5, 12, '50.00'), (0, 0, '-10.00')):
+            created_at = timezone.make_aware(datetime.combine(
+                self.today - timedelta(days=days_ago),
+                datetime.min.time())) + timedelta(hours=hour)
+            transaction = Transaction.objects.create(
+                transaction_by=self.user, account=self.account,
+                transaction_type='Deposit', amount=Decimal(amount))
+            Transaction.objects.filter(id=transaction.id).update(
+                created_at=created_at)
+
+    def test_rebuild_replays_backwards_from_the_balance(self):
+        self.assertEqual(rebuild_snapshots(self.account.id), (3, 0))
+
+        snapshots = list(BalanceSnapshot.objects.filter(
+            account=self.account).order_by('date').values_list(
+                'closing_balance', 'deposits', 'withdrawals', 'count'))
+        self.assertEqual(snapshots, [
+            (Decimal('80.00'), Decimal('100.00'), Decimal('-20.00'), 2),
+            (Decimal('130.00'), Decimal('50.00'), Decimal('0.00'), 1),
+            (Decimal('120.00'), Decimal('0.00'), Decimal('-10.00'), 1),
+        ])
+
+    def test_rebuild_reports_unexplained_balance(self):
+        InvestmentAccount.objects.filter(id=self.account.id).update(
+            balance=Decimal('125.00'))
+        self.assertEqual(
+            rebuild_snapshots(self.account.id), (3, Decimal('5.00')))
+
+    def test_balance_at(self):
+        rebuild_snapshots(self.account.id)
+        ten_days_ago = self.today - timedelta(days=10)
+        noon = timezone.make_aware(datetime.combine(
+            ten_days_ago, datetime.min.time())) + timedelta(hours=12)
+
+        self.assertEqual(
+            balance_at(self.account.id, ten_days_ago - timedelta(days=1)), 0)
+        self.assertEqual(balance_at(self.account.id, ten_days_ago), 80)
+        self.assertEqual(
+            balance_at(self.account.id, self.today - timedelta(days=1)), 130)
+        with self.assertNumQueries(2):
+            self.assertEqual(balance_at(self.account.id, noon), 100)
+
+    def test_balance_history(self):
+        rebuild_snapshots(self.account.id)
+        history = balance_history(
+            self.account.id, self.today - timedelta(days=7), self.today)
+
+        self.assertEqual(history['opening_balance'], 80)
+        self.assertEqual(
+            [day['closing_balance'] for day in history['days']], [130, 120])
+
+    def test_backfill_command(self):
+        out = StringIO()
+        call_command('backfill_balance_snapshots', stdout=out)
+
+        self.assertIn('Rebuilt 3 snapshots of 1 accounts.', out.getvalue())
+        self.assertEqual(
+            BalanceSnapshot.objects.filter(account=self.account).count(), 3)
+
+    def test_balance_endpoint(self):
+        rebuild_snapshots(self.account.id)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('account-balance', args=[self.account.id])
+        day = self.today - timedelta(days=7)
+
+        response = client.get(url, {'date': day, 'since': day - timedelta(days=5)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance'], 80)
+        self.assertEqual(response.data['opening_balance'], 0)
+        self.assertEqual(len(response.data['days']), 1)
+
+        response = client.get(url, {'since': self.today, 'date': day})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_balance_endpoint_respects_account_type(self):
+        account = InvestmentAccount.objects.create(
+            name='Account 3', account_type='ACC3', owner=self.user)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get(reverse('account-balance', args=[account.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
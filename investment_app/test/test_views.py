@@ -4,7 +4,16 @@ from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth.models import User
 from ..models import InvestmentAccount, Transaction
+from ..permissions import AccountTypePermission
 from unittest.mock import patch, MagicMock
+from ..serializer import TransactionSeializer
+from ..utils import get_transactions
+from decimal import Decimal
+from django.utils import timezone
+import json
+import tracemalloc
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 
 class UserViewTest(TestCase):
@@ -215,6 +224,20 @@ class CreateAnAccountTest(TestCase):
         self.assertEqual(response.data['balance'], '200.00')
         self.assertEqual(Transaction.objects.all().count(), 1)
 
+    def test_create_account_with_balance_as_string(self):
+        """
+        Test account creation with the balance as DRF renders decimals.
+        """
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {self.token["access"]}')
+        url = reverse('create-account')
+        response = self.client.post(
+            url, {**self.account_data_with_balance, 'balance': '200.00'},
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transaction.objects.get().amount, 200)
+
     def test_create_account_without_balance_and_account_type_3(self):
         """
         Test account creation without a balance.
@@ -402,3 +425,438 @@ class DeleteAccount(TestCase):
             HTTP_AUTHORIZATION=f'Bearer {self.token["access"]}')
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkTransactionViewTest(TestCase):
+    def setUp(self):
+        """
+        Set up the test environment.
+        """
+        self.client = APIClient()
+
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('bulk-transactions')
+
+        self.account_1 = InvestmentAccount.objects.create(
+            name='Account 1', account_type='ACC1', owner=self.user)
+        self.account_2 = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.user,
+            balance=100)
+        self.account_2_1 = InvestmentAccount.objects.create(
+            name='Account 2.1', account_type='ACC2', owner=self.user)
+
+    def test_csv_settlement(self):
+        """
+        Test that movements are netted per account and recorded one by one.
+        """
+        body = (
+            'account_id,amount\n'
+            f'{self.account_2.id},50.25\n'
+            f'{self.account_2.id},-120\n'
+            f'{self.account_2_1.id},10\n')
+        response = self.client.generic(
+            'POST', self.url, body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['applied'], 3)
+        self.assertEqual(response.data['rejected'], 0)
+        self.account_2.refresh_from_db()
+        self.assertEqual(str(self.account_2.balance), '30.25')
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(
+            Transaction.objects.filter(transaction_type='Withdrawal').count(), 1)
+        self.assertEqual(
+            Transaction.objects.filter(created_at__isnull=True).count(), 0)
+
+    def test_json_lines_rejections(self):
+        """
+        Test that invalid items, denied accounts and overdrafts are
+        rejected without affecting the other accounts.
+        """
+        body = '\n'.join([
+            f'{{"account_id": {self.account_2.id}, "amount": 10.5}}',
+            f'{{"account_id": {self.account_1.id}, "amount": 10}}',
+            f'{{"account_id": {self.account_2_1.id}, "amount": -10}}',
+            '{"account_id": 999, "amount": 10}',
+            '{"account_id": "x", "amount": 10}',
+            'not json',
+        ])
+        response = self.client.generic(
+            'POST', self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['applied'], 1)
+        self.assertEqual(response.data['rejected'], 5)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['applied'] + ['rejected'] * 5)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.account_2.refresh_from_db()
+        self.assertEqual(str(self.account_2.balance), '110.50')
+
+    def test_other_users_accounts_are_rejected(self):
+        """
+        Test that movements on an account of another user are rejected.
+        """
+        other = User.objects.create_user(
+            username='other', password='password')
+        others_account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=other,
+            balance=100)
+        body = (
+            'account_id,amount\n'
+            f'{others_account.id},-100\n'
+            f'{self.account_2.id},10\n')
+        response = self.client.generic(
+            'POST', self.url, body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['applied'], 1)
+        self.assertEqual(
+            response.data['results'][0]['error'],
+            'You do not have permission to perform this action.')
+        others_account.refresh_from_db()
+        self.assertEqual(str(others_account.balance), '100.00')
+        self.assertFalse(
+            Transaction.objects.filter(account=others_account).exists())
+
+    def test_out_of_range_account_id_is_rejected_alone(self):
+        """
+        Test that an account id no primary key can hold rejects its item
+        only.
+        """
+        body = (
+            'account_id,amount\n'
+            f'{2 ** 64},10\n'
+            f'{self.account_2.id},10\n')
+        response = self.client.generic(
+            'POST', self.url, body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['applied'], 1)
+        self.assertEqual(response.data['results'][0]['status'], 'rejected')
+
+    @patch('investment_app.parsers.BULK_MAX_ITEMS', 2)
+    def test_too_many_movements_are_refused(self):
+        """
+        Test that a file with more than BULK_MAX_ITEMS movements is
+        refused as a whole.
+        """
+        body = '\n'.join(
+            f'{{"account_id": {self.account_2.id}, "amount": 1}}'
+            for _ in range(3))
+        response = self.client.generic(
+            'POST', self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(
+            response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    @patch('investment_app.parsers.BULK_MAX_BYTES', 64)
+    def test_too_large_file_is_refused(self):
+        """
+        Test that a file larger than BULK_MAX_BYTES is refused.
+        """
+        body = 'account_id,amount\n' + f'{self.account_2.id},1\n' * 20
+        response = self.client.generic(
+            'POST', self.url, body, content_type='text/csv')
+
+        self.assertEqual(
+            response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_csv_without_header(self):
+        """
+        Test that a CSV file without the header is rejected.
+        """
+        response = self.client.generic(
+            'POST', self.url, f'{self.account_2.id},10\n',
+            content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_queries_do_not_scale_with_movements(self):
+        """
+        Test that an account costs the same number of queries
+        whatever the number of its movements.
+        """
+        body = 'account_id,amount\n' + (
+            f'{self.account_2.id},1\n' * 100)
+        with self.assertNumQueries(9):
+            response = self.client.generic(
+                'POST', self.url, body, content_type='text/csv')
+        self.assertEqual(response.data['applied'], 100)
+
+
+class AccountPermissionTest(TestCase):
+    def setUp(self):
+        """
+        Set up accounts of two users.
+        """
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.other = User.objects.create_user(
+            username='other', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.account_2 = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.user)
+        self.account_3 = InvestmentAccount.objects.create(
+            name='Account 3', account_type='ACC3', owner=self.user)
+        self.others_account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.other)
+
+    def test_other_users_accounts_are_denied(self):
+        """
+        Test that an account of another user cannot be read or changed.
+        """
+        url = reverse('view-account', args=[self.others_account.id])
+        for method in ('get', 'put', 'delete'):
+            response = getattr(self.client, method)(url)
+            self.assertEqual(
+                response.status_code, status.HTTP_403_FORBIDDEN, method)
+
+        response = self.client.get(
+            reverse('account-balance', args=[self.others_account.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(
+            InvestmentAccount.objects.filter(
+                id=self.others_account.id).exists())
+
+    def test_method_check_requires_the_owner(self):
+        """
+        Test that the shared method check denies an allowed method on an
+        account of another user.
+        """
+        permission = AccountTypePermission()
+
+        self.assertTrue(
+            permission.is_method_allowed(self.user, self.account_2, 'PUT'))
+        self.assertFalse(
+            permission.is_method_allowed(
+                self.user, self.others_account, 'PUT'))
+
+    def test_denied_request_costs_one_query_then_none(self):
+        """
+        Test that the permission record is read once and then cached.
+        """
+        url = reverse('view-account', args=[self.account_3.id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_changing_the_account_type_updates_the_permissions(self):
+        """
+        Test that the cached permission record follows the account.
+        """
+        url = reverse('update-account', args=[self.account_2.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                url, {'account_type': 'ACC1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.put(url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_missing_account(self):
+        """
+        Test that a missing account is not found.
+        """
+        response = self.client.get(reverse('view-account', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AccountHistoryScalingTest(TestCase):
+    """put, delete and a cached get must not load the transaction history,
+    their cost is measured on a history longer than a page and on a long
+    one."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def create_account(self, transactions: int) -> InvestmentAccount:
+        account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.user,
+            balance=1000)
+        Transaction.objects.bulk_create([
+            Transaction(
+                transaction_by=self.user,
+                transaction_type='Deposit',
+                amount=1,
+                account=account)
+            for _ in range(transactions)
+        ])
+        return account
+
+    def measure(self, request) -> tuple:
+        """Return the number of queries and the peak memory of a request
+        on a history of 100 and of 2000 transactions."""
+        results = []
+        for transactions in (100, 2000):
+            account = self.create_account(transactions)
+            with CaptureQueriesContext(connection) as queries:
+                tracemalloc.start()
+                try:
+                    response = request(account)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            self.assertLess(response.status_code, 300, response.data)
+            results.append((len(queries), peak))
+        return results
+
+    def assertDoesNotScale(self, request):
+        (short_queries, short_peak), (long_queries, long_peak) = (
+            self.measure(request))
+        self.assertEqual(short_queries, long_queries)
+        # 2000 transactions loaded as model instances take megabytes
+        self.assertLess(long_peak, short_peak + 200 * 1024)
+
+    def test_put(self):
+        self.assertDoesNotScale(lambda account: self.client.put(
+            reverse('update-account', args=[account.id]),
+            {'name': 'Renamed'}, format='json'))
+
+    def test_delete(self):
+        self.assertDoesNotScale(lambda account: self.client.delete(
+            reverse('delete-account', args=[account.id])))
+
+    def test_cached_get(self):
+        def cached_get(account):
+            url = reverse('view-account', args=[account.id])
+            self.client.get(url)
+            return self.client.get(url)
+
+        self.assertDoesNotScale(cached_get)
+
+    def test_cached_get_runs_no_query(self):
+        account = self.create_account(10)
+        url = reverse('view-account', args=[account.id])
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['transcations']), 10)
+
+
+class AccountPaginationTest(TestCase):
+    def setUp(self):
+        """
+        Set up an account with a history spanning several pages.
+        """
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.user)
+        self.transactions = [
+            Transaction.objects.create(
+                transaction_by=self.user,
+                transaction_type='Deposit',
+                amount=i,
+                account=self.account)
+            for i in range(1, 8)
+        ]
+        self.url = reverse('view-account', args=[self.account.id])
+
+    def test_walk_pages_with_cursor(self):
+        """
+        Test that following next_cursor returns every transaction once,
+        newest first.
+        """
+        seen = []
+        params = {'page_size': 3}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['transcations']), 3)
+            seen += [item['id'] for item in response.data['transcations']]
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        self.assertEqual(
+            seen, [transaction.id for transaction in self.transactions[::-1]])
+
+    def test_cursor_with_same_created_at(self):
+        """
+        Test that transactions sharing a creation date are not skipped.
+        """
+        Transaction.objects.update(created_at=self.transactions[0].created_at)
+        response = self.client.get(self.url, {'page_size': 4})
+        response = self.client.get(
+            self.url,
+            {'page_size': 4, 'cursor': response.data['next_cursor']})
+
+        self.assertEqual(
+            [item['id'] for item in response.data['transcations']],
+            [transaction.id for transaction in self.transactions[2::-1]])
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_invalid_pagination(self):
+        """
+        Test that an invalid cursor or page size is rejected.
+        """
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'page_size': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TransactionFormatTest(TestCase):
+    def setUp(self):
+        """
+        Set up an account with deposits and withdrawals.
+        """
+        self.user = User.objects.create_user(
+            username='user', password='password')
+        self.account = InvestmentAccount.objects.create(
+            name='Account 2.0', account_type='ACC2', owner=self.user)
+        for amount in ('125.50', '-15.25', '1000', '0.01'):
+            Transaction.objects.create(
+                transaction_by=self.user,
+                transaction_type='Deposit',
+                amount=Decimal(amount),
+                account=self.account)
+
+    def serialized(self):
+        return TransactionSeializer(
+            self.account.transactions.order_by('-created_at', '-id'),
+            many=True).data
+
+    def test_same_output_as_serializer(self):
+        """
+        Test that get_transactions returns what TransactionSeializer
+        returns, with the same keys in the same order.
+        """
+        transactions = get_transactions(self.account)
+
+        self.assertEqual(
+            json.dumps(transactions), json.dumps(self.serialized()))
+
+    def test_same_output_in_another_time_zone(self):
+        """
+        Test that datetimes are converted to the current time zone.
+        """
+        with timezone.override('Africa/Nairobi'):
+            transactions = get_transactions(self.account)
+            expected = self.serialized()
+
+        self.assertEqual(transactions, expected)
+        self.assertTrue(transactions[0]['created_at'].endswith('+03:00'))
+
+    def test_no_transactions(self):
+        """
+        Test that an account without transactions returns None.
+        """
+        self.account.transactions.all().delete()
+        self.assertIsNone(get_transactions(self.account))
@@ -1,4 +1,13 @@
-from .views import AccountView, UserView, AdminView
+from .views import (
+    AccountView,
+    AccountBalanceView,
+    UserView,
+    AdminView,
+    AdminExportView,
+    BulkTransactionView,
+    CacheStatsView,
+    JournalStatsView)
+from .async_views import AsyncAccountView, AsyncAdminView
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -10,9 +19,18 @@ urlpatterns = [
     path('create-account/', AccountView.as_view(), name='create-account'),
     path('update-account/<str:account_id>/', AccountView.as_view(), name='update-account'),
     path('delete-account/<str:account_id>/', AccountView.as_view(), name='delete-account'),
+    path('bulk-transactions/', BulkTransactionView.as_view(), name='bulk-transactions'),
+    path('account-balance/<str:account_id>/', AccountBalanceView.as_view(), name='account-balance'),
 
     # Admin only view user_transaction
     path('view-user-accounts/<str:user_id>/', AdminView.as_view(), name='view-user-accounts'),
+    path('export-user-transactions/<str:user_id>/', AdminExportView.as_view(), name='export-user-transactions'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('journal-stats/', JournalStatsView.as_view(), name='journal-stats'),
+
+    # async read routes, for the ASGI application
+    path('async/view-account/<str:account_id>/', AsyncAccountView.as_view(), name='async-view-account'),
+    path('async/view-user-accounts/<str:user_id>/', AsyncAdminView.as_view(), name='async-view-user-accounts'),
 
     # register a user
     path('register-user/', UserView.as_view(), name='register-user'),
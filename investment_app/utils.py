@@ -1,35 +1,282 @@
 from .models import InvestmentAccount, Transaction
 from django.shortcuts import get_object_or_404
-from .serializer import TransactionSeializer
+from .serializer import DateSerialializer
 from django.http import HttpRequest
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
+from decimal import Decimal
+from datetime import date, datetime, timezone as dt_timezone
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import csv
+import io
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.serializers import ValidationError
 from .signals import account_changed
-from django.core.cache import cache
+from .metrics import timer
+
+
+MAX_AMOUNT = Decimal('100000000')
+# the largest id of a BigAutoField primary key
+MAX_ACCOUNT_ID = 2 ** 63 - 1
+CENT = Decimal('0.01')
+
+# the columns read for the serialized transactions, see format_transactions
+TRANSACTION_COLUMNS = (
+    'id',
+    'transaction_by_id',
+    'transaction_type',
+    'created_at',
+    'amount',
+    'account_id',
+)
+
+# column name in the export: queryset lookup
+EXPORT_FIELDS = {
+    'id': 'id',
+    'transaction_by_id': 'transaction_by_id',
+    'transaction_type': 'transaction_type',
+    'created_at': 'created_at',
+    'amount': 'amount',
+    'account_id': 'account_id',
+    'account_type': 'account__account_type',
+}
 
 
 def get_transactions(
         account: InvestmentAccount,
-        limit: Optional[int] = None) -> List:
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None) -> List:
     """Retrieve transactions for a specified investment account.
 
+    Transactions are ordered newest first on ``(created_at, id)``, a
+    cursor returns the page after the transaction it was built from, so
+    a page costs an index range scan whatever the length of the history.
+
     Args:
         account (InvestmentAccount): The investment account for
           which to retrieve transactions.
         limit (int, optional): The maximum number of 
             transactions to return. Defaults to None.
+        cursor (str, optional): A cursor from ``get_next_cursor``.
+            Defaults to None, the newest transactions.
 
     Returns:
-        TransactionSerializer or None: A serialized representation
-          of the transactions if found,
+        list or None: The transactions as serialized by
+          ``TransactionSeializer`` if found,
         otherwise None if no transactions exist.
+
+    Raises:
+        ValidationError: If the cursor is invalid.
     """
 
-    transactions = account.transactions.all().order_by('-created_at')
+    rows = list(transactions_page(account, limit, cursor).values_list(
+        *TRANSACTION_COLUMNS))
+    return format_transactions(rows) or None
+
+
+async def aget_transactions(
+        account: InvestmentAccount,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None) -> List:
+    """Async ``get_transactions``, the page is read with the async ORM."""
+    rows = [
+        row async for row in transactions_page(
+            account, limit, cursor).values_list(*TRANSACTION_COLUMNS)]
+    return format_transactions(rows) or None
+
+
+def format_transactions(rows: Iterable[tuple]) -> List[dict]:
+    """Format transactions read as ``TRANSACTION_COLUMNS`` tuples the way
+    ``TransactionSeializer`` does, without building model instances or
+    running the serializer fields row by row.
+
+    Datetimes are in ISO 8601 in the current time zone with ``Z`` for UTC
+    and amounts are strings with 2 decimal places.
+
+    Args:
+        rows (iterable): The values of ``TRANSACTION_COLUMNS``.
+
+    Returns:
+        list: The serialized transactions.
+    """
+    time_zone = timezone.get_current_timezone() if settings.USE_TZ else None
+    with timer('serialize'):
+        return [
+            {
+                'id': transaction_id,
+                'transaction_type': transaction_type,
+                'created_at': _format_datetime(created_at, time_zone),
+                'amount': f'{amount.quantize(CENT):f}',
+                'transaction_by': transaction_by_id,
+                'account': account_id,
+            }
+            for (transaction_id, transaction_by_id, transaction_type,
+                 created_at, amount, account_id) in rows
+        ]
+
+
+def _format_datetime(value: datetime, time_zone) -> str:
+    # DateTimeField.to_representation of DRF
+    if time_zone is not None:
+        value = value.astimezone(time_zone)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, dt_timezone.utc)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def transactions_page(
+        account: InvestmentAccount,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None) -> QuerySet:
+    """Return the queryset of a page of transactions of an account,
+    see ``get_transactions``."""
+    transactions = Transaction.objects.filter(
+        account_id=account.id).order_by('-created_at', '-id')
+    if cursor:
+        created_at, transaction_id = decode_cursor(cursor)
+        transactions = transactions.filter(
+            Q(created_at__lt=created_at) |
+            Q(created_at=created_at, id__lt=transaction_id))
     if limit:
         transactions = transactions[:limit]
+    return transactions
+
+
+def encode_cursor(created_at: str, transaction_id: int) -> str:
+    """Build an opaque pagination cursor for a transaction.
+
+    Args:
+        created_at (str): The serialized creation date of the transaction.
+        transaction_id (int): The id of the transaction.
+
+    Returns:
+        str: A url safe cursor.
+    """
+    value = f'{created_at}|{transaction_id}'.encode()
+    return urlsafe_b64encode(value).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor built by ``encode_cursor``.
+
+    Args:
+        cursor (str): The cursor from the query string.
 
-    return TransactionSeializer(transactions,
-                                many=True).data if transactions else None
+    Returns:
+        tuple: The creation date and the id of the transaction.
+
+    Raises:
+        ValidationError: If the cursor is invalid.
+    """
+    try:
+        created_at, transaction_id = urlsafe_b64decode(
+            cursor.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(cursor)
+        return created_at, int(transaction_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValidationError('Invalid cursor.')
+
+
+def get_next_cursor(transactions: List, page_size: int) -> Optional[str]:
+    """Return the cursor of the page after a full page of transactions.
+
+    Args:
+        transactions (list): The serialized page of transactions.
+        page_size (int): The requested size of the page.
+
+    Returns:
+        str or None: The cursor, None if this is the last page.
+    """
+    if not transactions or len(transactions) < page_size:
+        return None
+    last = transactions[-1]
+    return encode_cursor(last['created_at'], last['id'])
+
+
+def get_filtered_transactions(
+        user_id: int,
+        start_date: date,
+        end_date: Optional[date] = None) -> QuerySet:
+    """Retrieve the transactions of all a user's accounts within a date range.
+
+    Args:
+        user_id (int): The ID of the account owner.
+        start_date (date): The start date for filtering transactions usually today.
+        end_date (date, optional): The end date for filtering transactions. Defaults to None
+                enddate is a date in the past, without it all transactions are returned.
+
+    Returns:
+        QuerySet: The transactions, filtered in the database.
+
+    Raises:
+        ValidationError: If start_date or end_date is not a valid date range.
+    """
+    transactions = Transaction.objects.filter(account__owner_id=user_id)
+    if end_date is None:
+        return transactions
+
+    serializer = DateSerialializer(
+        data={
+            'start_date': start_date,
+            'end_date': end_date})
+    serializer.is_valid(raise_exception=True)
+
+    return transactions.filter(
+        created_at__lte=f'{start_date} 23:59:59',
+        created_at__gte=f'{end_date} 23:59:59',
+    )
+
+
+def stream_transactions(
+        transactions: QuerySet,
+        output: str = 'csv',
+        chunk_size: int = 2000) -> Iterator[str]:
+    """Render transactions as CSV or JSON lines, a chunk at a time.
+
+    Rows are read with a server-side cursor and only one chunk of rows is
+    held in memory, so exporting a ledger uses constant memory whatever
+    its size.
+
+    Args:
+        transactions (QuerySet): The transactions to export.
+        output (str): ``csv`` or ``ndjson``.
+        chunk_size (int): The number of rows fetched and yielded at once.
+
+    Yields:
+        str: Chunks of the rendered file.
+    """
+    rows = transactions.values_list(
+        *EXPORT_FIELDS.values()).order_by('created_at', 'id')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if output == 'csv':
+        writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows.iterator(chunk_size=chunk_size), 1):
+        if output == 'csv':
+            writer.writerow(
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row)
+        else:
+            buffer.write(json.dumps(
+                dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder))
+            buffer.write('\n')
+
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
 
 
 def create_transaction(
@@ -45,8 +292,9 @@ def create_transaction(
     Returns:
         None: This function does not return a value.
     """
-    amount = request.data.get('balance', 0)
-    if amount != 0:
+    # the validated balance, the raw value may be a string
+    amount = instance.balance
+    if amount:
         account_changed.send(
             sender=InvestmentAccount,
             amount=amount,
@@ -55,14 +303,31 @@ def create_transaction(
         )
 
 
-def delete_caches(cache_keys: list) -> None:
-    """
-    Deletes multiple cache entries in a single operation.
+def parse_movement(item: dict) -> Tuple[int, Decimal]:
+    """Validate a raw movement from a bulk settlement file.
 
     Args:
-        cache_keys (list): A list of cache key strings to delete.
+        item (dict): The parsed item with ``account_id`` and ``amount``.
+
+    Returns:
+        tuple: The account id and the amount as a Decimal.
 
-    Example:
-        delete_caches([f'account_id_{account_id}', f'user_id_{instance.owner}'])
+    Raises:
+        ValueError: If the item is malformed.
     """
-    cache.delete_many(cache_keys)
+    if 'error' in item:
+        raise ValueError(item['error'])
+    try:
+        account_id = int(item['account_id'])
+        amount = Decimal(str(item['amount']))
+    except (TypeError, ValueError, ArithmeticError):
+        raise ValueError('A valid account_id and amount are required.')
+
+    if not 0 < account_id <= MAX_ACCOUNT_ID:
+        raise ValueError('No InvestmentAccount matches the given query.')
+    if not amount.is_finite() or amount == 0:
+        raise ValueError('Amount must be a non zero number.')
+    if amount.as_tuple().exponent < -2 or abs(amount) >= MAX_AMOUNT:
+        raise ValueError(
+            'Amount must have at most 8 digits and 2 decimal places.')
+    return account_id, amount
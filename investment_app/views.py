@@ -1,27 +1,78 @@
-from .models import InvestmentAccount, Transaction
-from django.db.models import Prefetch
+from .models import InvestmentAccount, Portfolio, Transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
 from rest_framework.views import APIView
-from .permissions import AccountTypePermission
-from .decorator import handle_exceptions
+from .permissions import (
+    AccountAccess, AccountTypePermission, get_account_access)
+from .decorator import handle_exceptions, idempotent
 from rest_framework.response import Response
-from django.http import HttpRequest
+from django.http import (
+    HttpRequest, HttpResponse, HttpResponseForbidden, StreamingHttpResponse)
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from .serializer import (
     InvestmentAccountSerializer, 
+    JournalEntrySerializer,
     UserSerializer, 
-    DateSerialializer)
+    PaginationSerializer,
+    BalanceQuerySerializer)
 from rest_framework.permissions import (AllowAny, 
                                         IsAuthenticated, 
                                         IsAdminUser)
 from rest_framework import status
 from django.core.exceptions import PermissionDenied
-from .utils import get_transactions, create_transaction, delete_caches
+from .utils import (
+    get_transactions,
+    create_transaction,
+    get_filtered_transactions,
+    get_next_cursor,
+    parse_movement,
+    stream_transactions)
+from .ledger import apply_balance_changes
+from .journal import append_entry, journal_lag
+from .snapshots import balance_at, balance_history, closing_balance
+from .portfolio import BALANCE_FIELDS
+from .parsers import MovementCSVParser, MovementJSONLinesParser
+from .renderers import TRANSACTION_RENDERERS
+from .routers import replica_reads
+from .metrics import CONTENT_TYPE, render_metrics, timer
+from rest_framework.serializers import ValidationError
+from collections import defaultdict
 from django.http import Http404
 from django.contrib.auth.models import User
 from datetime import date
-from typing import Dict
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.core.cache import cache
+from typing import Dict, List, Tuple
+from django.db.models import QuerySet
+from rest_framework import exceptions
+from django.utils import timezone
+from django.db import transaction
+from .authentication import CachedJWTAuthentication
+from .caching import (
+    ACCOUNT_TIMEOUT,
+    USER_TIMEOUT,
+    account_cache_key,
+    bump_versions,
+    cache_set,
+    cache_stats,
+    get_or_set,
+    user_cache_key)
+
+
+DEFAULT_PAGE_SIZE = PaginationSerializer().fields['page_size'].default
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+# the field a journaled update may change
+JOURNALED_FIELDS = {'balance'}
+
+
+def get_account_access_or_404(account_id: str) -> AccountAccess:
+    """Return the ``AccountAccess`` record of an account, or raise Http404."""
+    try:
+        return get_account_access(account_id)
+    except InvestmentAccount.DoesNotExist:
+        raise Http404('No InvestmentAccount matches the given query.')
 
 
 class UserView(APIView):
@@ -52,12 +103,21 @@ class UserView(APIView):
 
 class AccountView(APIView):
     permission_classes = [AccountTypePermission, IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
+    renderer_classes = TRANSACTION_RENDERERS
 
     @handle_exceptions
     def get(self, request: HttpRequest, account_id: str) -> Response:
         """
         Handles GET requests for retrieving an investment account by its ID.
+
+        Transactions are paginated newest first, ``page_size`` sets the
+        number of transactions and ``cursor`` is the ``next_cursor`` of
+        the previous page. Pages are cached under the account's cache
+        version which is bumped whenever the account or its transactions
+        change, and kept for a few seconds in the memory of the process.
+        A miss is read from the read replica when one is configured.
+
         Args:
             request (HttpRequest): The HTTP request object containing 
                     the request data.
@@ -66,21 +126,28 @@ class AccountView(APIView):
         Returns:
             Response: A Response object containing the serialized account data.
         """
-        cache_key = f'account_id_{account_id}'
-        account = self._check_account_permission(request, account_id)
-
-        if cached_data := cache.get(cache_key):
-            results = cached_data
-        else:
-            transactions = get_transactions(account)
-            results = {
-                'account': InvestmentAccountSerializer(account).data,
-                'transcations': transactions or []
-            }
-            cache.set(cache_key, results, timeout=5 * 60 * 60)
+        pagination = PaginationSerializer(data=request.query_params)
+        pagination.is_valid(raise_exception=True)
+        page_size = pagination.validated_data['page_size']
+        cursor = pagination.validated_data.get('cursor')
+
+        access = self._check_account_permission(request, account_id)
+
+        # the key is versioned before reading the data so that data read
+        # before a change is never cached under the version after it,
+        # the account is only loaded on a miss
+        def build_page():
+            with replica_reads('account', access.id):
+                return self.get_account_page(
+                    self._get_account(access.id), page_size, cursor)
+
+        cache_key = account_cache_key(access.id, page_size, cursor)
+        results = get_or_set(
+            cache_key, build_page, ACCOUNT_TIMEOUT, local=True)
         return Response(results)
 
     @handle_exceptions
+    @idempotent
     def post(self, request: HttpRequest) -> Response:
         """
         Creates a new investment account based on the provided data.
@@ -104,14 +171,27 @@ class AccountView(APIView):
             return Response(
                 serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST)
-        instance = serializer.save(owner=request.user)
-        create_transaction(request, instance)
+        # the account, its opening transaction and the owner's
+        # portfolio are committed together
+        with transaction.atomic():
+            instance = serializer.save(owner=request.user)
+            create_transaction(request, instance)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @handle_exceptions
+    @idempotent
     def put(self, request: HttpRequest, account_id: str) -> Response:
         """
         Updates a specified account with new data after verifying permissions.
+
+        With a ``Prefer: respond-async`` header the balance movement is
+        journaled instead: it is appended to the journal, withdrawals are
+        reserved against the available balance, and the response is a 202
+        with the journal entry. The ``apply_journal`` command applies it.
+        Journaled updates need an ``Idempotency-Key`` header, a retry with
+        the same key returns the entry of the first attempt and is
+        journaled once.
+
         Args:
             request (HttpRequest): The HTTP request object 
                     containing the new data
@@ -129,14 +209,22 @@ class AccountView(APIView):
             NotFoundError: If the account with the specified ID does not exist.
         """
 
-        account = self._check_account_permission(request, account_id)
+        access = self._check_account_permission(request, account_id)
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            return self._journal_update(request, access)
+        account = self._get_account(access.id)
         serializer = InvestmentAccountSerializer(
-            account, data=request.data, partial=True)
+            account, data=request.data, partial=True,
+            context={'request': request})
         if serializer.is_valid():
             instance = serializer.save()
-            create_transaction(request, instance)
-            delete_caches(
-                [f'account_id_{account_id}', f'user_id_{instance.owner}'])
+            # write the new first page through so the next read is a hit,
+            # once committed under the new version
+            transaction.on_commit(lambda: cache_set(
+                account_cache_key(instance.id, DEFAULT_PAGE_SIZE),
+                self.get_account_page(instance, DEFAULT_PAGE_SIZE),
+                ACCOUNT_TIMEOUT,
+                local=True))
             return Response(serializer.data, 200)
         return Response(serializer.errors, 400)
 
@@ -161,47 +249,245 @@ class AccountView(APIView):
             NotFoundError: If the account with the specified ID does not exist.
         """
 
-        account = self._check_account_permission(request, account_id)
-        account.delete()
+        access = self._check_account_permission(request, account_id)
+        self._get_account(access.id).delete()
         return Response('Sucessfully deleted')
 
+    def get_account_page(
+            self,
+            account: InvestmentAccount,
+            page_size: int,
+            cursor: str = None) -> Dict:
+        """
+        Builds the account view: the account and a page of its transactions.
+
+        Args:
+            account (InvestmentAccount): The account to show.
+            page_size (int): The number of transactions of the page.
+            cursor (str, optional): The cursor of the page, None for the first.
+
+        Returns:
+            dict: The serialized account, transactions and next cursor.
+        """
+        transactions = get_transactions(account, page_size, cursor)
+        with timer('serialize'):
+            account_data = InvestmentAccountSerializer(account).data
+        return {
+            'account': account_data,
+            'transcations': transactions or [],
+            'next_cursor': get_next_cursor(transactions, page_size)
+        }
+
+    def _journal_update(
+            self,
+            request: HttpRequest,
+            access: AccountAccess) -> Response:
+        """
+        Journals the balance movement of an update.
+
+        Args:
+            request (HttpRequest): The HTTP request object containing
+                the movement.
+            access (AccountAccess): The checked account.
+
+        Returns:
+            Response: The journal entry, with status 202.
+
+        Raises:
+            ValidationError: If the Idempotency-Key is missing, the
+                movement is invalid or the withdrawal exceeds the available
+                balance.
+        """
+        # checked by the idempotent decorator
+        request_id = request.headers.get('Idempotency-Key')
+        if not request_id:
+            raise ValidationError(
+                'Idempotency-Key is required for a journaled update.')
+        if set(request.data) - JOURNALED_FIELDS:
+            raise ValidationError('Only the balance can be journaled.')
+
+        serializer = InvestmentAccountSerializer(
+            data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        amount = serializer.validated_data.get('balance')
+        if not amount:
+            raise ValidationError('A journaled update needs a balance.')
+
+        entry, _ = append_entry(access, amount, request.user, request_id)
+        return Response(
+            JournalEntrySerializer(entry).data,
+            status=status.HTTP_202_ACCEPTED)
+
     def _check_account_permission(
             self,
             request: HttpRequest,
-            account_id: str) -> InvestmentAccount:
+            account_id: str) -> AccountAccess:
         """
         Checks if the user has permission to access a specific investment account.
 
+        The permissions are checked on the cached ``AccountAccess`` record
+        of the account, a denied request costs at most one indexed query.
+        Nothing else is loaded, the views load the account when they need
+        it and never its transaction history.
+
         Args:
             request (HttpRequest): The HTTP request object containing the request data.
             account_id (str): The ID of the investment account to check permissions for.
 
         Returns:
-            InvestmentAccount: The investment account object if permissions are granted.
+            AccountAccess: The ID, type and owner of the account if permissions are granted.
 
         Raises:
-            Http404: If the investment account does not exist or the user lacks permissions.
+            Http404: If the investment account does not exist.
+            PermissionDenied: If the user lacks permissions.
         """
         try:
-            user = request.user
-            account = get_object_or_404(
-                InvestmentAccount.objects.prefetch_related('transactions'),
-                id=account_id)
-            self.check_object_permissions(request, account)
-            return account
+            access = get_account_access_or_404(account_id)
+            self.check_object_permissions(request, access)
+            return access
         except Http404 as error:
             raise Http404(error)
         except Exception as error:
             raise PermissionDenied(error) from error
 
+    def _get_account(self, account_id: int) -> InvestmentAccount:
+        """Load an account whose permissions were checked."""
+        return get_object_or_404(InvestmentAccount, id=account_id)
+
+
+class BulkTransactionView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    parser_classes = [MovementCSVParser, MovementJSONLinesParser]
+
+    @handle_exceptions
+    def post(self, request: HttpRequest) -> Response:
+        """
+        Applies a settlement file of deposits and withdrawals.
+
+        The body is a CSV (``text/csv``) or JSON-lines
+        (``application/x-ndjson``) stream of ``account_id, amount`` items.
+        Items are grouped per account, each account is checked once for
+        its owner and the PUT permission of its type and its movements
+        are applied together, all or nothing for that account.
+
+        Args:
+            request (HttpRequest): The HTTP request object containing
+                the settlement file.
+
+        Returns:
+            Response: The number of applied and rejected items and
+                a result for every item.
+        """
+        results = []
+        movements = defaultdict(list)
+
+        for item in request.data:
+            result = {
+                'line': item['line'],
+                'account_id': item.get('account_id'),
+                'amount': item.get('amount'),
+            }
+            results.append(result)
+            try:
+                account_id, amount = parse_movement(item)
+            except ValueError as error:
+                result.update(status='rejected', error=str(error))
+                continue
+            result.update(account_id=account_id, amount=amount)
+            movements[account_id].append(result)
+
+        accounts = InvestmentAccount.objects.only(
+            'id', 'account_type', 'owner_id').in_bulk(list(movements))
+        permission = AccountTypePermission()
+        changed = {}
+
+        for account_id, items in movements.items():
+            account = accounts.get(account_id)
+            error = None
+            if account is None:
+                error = 'No InvestmentAccount matches the given query.'
+            elif not permission.is_method_allowed(
+                    request.user, account, 'PUT'):
+                error = 'You do not have permission to perform this action.'
+            else:
+                try:
+                    apply_balance_changes(
+                        account, [item['amount'] for item in items],
+                        request.user)
+                    changed[account_id] = account.owner_id
+                except ValidationError as validation_error:
+                    error = validation_error.detail[0]
+
+            for item in items:
+                item['amount'] = str(item['amount'])
+                item.update(
+                    status='rejected' if error else 'applied', error=error)
+
+        # the movements are inserted without signals
+        bump_versions(changed.keys(), changed.values())
+        rejected = sum(result['status'] == 'rejected' for result in results)
+        return Response({
+            'applied': len(results) - rejected,
+            'rejected': rejected,
+            'results': results,
+        })
+
+
+class AccountBalanceView(APIView):
+    permission_classes = [AccountTypePermission, IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+
+    @handle_exceptions
+    def get(self, request: HttpRequest, account_id: str) -> Response:
+        """Return the balance of an account in the past.
+
+        ``date`` returns the balance at the end of a day, today by default,
+        ``at`` the balance at a moment. ``since`` adds the daily balances
+        from that day to ``date``. Balances are read from the daily
+        snapshots, never by replaying the whole history.
+
+        Args:
+            request (HttpRequest): The HTTP request containing the query parameters.
+            account_id (str): The ID of the account.
+
+        Returns:
+            Response: The balance, and the daily balances with ``since``.
+        """
+        query = BalanceQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        day = query.validated_data.get('date') or timezone.localdate()
+        at = query.validated_data.get('at')
+        since = query.validated_data.get('since')
+
+        account = get_account_access_or_404(account_id)
+        try:
+            self.check_object_permissions(request, account)
+        except exceptions.PermissionDenied as error:
+            raise PermissionDenied(error) from error
+
+        if at:
+            results = {'account': account.id, 'at': at,
+                       'balance': balance_at(account.id, at)}
+        else:
+            results = {'account': account.id, 'date': day,
+                       'balance': closing_balance(account.id, day)}
+        if since:
+            results.update(balance_history(account.id, since, day))
+        return Response(results)
+
 
 class AdminView(APIView):
     permission_classes = [IsAdminUser, IsAuthenticated]
+    renderer_classes = TRANSACTION_RENDERERS
 
     @handle_exceptions
     def get(self, request: HttpRequest, user_id: str) -> Response:
         """Handle GET requests to retrieve user transaction data within a date range.
 
+        ``group_by=day`` adds the total and count of the transactions
+        per day and account type, computed in the database.
+
         Args:
             request (HttpRequest): The HTTP request containing query parameters for date filtering.
             user_id (str): The ID of the user whose transactions are to be retrieved.
@@ -212,84 +498,196 @@ class AdminView(APIView):
         today = date.today()
         start_date = request.query_params.get('start_date') or today
         end_date = request.query_params.get('end_date')
-
-        cache_key = f'user_id_{user_id}'
-        cache_data = cache.get(cache_key)
-
-        if not end_date and cache_data:
-            results = cache_data
-
+        group_by = request.query_params.get('group_by')
+        if group_by not in (None, 'day'):
+            raise ValidationError('group_by must be day.')
+
+        def build_report():
+            with replica_reads('user', user_id):
+                user = get_object_or_404(
+                    User.objects.only('id', 'username'), id=user_id)
+                return self.get_user_transactions(
+                    user, start_date, end_date, group_by)
+
+        if end_date or group_by:
+            results = build_report()
         else:
-            user = self.get_filtered_user(user_id, start_date, end_date)
-            results = self.get_user_transactions(user, start_date, end_date)
+            # kept in memory too, a hit then skips decoding the report
+            results = get_or_set(
+                user_cache_key(user_id, start_date), build_report,
+                USER_TIMEOUT, local=True)
 
         return Response(results, 200)
 
     def get_user_transactions(
-            self, user: User, start_date: date, end_date: date = None) -> Dict[str, str]:
+            self,
+            user: User,
+            start_date: date,
+            end_date: date = None,
+            group_by: str = None) -> Dict[str, str]:
         """Retrieve a summary of a user's transactions and total balance.
 
+        The report costs the same number of queries whatever the number
+        of accounts: one row of the portfolio for the balances, one joined
+        query for the transactions and, with ``group_by``, one for the
+        daily totals.
+
         Args:
             user (User): The user for whom to retrieve transaction data.
+            start_date (date): The start date for filtering transactions usually today.
+            end_date (date, optional): The end date for filtering transactions.
+            group_by (str, optional): ``day`` to add the daily totals.
 
         Returns:
-            dict: A dictionary containing the username, total balance, and a list of transactions.
+            dict: A dictionary containing the username, the balances and
+                account count of the user's portfolio, and a list of transactions.
         """
+        portfolio, rows, daily_totals = self.report_querysets(
+            user, start_date, end_date, group_by)
+        return self.build_report(
+            user, portfolio.first() or Portfolio(), list(rows),
+            start_date, end_date,
+            list(daily_totals) if group_by else None)
+
+    @staticmethod
+    def report_querysets(
+            user: User,
+            start_date: date,
+            end_date: date = None,
+            group_by: str = None) -> Tuple[QuerySet, QuerySet, QuerySet]:
+        """Return the querysets of the portfolio, the transactions and the
+        daily totals of the report, None for the totals without group_by."""
+        transactions = get_filtered_transactions(user.id, start_date, end_date)
+        rows = transactions.values(
+            'id',
+            'transaction_by_id',
+            'transaction_type',
+            'created_at',
+            'amount',
+            'account_id',
+            account_type=F('account__account_type'),
+        ).order_by('account_id', 'id')
+
+        daily_totals = None
+        if group_by:
+            daily_totals = transactions.values(
+                day=TruncDate('created_at'),
+                account_type=F('account__account_type'),
+            ).annotate(
+                total=Sum('amount'),
+                count=Count('id'),
+            ).order_by('day', 'account_type')
+
+        return Portfolio.objects.filter(owner=user), rows, daily_totals
+
+    @staticmethod
+    def build_report(
+            user: User,
+            portfolio: Portfolio,
+            rows: List[Dict],
+            start_date: date,
+            end_date: date = None,
+            daily_totals: List[Dict] = None) -> Dict:
+        """Assemble the report from the evaluated querysets."""
+        with timer('serialize'):
+            results = {
+                'Username': user.username,
+                'total_balance': portfolio.total_balance,
+                'balance_by_type': {
+                    account_type: getattr(portfolio, field)
+                    for account_type, field in BALANCE_FIELDS.items()},
+                'account_count': portfolio.account_count,
+                'last_activity': portfolio.last_activity,
+                'transactions': rows,
+                'From': start_date,
+                'To': end_date or "All Transactions"
+            }
+            if daily_totals is not None:
+                results['daily_totals'] = daily_totals
+            return results
 
-        results = {
-            'Username': user.username,
-            'total_balance': 0,
-            'transactions': [],
-            'From': start_date,
-            'To': end_date or "All Transactions"
-        }
-        for account in user.accounts.all():
-            results['total_balance'] += account.balance
-            transactions = account.transactions.values()
-            for transaction in transactions:
-                transaction['account_type'] = account.account_type
-            results['transactions'].extend(transactions)
 
-        if not end_date:
-            cache_key = f'user_id_{user.id}'
-            cache.set(cache_key, results, timeout=2 * 60 * 60)
+class AdminExportView(APIView):
+    permission_classes = [IsAdminUser, IsAuthenticated]
 
-        return results
+    @handle_exceptions
+    def get(self, request: HttpRequest, user_id: str) -> StreamingHttpResponse:
+        """Stream a user's transaction ledger as CSV or JSON lines.
 
-    def get_filtered_user(
-            self,
-            user_id: str,
-            start_date: date,
-            end_date: date = None) -> User:
-        """Retrieve a user and their associated transactions within a specified date range.
+        The same ``start_date`` and ``end_date`` filters as ``AdminView``
+        apply, ``output`` is ``csv`` (default) or ``ndjson``. Nothing is
+        cached and the ledger is never held in memory.
 
         Args:
-            user_id (str): The ID of the user to retrieve.
-            start_date (date): The start date for filtering transactions usually today.
-            end_date (date, optional): The end date for filtering transactions. Defaults to None
-                    enddate is a date in the past.
+            request (HttpRequest): The HTTP request containing query parameters for date filtering.
+            user_id (str): The ID of the user whose transactions are exported.
 
         Returns:
-            User: The user instance with preloaded transactions.
+            StreamingHttpResponse: The ledger file.
+        """
+        start_date = request.query_params.get('start_date') or date.today()
+        end_date = request.query_params.get('end_date')
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_CONTENT_TYPES:
+            raise ValidationError('output must be csv or ndjson.')
 
-        Raises:
-            ValueError: If start_date or end_date is not a date object.
+        user = get_object_or_404(User.objects.only('id'), id=user_id)
+        transactions = get_filtered_transactions(user.id, start_date, end_date)
+
+        response = StreamingHttpResponse(
+            stream_transactions(transactions, output),
+            content_type=EXPORT_CONTENT_TYPES[output])
+        response['Content-Disposition'] = (
+            f'attachment; filename="user_{user.id}_transactions.{output}"')
+        return response
+
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @handle_exceptions
+    def get(self, request: HttpRequest) -> Response:
+        """Return the hit, miss and eviction counters of the cache tiers.
+
+        ``local`` is the in-memory cache of the process serving the
+        request, ``shared`` is Redis.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+
+        Returns:
+            Response: The counters of each tier.
         """
+        return Response(cache_stats())
 
-        if end_date is None:
-            transactions = Transaction.objects.all()
-        else:
-            serializer = DateSerialializer(
-                data={
-                    'start_date': start_date,
-                    'end_date': end_date})
-            serializer.is_valid(raise_exception=True)
-
-            transactions = Transaction.objects.filter(
-                created_at__lte=f'{start_date} 23:59:59',
-                created_at__gte=f'{end_date} 23:59:59',
-            )
-
-        queryset = User.objects.prefetch_related(
-            Prefetch('accounts__transactions', queryset=transactions))
-        return get_object_or_404(queryset, id=user_id)
+
+class JournalStatsView(APIView):
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @handle_exceptions
+    def get(self, request: HttpRequest) -> Response:
+        """Return how far the balances are behind the journal.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+
+        Returns:
+            Response: The pending and rejected entries of the journal.
+        """
+        return Response(journal_lag())
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Export the request metrics of this process for Prometheus.
+
+    Only the addresses in ``METRICS_ALLOWED_IPS`` may read them.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: The metrics in the Prometheus text format.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)